@@ -9,6 +9,7 @@ from typing import Any, List, Type
 from pythonjsonlogger import jsonlogger  # type: ignore
 
 from chouette_iot import Scheduler, ChouetteConfig, Cancellable
+from chouette_iot._runtime import AsyncioRuntime
 from chouette_iot._singleton_actor import SingletonActor
 from chouette_iot.logs import LogsSender
 from chouette_iot.metrics import MetricsCollector, MetricsAggregator, MetricsSender
@@ -39,22 +40,35 @@ class Chouette:
 
     @staticmethod
     def schedule_call(
-        interval: float, actor_class: Type[SingletonActor], message: Any
+        interval: float,
+        actor_class: Type[SingletonActor],
+        message: Any,
+        send_self_metrics: bool = False,
     ) -> Cancellable:
         """
         Uses chouette-iot.Scheduler to periodically send a message to an actor of
         a specified class at some fixed rate.
 
+        Messages are sent as coalesced ticks, so if an actor is still busy
+        with the previous message, the tick is skipped instead of queued.
+
         Args:
             interval: How often a message must be sent to an actor.
             actor_class: Class of a SingleActor child class to start.
             message: Message to send.
+            send_self_metrics: Whether skipped ticks should be sent as
+                               self metrics.
         Returns: Cancellable object.
         """
         actor_ref = actor_class.get_instance()
         initial_delay = interval - (time.time() % interval)
         timer = Scheduler.schedule_at_fixed_rate(
-            initial_delay, interval, actor_ref.tell, message
+            initial_delay,
+            interval,
+            actor_class.tick,
+            actor_ref,
+            message,
+            send_self_metrics,
         )
         return timer
 
@@ -68,22 +82,44 @@ class Chouette:
         If COLLECTOR_PLUGINS environment variable is set, it also starts a
         Collector plugin.
 
+        If RUNTIME environment variable is 'asyncio', all the actors are run
+        on a single event loop instead of a thread per actor.
+
         Returns: List of Cancellables.
         """
         timers = []
         config = ChouetteConfig()
         cls.setup_logging(config.log_level)
         logger.info("Starting Chouette-IoT.")
+        if config.runtime == "asyncio" and not AsyncioRuntime.is_supported():
+            logger.warning("Runtime 'asyncio' requires pykka 4. Using a threading one.")
+        elif config.runtime == "asyncio":
+            SingletonActor.runtime = AsyncioRuntime(config.runtime_workers)
+        elif config.runtime != "threading":
+            logger.warning(
+                "Unknown runtime '%s'. Using a threading one.", config.runtime
+            )
         # Sender actors:
-        timers.append(cls.schedule_call(config.release_interval, MetricsSender, "send"))
-        timers.append(cls.schedule_call(config.release_interval, LogsSender, "send"))
+        self_metrics = config.send_self_metrics
+        timers.append(
+            cls.schedule_call(
+                config.release_interval, MetricsSender, "send", self_metrics
+            )
+        )
+        timers.append(
+            cls.schedule_call(config.release_interval, LogsSender, "send", self_metrics)
+        )
         # Aggregator actor:
         timers.append(
-            cls.schedule_call(config.aggregate_interval, MetricsAggregator, "aggregate")
+            cls.schedule_call(
+                config.aggregate_interval, MetricsAggregator, "aggregate", self_metrics
+            )
         )
         # Collector actor:
         if config.collector_plugins:
             timers.append(
-                cls.schedule_call(config.capture_interval, MetricsCollector, "collect")
+                cls.schedule_call(
+                    config.capture_interval, MetricsCollector, "collect", self_metrics
+                )
             )
         return timers
@@ -0,0 +1,209 @@
+"""
+Payload compressors.
+"""
+# pylint: disable=too-few-public-methods
+import logging
+import threading
+import zlib
+from typing import Any, Dict, Optional, Type
+
+try:
+    import zstandard  # type: ignore
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+__all__ = [
+    "CompressionTuner",
+    "Compressor",
+    "CompressorsFactory",
+    "DeflateCompressor",
+    "GzipCompressor",
+    "ZstdCompressor",
+]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class Compressor:
+    """
+    Compressor creates compression objects for payloads of a specific
+    HTTP Content-Encoding.
+
+    Every compression object must have `compress(data)` and `flush()`
+    methods like a `zlib.compressobj` has.
+    """
+
+    encoding = ""
+    # The fastest level and the level with the best ratio that is still
+    # fast enough for small devices.
+    fast_level = 1
+    best_level = 9
+
+    def compressobj(self, level: Optional[int] = None) -> Any:
+        """
+        Compression object creation must be implemented individually.
+
+        Args:
+            level: Compression level or None for a default level.
+        Returns: Compression object.
+        """
+        raise NotImplementedError(
+            "Use concrete Compressor implementation."
+        )  # pragma: no cover
+
+
+class DeflateCompressor(Compressor):
+    """
+    DeflateCompressor compresses payloads to a zlib format.
+    """
+
+    encoding = "deflate"
+
+    def compressobj(self, level: Optional[int] = None) -> Any:
+        """
+        Args:
+            level: Compression level from 1 to 9 or None for a default level.
+        Returns: zlib compression object.
+        """
+        return zlib.compressobj(-1 if level is None else level)
+
+
+class GzipCompressor(Compressor):
+    """
+    GzipCompressor compresses payloads to a gzip format.
+    """
+
+    encoding = "gzip"
+
+    def compressobj(self, level: Optional[int] = None) -> Any:
+        """
+        Args:
+            level: Compression level from 1 to 9 or None for a default level.
+        Returns: zlib compression object that writes a gzip header.
+        """
+        level = -1 if level is None else level
+        return zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+
+class ZstdCompressor(Compressor):
+    """
+    ZstdCompressor compresses payloads to a Zstandard format.
+
+    It gives better ratios than deflate at the same speed, but it requires
+    an optional `zstandard` package and an endpoint that accepts it.
+    """
+
+    encoding = "zstd"
+    best_level = 12
+
+    def __init__(self):
+        if zstandard is None:
+            raise ImportError("Zstandard compressor requires a 'zstandard' package.")
+
+    def compressobj(self, level: Optional[int] = None) -> Any:
+        """
+        Args:
+            level: Compression level from 1 to 22 or None for a default level.
+        Returns: zstandard compression object.
+        """
+        level = 3 if level is None else level
+        return zstandard.ZstdCompressor(level=level).compressobj()
+
+
+class CompressionTuner:
+    """
+    CompressionTuner picks a compression level for the next payloads.
+
+    While there is a backlog bigger than a bulk, data must be dispatched
+    fast, so the fastest level is used. Otherwise the level with the best
+    ratio is used, unless observed ratios show that it's less than 10%
+    better than the fastest one: then it's not worth its CPU time.
+
+    Data can change, so every PROBE_INTERVAL-th pick without a backlog
+    returns the level that isn't used at the moment to measure it again.
+
+    Ratios are observed by threads that dispatch payloads, so they are
+    guarded by a lock.
+    """
+
+    PROBE_INTERVAL = 10
+
+    def __init__(self, compressor: Compressor):
+        """
+        Args:
+            compressor: Compressor which levels are picked.
+        """
+        self.compressor = compressor
+        self.lock = threading.Lock()
+        self.picks = 0
+        self.ratios: Dict[int, float] = {}
+
+    def observe(self, level: int, ratio: float) -> None:
+        """
+        Updates an average ratio of a compression level.
+
+        Args:
+            level: Compression level of a payload.
+            ratio: Ratio of uncompressed and compressed payload sizes.
+        """
+        with self.lock:
+            previous = self.ratios.get(level, ratio)
+            self.ratios[level] = previous * 0.8 + ratio * 0.2
+
+    def pick(self, backlog: int, bulk_size: int) -> int:
+        """
+        Args:
+            backlog: Number of records in a queue.
+            bulk_size: Number of records in a bulk.
+        Returns: Compression level for the next payloads.
+        """
+        fast_level = self.compressor.fast_level
+        best_level = self.compressor.best_level
+        if backlog > bulk_size:
+            return fast_level
+        with self.lock:
+            fast_ratio = self.ratios.get(fast_level)
+            best_ratio = self.ratios.get(best_level)
+            self.picks += 1
+            probe = self.picks % self.PROBE_INTERVAL == 0
+        if fast_ratio and best_ratio and best_ratio < fast_ratio * 1.1:
+            return best_level if probe else fast_level
+        return fast_level if probe else best_level
+
+
+class CompressorsFactory:
+    """
+    CompressorsFactory creates payload compressors by their names.
+    """
+
+    compressor_classes: Dict[str, Type[Compressor]] = {
+        "deflate": DeflateCompressor,
+        "gzip": GzipCompressor,
+        "zstd": ZstdCompressor,
+    }
+
+    @classmethod
+    def get_compressor(cls, compressor_name: str) -> Compressor:
+        """
+        Takes a compressor name and returns a compressor instance.
+
+        Default compressor is DeflateCompressor. It's also used if
+        a compressor can't be created, e.g. its package is not installed.
+
+        Args:
+            compressor_name: Name of a compressor as a string.
+        Returns: Compressor instance.
+        """
+        compressor_class = cls.compressor_classes.get(
+            compressor_name.lower(), DeflateCompressor
+        )
+        try:
+            return compressor_class()
+        except ImportError as error:
+            logger.warning(
+                "[CompressorsFactory] Could not create '%s' compressor "
+                "due to: '%s'. Using deflate.",
+                compressor_name,
+                error,
+            )
+            return DeflateCompressor()
@@ -0,0 +1,214 @@
+"""
+Outbox of compressed payloads that weren't dispatched.
+"""
+import itertools
+import logging
+import os
+import time
+from typing import Iterable, List, Optional
+
+__all__ = ["Outbox"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class Outbox:
+    """
+    Outbox is a directory of compressed payloads that are ready to be sent.
+
+    Every payload is a file named by a time it was written in nanoseconds,
+    a timestamp of its oldest record and its Content-Encoding, so sorted
+    file names give payloads in FIFO order. Payloads are written
+    to temporary files first and renamed when they are complete, so an
+    outbox never contains a partially written payload.
+
+    Total size of an outbox is capped: when it's exceeded, the oldest
+    payloads are evicted. Payloads are also evicted when their oldest
+    records get outdated.
+    """
+
+    DEFAULT_ENCODING = "deflate"
+    SUFFIX = ".payload"
+
+    def __init__(self, path: str, max_size: int):
+        """
+        Args:
+            path: Outbox directory. It's created if it doesn't exist.
+            max_size: Maximum total size of payloads in bytes.
+        """
+        os.makedirs(path, exist_ok=True)
+        self.counter = itertools.count()
+        self.max_size = max_size
+        self.name = "Outbox"
+        self.path = path
+
+    def put(
+        self,
+        payload: Iterable[bytes],
+        encoding: str = DEFAULT_ENCODING,
+        oldest: Optional[float] = None,
+    ) -> bool:
+        """
+        Writes a payload to an outbox and evicts the oldest payloads if
+        the outbox is too big.
+
+        Args:
+            payload: Compressed payload as an iterable of chunks.
+            encoding: Content-Encoding of a payload.
+            oldest: Timestamp of the oldest payload record. By default
+                    it's a time a payload is written.
+        Returns: Whether a payload was written successfully.
+        """
+        written = int(time.time() * 10 ** 9)
+        if oldest is None:
+            oldest = written / 1_000_000_000
+        file_name = (
+            f"{written:020d}-{next(self.counter):06d}-{int(oldest):010d}"
+            f".{encoding}{self.SUFFIX}"
+        )
+        file_path = os.path.join(self.path, file_name)
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(tmp_path, "wb") as payload_file:
+                for chunk in payload:
+                    payload_file.write(chunk)
+                payload_file.flush()
+                os.fsync(payload_file.fileno())
+            os.replace(tmp_path, file_path)
+        except OSError as error:
+            logger.warning(
+                "[%s] Could not write a payload to '%s' due to: '%s'.",
+                self.name,
+                self.path,
+                error,
+            )
+            self._remove(tmp_path)
+            return False
+        self.evict_oversize()
+        return True
+
+    def payloads(self) -> List[str]:
+        """
+        Returns: Paths of payload files from the oldest to the newest.
+        """
+        try:
+            file_names = os.listdir(self.path)
+        except OSError:
+            return []
+        return [
+            os.path.join(self.path, file_name)
+            for file_name in sorted(file_names)
+            if file_name.endswith(self.SUFFIX)
+        ]
+
+    def get_encoding(self, file_path: str) -> str:
+        """
+        Args:
+            file_path: Path of a payload file.
+        Returns: Content-Encoding of a payload.
+        """
+        file_name = os.path.basename(file_path)[: -len(self.SUFFIX)]
+        _, _, encoding = file_name.partition(".")
+        return encoding or self.DEFAULT_ENCODING
+
+    def get_oldest_timestamp(self, file_path: str) -> float:
+        """
+        Args:
+            file_path: Path of a payload file.
+        Returns: Timestamp of the oldest payload record. For payloads that
+                 were written without it, it's a time they were written.
+                 Payloads with unexpected names are considered outdated.
+        """
+        file_name = os.path.basename(file_path)[: -len(self.SUFFIX)]
+        name_parts = file_name.partition(".")[0].split("-")
+        try:
+            if len(name_parts) > 2:
+                return float(name_parts[2])
+            return int(name_parts[0]) / 1_000_000_000
+        except ValueError:
+            return 0.0
+
+    def remove(self, file_path: str) -> None:
+        """
+        Removes a payload that was dispatched.
+
+        Args:
+            file_path: Path of a payload file.
+        """
+        self._remove(file_path)
+
+    def evict_outdated(self, ttl: int) -> int:
+        """
+        Removes payloads which oldest records are older than `ttl` seconds.
+
+        Args:
+            ttl: Maximum records lifetime in seconds.
+        Returns: Number of removed payloads.
+        """
+        threshold = time.time() - ttl
+        outdated = [
+            file_path
+            for file_path in self.payloads()
+            if self.get_oldest_timestamp(file_path) <= threshold
+        ]
+        for file_path in outdated:
+            self._remove(file_path)
+        if outdated:
+            logger.info(
+                "[%s] Evicted %s outdated payloads from '%s'.",
+                self.name,
+                len(outdated),
+                self.path,
+            )
+        return len(outdated)
+
+    def evict_oversize(self) -> int:
+        """
+        Removes the oldest payloads while an outbox exceeds its size.
+
+        Returns: Number of removed payloads.
+        """
+        payloads = self.payloads()
+        sizes = [self._get_size(file_path) for file_path in payloads]
+        total_size = sum(sizes)
+        evicted = 0
+        for file_path, size in zip(payloads, sizes):
+            if total_size <= self.max_size:
+                break
+            self._remove(file_path)
+            total_size -= size
+            evicted += 1
+        if evicted:
+            logger.warning(
+                "[%s] Evicted %s oldest payloads from '%s' to fit %s bytes.",
+                self.name,
+                evicted,
+                self.path,
+                self.max_size,
+            )
+        return evicted
+
+    @staticmethod
+    def _get_size(file_path: str) -> int:
+        """
+        Args:
+            file_path: Path of a payload file.
+        Returns: Size of a file or 0 if it doesn't exist.
+        """
+        try:
+            return os.path.getsize(file_path)
+        except OSError:
+            return 0
+
+    @staticmethod
+    def _remove(file_path: str) -> None:
+        """
+        Removes a file if it exists.
+
+        Args:
+            file_path: Path of a file.
+        """
+        try:
+            os.remove(file_path)
+        except OSError:
+            pass
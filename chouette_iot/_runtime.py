@@ -0,0 +1,233 @@
+"""
+chouette.AsyncioRuntime object that hosts actors on an asyncio event loop
+"""
+import asyncio
+import logging
+import sys
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, Thread
+from typing import Any, Deque, Optional
+
+from pykka import ActorRegistry  # type: ignore
+
+try:
+    from importlib import metadata
+except ImportError:
+    metadata = None  # type: ignore
+
+__all__ = ["AsyncioRuntime", "LoopInbox"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class LoopInbox:
+    """
+    Actor inbox that wakes up an actor task of an asyncio event loop.
+
+    Messages can be put to it from any thread, like to a `queue.Queue`
+    inbox of a pykka ThreadingActor, but only the loop waits for them.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop):
+        """
+        Args:
+            loop: Event loop of an actor task.
+        """
+        self.loop = loop
+        self.messages: Deque[Any] = deque()
+        self.waiter: Optional[asyncio.Future] = None
+
+    def put(self, envelope: Any) -> None:
+        """
+        Puts an envelope to an inbox and wakes up an actor task.
+
+        Args:
+            envelope: pykka Envelope with a message.
+        """
+        self.messages.append(envelope)
+        self.loop.call_soon_threadsafe(self._wake_up)
+
+    def get(self) -> Any:
+        """
+        Returns: The oldest envelope. An inbox must not be empty.
+        """
+        return self.messages.popleft()
+
+    def empty(self) -> bool:
+        """
+        Returns: Whether there are no envelopes in an inbox.
+        """
+        return not self.messages
+
+    def qsize(self) -> int:
+        """
+        Returns: Number of envelopes in an inbox.
+        """
+        return len(self.messages)
+
+    async def wait(self) -> None:
+        """
+        Waits until an inbox has an envelope.
+        """
+        while not self.messages:
+            self.waiter = self.loop.create_future()
+            await self.waiter
+        self.waiter = None
+
+    def _wake_up(self) -> None:
+        """
+        Wakes up a waiting actor task. Executed by an event loop.
+        """
+        if self.waiter is not None and not self.waiter.done():
+            self.waiter.set_result(None)
+
+
+class AsyncioRuntime:
+    """
+    Runtime that runs actors as tasks of a single asyncio event loop instead
+    of running a thread per actor.
+
+    Actors keep their pykka API: they are started, asked, told and stopped
+    exactly like ThreadingActors, and they still process their messages
+    one by one. Message handlers are executed by a small pool of shared
+    worker threads, so blocking Redis and HTTP calls of different actors
+    overlap, but the number of threads doesn't grow with the number of
+    actors and plugins.
+
+    Actors that are asked by other actors, like StorageActor, have their own
+    worker: otherwise asking actors could take all the shared workers and
+    wait for it forever. Actors with slow handlers, like Senders and
+    MetricsAggregator, have their own workers as well, so they don't starve
+    other actors.
+
+    Actor tasks reuse internals of a pykka Actor loop, so the runtime
+    supports only pykka versions it was tested with.
+
+    The event loop runs in its own thread while there are running actors.
+    """
+
+    # Pykka versions with the Actor loop internals that the runtime uses:
+    PYKKA_VERSIONS = ((4, 0), (5, 0))
+
+    def __init__(self, workers: int = 2):
+        """
+        Args:
+            workers: Number of shared worker threads.
+        """
+        self.actors = 0
+        self.executor = ThreadPoolExecutor(
+            max_workers=max(workers, 1), thread_name_prefix="chouette-worker"
+        )
+        self.lock = Lock()
+        self.loop = asyncio.new_event_loop()
+        self.name = "AsyncioRuntime"
+        self.thread: Optional[Thread] = None
+
+    @classmethod
+    def is_supported(cls) -> bool:
+        """
+        Returns: Whether an installed pykka version is supported.
+        """
+        if metadata is None:
+            return False
+        try:
+            version_string = metadata.version("pykka")
+            version = tuple(int(part) for part in version_string.split(".")[:2])
+        except (metadata.PackageNotFoundError, ValueError):
+            return False
+        min_version, max_version = cls.PYKKA_VERSIONS
+        return min_version <= version < max_version
+
+    def create_inbox(self) -> LoopInbox:
+        """
+        Returns: Inbox for a new actor.
+        """
+        return LoopInbox(self.loop)
+
+    def start_actor(self, actor: Any) -> None:
+        """
+        Starts an actor task, starting an event loop thread if it's not
+        running yet.
+
+        Args:
+            actor: Actor object created with a LoopInbox.
+        """
+        with self.lock:
+            self.actors += 1
+            if self.thread is None:
+                self.thread = Thread(target=self._run, name="chouette-runtime")
+                self.thread.start()
+        asyncio.run_coroutine_threadsafe(self._run_actor(actor), self.loop)
+
+    def _run(self) -> None:
+        """
+        Event loop thread. It exits when the last actor stops.
+        """
+        asyncio.set_event_loop(self.loop)
+        while True:
+            self.loop.run_forever()
+            with self.lock:
+                if not self.actors:
+                    self.thread = None
+                    return
+
+    async def _run_actor(self, actor: Any) -> None:
+        """
+        Actor task: it processes messages of an actor one by one in a worker
+        thread, just like the loop of a pykka ThreadingActor does.
+
+        Args:
+            actor: Actor object to run.
+        """
+        if getattr(actor, "dedicated_worker", False):
+            executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix=actor.name)
+        else:
+            executor = self.executor
+        # pylint: disable=protected-access
+        try:
+            await self.loop.run_in_executor(executor, actor._actor_loop_setup)
+            while not actor.actor_stopped.is_set():
+                await actor.actor_inbox.wait()
+                envelope = actor.actor_inbox.get()
+                await self.loop.run_in_executor(
+                    executor, self._handle_envelope, actor, envelope
+                )
+            await self.loop.run_in_executor(executor, actor._actor_loop_teardown)
+        finally:
+            if executor is not self.executor:
+                executor.shutdown(wait=False)
+            with self.lock:
+                self.actors -= 1
+                if not self.actors:
+                    self.loop.stop()
+
+    @staticmethod
+    def _handle_envelope(actor: Any, envelope: Any) -> None:
+        """
+        Handles a single message of an actor like a pykka ThreadingActor
+        does: replies to `ask` requests, including their exceptions, and
+        stops an actor on an exception of a `tell` message.
+
+        Args:
+            actor: Actor object.
+            envelope: pykka Envelope with a message.
+        """
+        # pylint: disable=protected-access
+        try:
+            response = actor._handle_receive(envelope.message)
+            if envelope.reply_to is not None:
+                envelope.reply_to.set(response)
+        except Exception:  # pylint: disable=broad-except
+            if envelope.reply_to is not None:
+                envelope.reply_to.set_exception()
+            else:
+                actor._handle_failure(*sys.exc_info())
+                try:
+                    actor.on_failure(*sys.exc_info())
+                except Exception:  # pylint: disable=broad-except
+                    actor._handle_failure(*sys.exc_info())
+        except BaseException:  # pylint: disable=broad-except
+            logger.debug("[%s] %s. Stopping all actors.", actor.name, sys.exc_info()[1])
+            actor._stop()
+            ActorRegistry.stop_all()
@@ -1,10 +1,13 @@
 """
-chouette.Scheduler object based on a threading.Timer object
+chouette.Scheduler object based on a single dispatcher thread
 """
+import heapq
+import itertools
 import logging
 import time
-from threading import Lock, Timer
-from typing import Any, Callable, Optional, Set
+from functools import partial
+from threading import Condition, Lock, Thread, Timer
+from typing import Any, Callable, List, Optional, Set, Tuple
 
 __all__ = ["Scheduler", "Cancellable"]
 
@@ -15,14 +18,17 @@ class Cancellable:
     """
     Signifies a delayed task that can be cancelled.
 
-    Built around a `Timer` object and is able to cancel it.
-    For periodical jobs its `_timer` property is being updated on
-    every run from a separated thread, so to avoid race conditions where
-    in the middle of the `cancel` run another thread updates the `_timer`
-    property with a non-cancelled timer, Lock is used.
+    Scheduler checks whether a Cancellable is cancelled right before
+    executing its task, so a cancelled task is never executed again.
+
+    A Cancellable can also be built around a `Timer` object and is able
+    to cancel it. Its `_timer` property can be updated from a separated
+    thread, so to avoid race conditions where in the middle of the `cancel`
+    run another thread updates the `_timer` property with a non-cancelled
+    timer, Lock is used.
     """
 
-    def __init__(self, timer: Optional[Timer]) -> None:
+    def __init__(self, timer: Optional[Timer] = None) -> None:
         self._cancelled: bool = False
         self._timer: Optional[Timer] = timer
         self._timer_lock: Lock = Lock()
@@ -85,9 +91,18 @@ class Scheduler:
 
     Its main purpose is to execute a specified actor once or periodically
     after some delay.
+
+    All the tasks are kept in a single heap ordered by their execution time
+    and executed by a single dispatcher thread, so scheduling doesn't create
+    a new thread on every tick. Tasks are normally `ActorRef.tell` calls, so
+    they are expected to return immediately.
     """
 
     timers: Set[Cancellable] = set()
+    _condition: Condition = Condition()
+    _counter = itertools.count()
+    _queue: List[Tuple[float, int, Cancellable, Callable]] = []
+    _thread: Optional[Thread] = None
 
     @classmethod
     def stop_all(cls) -> None:
@@ -97,12 +112,15 @@ class Scheduler:
         for cancellable in list(cls.timers):
             cancellable.cancel()
             cls.timers.remove(cancellable)
+        with cls._condition:
+            cls._queue.clear()
+            cls._condition.notify()
 
     @classmethod
     def schedule_once(cls, delay: float, func: Callable, *args: Any) -> Cancellable:
         """
-        Takes a Callable function and its arguments and creates a timer to run
-        it after `delay` seconds.
+        Takes a Callable function and its arguments and schedules it to be run
+        after `delay` seconds.
 
         Args:
             delay: How many seconds Scheduler waits before executing a func.
@@ -110,10 +128,9 @@ class Scheduler:
             args: Arguments for the function provided as func.
         Returns: Cancellable object.
         """
-        timer = Timer(interval=delay, function=func, args=args)
-        timer.start()
-        cancellable = Cancellable(timer)
+        cancellable = Cancellable(None)
         cls.timers.add(cancellable)
+        cls._schedule(delay, cancellable, partial(cls._execute_once, func, *args))
         return cancellable
 
     @classmethod
@@ -175,11 +192,10 @@ class Scheduler:
         periodical func executions.
 
         It returns a Cancellable object, that can anytime cancel scheduled
-        executions by calling its `.cancel()` method. Its `._timer` property
-        is being updated via a pseudo-callback `_execute_and_update_cancellable`
-        that sends a message and creates a new Timer for another execution.
-        To keep it cancellable, this callback replaces an expired timer of
-        the returned Cancellable object with this newly created timer.
+        executions by calling its `.cancel()` method. Every execution is
+        done by a pseudo-callback `_execute_and_update_cancellable` that
+        executes a func and schedules the next execution, unless the
+        Cancellable was cancelled.
 
         Args:
             initial_delay (float): How many seconds we wait before the first execution.
@@ -194,15 +210,17 @@ class Scheduler:
 
         started = time.time() + initial_delay
 
-        timer = Timer(
-            interval=initial_delay,
-            function=cls._execute_and_update_cancellable,
-            args=(cancellable, interval, func, *args),
-            kwargs={"started": started, "precise": precise},
+        callback = partial(
+            cls._execute_and_update_cancellable,
+            cancellable,
+            interval,
+            func,
+            *args,
+            started=started,
+            precise=precise,
         )
-        timer.start()
-        cancellable.set_timer(timer)
         cls.timers.add(cancellable)
+        cls._schedule(initial_delay, cancellable, callback)
         return cancellable
 
     @classmethod
@@ -216,23 +234,24 @@ class Scheduler:
         precise: bool,
     ) -> None:
         """
-        A pseudo-callback function that creates a new Timer for the next
-        func execution and updates a Cancellable object with this Timer
-        to keep the scheduled activity cancellable.
+        A pseudo-callback function that executes a func and schedules
+        the next execution for the same Cancellable object.
 
-        If `started` parameter is not None, it tried to be as precise as
+        If `precise` parameter is True, it tries to be as precise as
         possible and to calculate and compensate time drift from the 'ideal'
         execution time.
 
         Args:
-            cancellable (Cancellable): A previously returned object whose
-                `_timer` property we need to update.
+            cancellable (Cancellable): A previously returned object that
+                keeps the scheduled activity cancellable.
             interval (float): How many seconds we wait between executions.
             func: Callable that must be executed.
             args: Arguments for the function provided as func.
-            started (Optional[float]): Unix timestamp that says when our
-                first execution was happened. If set, it's used to calculate
-                and compensate time drift between executions.
+            started (float): Unix timestamp that says when our first
+                execution was happened. It's used to calculate and
+                compensate time drift between executions.
+            precise (bool): Defines whether the time drift should be
+                compensated.
         Returns: None, since that's a pseudo-callback.
         """
         now = time.time()
@@ -245,13 +264,77 @@ class Scheduler:
         try:
             if now > started:
                 func(*args)
-            timer = Timer(
-                interval=delay,
-                function=cls._execute_and_update_cancellable,
-                args=(cancellable, interval, func, *args),
-                kwargs={"started": started, "precise": precise},
+            callback = partial(
+                cls._execute_and_update_cancellable,
+                cancellable,
+                interval,
+                func,
+                *args,
+                started=started,
+                precise=precise,
             )
-            timer.start()
-            cancellable.set_timer(timer)
+            cls._schedule(delay, cancellable, callback)
         except Exception:  # pylint: disable=broad-except
             logger.error("Stopping periodic job because of exception.", exc_info=True)
+
+    @classmethod
+    def _execute_once(cls, func: Callable, *args: Any) -> None:
+        """
+        A pseudo-callback function that executes a func scheduled once.
+
+        An exception must not stop the dispatcher thread, so it's logged.
+
+        Args:
+            func: Callable that must be executed.
+            args: Arguments for the function provided as func.
+        Returns: None, since that's a pseudo-callback.
+        """
+        try:
+            func(*args)
+        except Exception:  # pylint: disable=broad-except
+            logger.error("Scheduled job failed with exception.", exc_info=True)
+
+    @classmethod
+    def _schedule(
+        cls, delay: float, cancellable: Cancellable, callback: Callable
+    ) -> None:
+        """
+        Puts a callback to a heap of scheduled tasks and wakes up
+        a dispatcher thread, starting it if it's not running yet.
+
+        Args:
+            delay: How many seconds we wait before the callback execution.
+            cancellable: Cancellable object of a scheduled task.
+            callback: Callable without arguments to execute.
+        """
+        deadline = time.monotonic() + delay
+        with cls._condition:
+            heapq.heappush(
+                cls._queue, (deadline, next(cls._counter), cancellable, callback)
+            )
+            if cls._thread is None or not cls._thread.is_alive():
+                cls._thread = Thread(
+                    target=cls._dispatch, name="chouette-scheduler", daemon=True
+                )
+                cls._thread.start()
+            cls._condition.notify()
+
+    @classmethod
+    def _dispatch(cls) -> None:
+        """
+        Dispatcher thread loop.
+
+        It sleeps until the earliest task is due or a new task is scheduled
+        and executes due tasks one by one. Tasks of cancelled Cancellables
+        are dropped without execution.
+        """
+        while True:
+            with cls._condition:
+                while not cls._queue or cls._queue[0][0] > time.monotonic():
+                    timeout = (
+                        cls._queue[0][0] - time.monotonic() if cls._queue else None
+                    )
+                    cls._condition.wait(timeout)
+                _, _, cancellable, callback = heapq.heappop(cls._queue)
+            if not cancellable.is_cancelled():
+                callback()
@@ -2,45 +2,309 @@
 Sender Actor Abstract Class
 """
 import logging
-from typing import Any, List, Iterable
+import os
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Iterable, Iterator, Optional, Set, Tuple
+from urllib.parse import urlsplit
 
 import requests
+from chouette_iot_client import ChouetteClient  # type: ignore
+from requests.adapters import HTTPAdapter
+from requests.exceptions import ConnectionError as RequestsConnectionError
 from requests.exceptions import RequestException
+from urllib3.exceptions import ProtocolError
+from urllib3.util.retry import Retry
 
 from chouette_iot import ChouetteConfig
+from chouette_iot._compressors import (
+    CompressionTuner,
+    Compressor,
+    CompressorsFactory,
+    DeflateCompressor,
+)
+from chouette_iot._outbox import Outbox
 from chouette_iot._singleton_actor import VitalActor
 from chouette_iot.storage import StorageActor
 from chouette_iot.storage.messages import (
     CleanupOutdatedRecords,
     DeleteRecords,
+    GetQueueSize,
 )
 from chouette_iot.storage.messages import (
     CollectKeys,
+    CollectRecords,
     CollectValues,
 )
 
-__all__ = ["Sender"]
+__all__ = [
+    "BulkSizer",
+    "CircuitBreaker",
+    "CompressedPayload",
+    "PayloadRejected",
+    "Sender",
+]
 
 logger = logging.getLogger("chouette-iot")
 
 
+class PayloadRejected(Exception):
+    """
+    Datadog rejected a payload permanently: it's never going to be accepted,
+    so there is no point in retrying it.
+    """
+
+
+class CompressedPayload:
+    """
+    Iterable request body that compresses a payload chunk by chunk.
+
+    Chunks are compressed by a compression object of a Compressor while
+    `requests` sends them, so neither the whole payload nor the whole
+    compressed message is ever kept in memory. `requests` sends iterable
+    bodies with a chunked transfer encoding.
+
+    Uncompressed chunks are kept in a list, so a payload can be iterated
+    over and sent once again. Their size is limited by a payload size.
+
+    Sizes of a compressed message and time spent on its compression are
+    known after it was sent.
+
+    If a payload can be moved to an outbox after a failed dispatch, its
+    compressed chunks are kept, so it isn't compressed a second time.
+    """
+
+    def __init__(
+        self,
+        chunks: Iterable[bytes],
+        compressor: Optional[Compressor] = None,
+        level: Optional[int] = None,
+        keep: bool = False,
+    ):
+        """
+        Args:
+            chunks: Iterable of uncompressed payload chunks.
+            compressor: Compressor to use. Default is DeflateCompressor.
+            level: Compression level or None for a default level.
+            keep: Whether to keep compressed chunks.
+        """
+        self.chunks = list(chunks)
+        self.complete = False
+        self.compressed: List[bytes] = []
+        self.compressor = compressor or DeflateCompressor()
+        self.keep = keep
+        self.level = level
+        self.raw_size = 0
+        self.seconds = 0.0
+        self.size = 0
+
+    @property
+    def ratio(self) -> float:
+        """
+        Returns: Ratio of uncompressed and compressed message sizes.
+        """
+        return self.raw_size / self.size if self.size else 0.0
+
+    def __iter__(self) -> Iterator[bytes]:
+        """
+        Compresses chunks and yields compressed data as soon as
+        a compression object produces it.
+
+        Returns: Iterator over compressed data chunks.
+        """
+        compressor = self.compressor.compressobj(self.level)
+        self.complete = False
+        self.compressed = []
+        self.raw_size = 0
+        self.seconds = 0.0
+        self.size = 0
+        for chunk in self.chunks:
+            started = time.perf_counter()
+            compressed = compressor.compress(chunk)
+            self.seconds += time.perf_counter() - started
+            self.raw_size += len(chunk)
+            if compressed:
+                self.size += len(compressed)
+                if self.keep:
+                    self.compressed.append(compressed)
+                yield compressed
+        started = time.perf_counter()
+        compressed = compressor.flush()
+        self.seconds += time.perf_counter() - started
+        self.size += len(compressed)
+        if self.keep:
+            self.compressed.append(compressed)
+        self.complete = True
+        yield compressed
+
+
+class BulkSizer:
+    """
+    Adjusts a bulk size to a connection in an AIMD manner.
+
+    If a bulk wasn't dispatched or its dispatch took longer than a target
+    latency, a bulk size is halved. If a full bulk was dispatched in time,
+    a bulk size is increased by a 1/20 of a sizes range, but not above
+    a number of records that can be sent in a target latency with an
+    observed throughput.
+
+    A bulk size starts from its maximum, so on a fast connection it's
+    the same as a fixed one.
+    """
+
+    def __init__(self, min_size: int, max_size: int, target_latency: float):
+        """
+        Args:
+            min_size: Minimum bulk size.
+            max_size: Maximum bulk size.
+            target_latency: Maximum time in seconds a dispatch should take.
+        """
+        self.min_size = min(min_size, max_size)
+        self.max_size = max_size
+        self.size = max_size
+        self.step = max((max_size - self.min_size) // 20, 1)
+        self.target_latency = target_latency
+
+    def update(self, dispatched: bool, latency: float, records: int) -> int:
+        """
+        Adjusts a bulk size after a bulk was processed.
+
+        Args:
+            dispatched: Whether a bulk was accepted by Datadog.
+            latency: How long its dispatch took in seconds.
+            records: Number of records in a bulk.
+        Returns: New bulk size.
+        """
+        if not dispatched or latency > self.target_latency:
+            self.size = max(self.size // 2, self.min_size)
+        elif records >= self.size:
+            throughput = records / latency if latency else float("inf")
+            fitting = max(throughput * self.target_latency, self.size)
+            self.size = int(min(self.size + self.step, fitting, self.max_size))
+        return self.size
+
+
+class CircuitBreaker:
+    """
+    Tracks consecutive dispatch failures.
+
+    After FAILURES_THRESHOLD consecutive failures a circuit opens: Datadog
+    is considered unavailable for a backoff period. Every next failure
+    doubles this period up to a maximum backoff. Any success closes
+    the circuit.
+
+    It's thread-safe, since bulks can be dispatched concurrently.
+    """
+
+    FAILURES_THRESHOLD = 2
+
+    def __init__(self, backoff: float, max_backoff: float):
+        """
+        Args:
+            backoff: Initial backoff period in seconds.
+            max_backoff: Maximum backoff period in seconds.
+        """
+        self.backoff = backoff
+        self.failures = 0
+        self.lock = threading.Lock()
+        self.max_backoff = max_backoff
+        self.opened_till = 0.0
+
+    def is_open(self) -> bool:
+        """
+        Returns: Whether Datadog is considered unavailable.
+        """
+        return self.failures >= self.FAILURES_THRESHOLD
+
+    def record(self, success: bool) -> None:
+        """
+        Records a dispatch result and opens or closes a circuit.
+
+        Args:
+            success: Whether a dispatch was successful.
+        """
+        with self.lock:
+            if success:
+                self.failures = 0
+                return
+            self.failures += 1
+            if self.failures >= self.FAILURES_THRESHOLD:
+                exponent = self.failures - self.FAILURES_THRESHOLD
+                backoff = min(self.backoff * 2 ** exponent, self.max_backoff)
+                self.opened_till = time.time() + backoff
+
+
 class Sender(VitalActor):
     """
     Sender is an actor that communicates to Datadog.
 
     That's an abstract class, actual actors must implement all
     the nonimplemented methods.
+
+    Senders keep long-lived HTTP sessions, so connections to Datadog are
+    reused between dispatches and TCP and TLS handshakes aren't repeated
+    every time. Sessions are stored per Datadog host, so different
+    Senders that communicate to the same host share one session.
     """
 
+    # Every host is served by a single session and, consequently, by a
+    # single connection pool.
+    POOL_CONNECTIONS = 1
+    # Metrics and logs can be dispatched at the same time. In a drain mode
+    # every Sender can dispatch up to DISPATCH_CONCURRENCY bulks at once.
+    POOL_MAXSIZE = 2
+    # Establishing a connection is safe to retry, since nothing was sent.
+    # Failed requests are never retried, since their bodies are streamed.
+    CONNECT_RETRIES = 2
+
+    # Dispatches wait for Datadog for up to a timeout, so in an asyncio
+    # runtime a Sender has its own worker and doesn't starve other actors.
+    dedicated_worker = True
+    # Datadog endpoint where payloads are dispatched.
+    ENDPOINT = ""
+    # Content-Encodings of payloads that an endpoint accepts.
+    ENCODINGS = {"deflate"}
+    # Brackets of a payload around its records.
+    PAYLOAD_OVERHEAD = 16
+    # 4xx responses that don't reject a payload itself, but an API key or
+    # a request rate, so a payload can be accepted later.
+    RETRYABLE_STATUSES = {401, 403, 408, 429}
+
+    _sessions: Dict[str, requests.Session] = {}
+    _sessions_lock = threading.Lock()
+    # Number of requests that every session is sending right now:
+    _sessions_users: Dict[requests.Session, int] = {}
+
     def __init__(self):
         """
         Next configuration is being extracted from ChouetteConfig:
 
+        * adaptive_bulk_size: Whether a bulk size should be adjusted
+            between `min_bulk_size` and a configured bulk size by observed
+            dispatch latency and failures.
         * api_key: Datadog API key.
+        * circuit_breaker: Whether dispatching should be stopped for
+            an exponentially growing period after consecutive failures.
+            Initial period is a release interval.
+        * compression: Name of a payload compressor: deflate, gzip or zstd.
+            If an endpoint doesn't accept its encoding, deflate is used.
+        * compression_level: Compression level. If it's empty, a default
+            level of a compressor is used. If it's 'auto', a level is picked
+            by a backlog size and observed compression ratios.
+        * concurrency: Maximum number of bulks that are dispatched at the
+            same time in a drain mode.
         * datadog_url: Datadog URL. It has a default value.
+        * drain_mode: Whether successive bulks should be dispatched
+            while there is a backlog. They are dispatched for at most
+            80% of a release interval.
         * log_ttl: Datadog drops outdated logs, so we clean them before
             sending data. This option says how many seconds is considered
             being "outdated". Logs older than TTL are being dropped.
+        * outbox_path: Directory to keep compressed payloads that weren't
+            dispatched. If it's empty, they are not kept.
+        * outbox_size: Maximum size of an outbox in bytes.
+        * payload_size: Maximum size of an uncompressed request body.
         * tags: List of global tags to add to every metric. Should have
             something that gives you a chance to understand what device
             send this metrics. E.g.: a 'host' tag.
@@ -49,13 +313,50 @@ class Sender(VitalActor):
         """
         super().__init__()
         config = ChouetteConfig()
+        self.adaptive_bulk_size = config.adaptive_bulk_size
         self.api_key = config.api_key
         self.bulk_size = 500  # Just to calm down the typing system.
+        self.bulk_sizer: Optional[BulkSizer] = None
+        self.circuit_breaker: Optional[CircuitBreaker] = None
+        if config.circuit_breaker:
+            self.circuit_breaker = CircuitBreaker(
+                config.release_interval, config.circuit_max_backoff
+            )
         self.config = config
         self.host = config.host
+        self.min_bulk_size = config.min_bulk_size
+        self.outbox: Optional[Outbox] = None
+        self.outbox_path = config.outbox_path
+        self.outbox_size = config.outbox_size
+        self.payload_size = 3200000  # Just to calm down the typing system.
+        self.compressor = CompressorsFactory.get_compressor(config.compression)
+        if self.compressor.encoding not in self.ENCODINGS:
+            logger.warning(
+                "[%s] Endpoint '%s' doesn't accept '%s' payloads. Using deflate.",
+                self.name,
+                self.ENDPOINT,
+                self.compressor.encoding,
+            )
+            self.compressor = DeflateCompressor()
+        self.compression_level: Optional[int] = None
+        self.compression_tuner: Optional[CompressionTuner] = None
+        if config.compression_level == "auto":
+            self.compression_tuner = CompressionTuner(self.compressor)
+        elif config.compression_level:
+            try:
+                self.compression_level = int(config.compression_level)
+            except ValueError:
+                logger.warning(
+                    "[%s] Unknown compression level '%s'. Using a default one.",
+                    self.name,
+                    config.compression_level,
+                )
+        self.concurrency = max(config.dispatch_concurrency, 1)
         self.datadog_url = config.datadog_url
+        self.drain_budget = config.release_interval * 0.8
+        self.drain_mode = config.drain_mode
         self.send_self_metrics = config.send_self_metrics
-        self.storage = StorageActor.get_instance()
+        self.storage = StorageActor.get_storage()
         self.tags = config.global_tags
         self.timeout = int(config.release_interval * 0.8)
         self.ttl = 14400  # Just to calm down the typing system.
@@ -74,11 +375,20 @@ class Sender(VitalActor):
         On any message a Sender instance:
 
         1. Performs outdated records cleanup prior to gathering data.
-        2. Gets a bulk of keys from a Storage actor.
-        3. Collects records and adds global tags to every of them.
-        4. Tries to dispatch them as a compressed message.
-        5. If they were dispatched successfully - deletes data from the
-           storage.
+        2. If a circuit is open, probes Datadog and stops if it's still
+           unavailable, so no data is collected and compressed in vain.
+        3. If there is an outbox, dispatches payloads from it first.
+        4. Picks a compression level if it's picked automatically.
+        5. Processes a bulk of records.
+        6. In a drain mode, if the bulk was full and was processed
+           successfully, processes the next one until the queue is drained
+           or a drain budget of 80% of a release interval is spent.
+           If concurrency is bigger than 1, bulks are processed in
+           a pipeline by `drain_pipelined`.
+
+        Without a drain mode a backlog that was gathered during a period
+        of lost connectivity is dispatched at a pace of one bulk per
+        release interval and can be outdated before it's dispatched.
 
         To preserve the exact order of actions, Senders intentionally
         communicate to their Storage in a blocking manner, via `ask` requests.
@@ -87,25 +397,427 @@ class Sender(VitalActor):
             records_type: Type of data to process. E.g. logs, metrics.
         Returns: Whether data was dispatched and cleaned successfully.
         """
-        self.storage = StorageActor.get_instance()
+        self.storage = StorageActor.get_storage()
+        if self.adaptive_bulk_size and not self.bulk_sizer:
+            self.bulk_sizer = BulkSizer(
+                self.min_bulk_size, self.bulk_size, self.timeout / 2
+            )
+        if self.outbox_path and not self.outbox:
+            outbox_path = os.path.join(self.outbox_path, records_type)
+            self.outbox = Outbox(outbox_path, self.outbox_size)
         self.cleanup_outdated_records(records_type, self.ttl)
-        keys = self.collect_keys(records_type)
+        if self.circuit_breaker and self.circuit_breaker.is_open():
+            if not self.probe_datadog():
+                return False
+        if self.outbox and not self.flush_outbox():
+            return False
+        if self.compression_tuner:
+            backlog = self.storage.ask(GetQueueSize(records_type, wrapped=True))
+            self.compression_level = self.compression_tuner.pick(
+                backlog, self.bulk_size
+            )
+        deadline = time.time() + self.drain_budget
+        if self.drain_mode and self.concurrency > 1:
+            processed = self.drain_pipelined(records_type, deadline)
+        else:
+            processed = self.drain(records_type, deadline)
+        if self.bulk_sizer and self.send_self_metrics:
+            ChouetteClient.gauge(f"chouette.bulk_size.{records_type}", self.bulk_size)
+        return processed
+
+    def drain(self, records_type: str, deadline: float) -> bool:
+        """
+        Processes bulks one by one. Without a drain mode it processes
+        only one bulk.
+
+        Args:
+            records_type: Type of data to process. E.g. logs, metrics.
+            deadline: Timestamp after which new bulks aren't collected.
+        Returns: Whether data was dispatched and cleaned successfully.
+        """
+        bulks = 0
+        while True:
+            bulk_size = self.bulk_size
+            processed, bulk_length = self.process_bulk(records_type)
+            bulks += 1
+            if not self.drain_mode or not processed:
+                break
+            if bulk_length < bulk_size or time.time() >= deadline:
+                break
+        if bulks > 1:
+            logger.info(
+                "[%s] Drained %s bulks of %s.", self.name, bulks, records_type
+            )
+        return processed
+
+    def process_bulk(self, records_type: str) -> Tuple[bool, int]:
+        """
+        Processes a single bulk of records:
+
+        1. Gets a bulk of keys with their records from a Storage actor
+           and adds global tags to every record.
+        2. Tries to dispatch them as compressed messages.
+        3. Deletes records that were dispatched successfully from the
+           storage and, if there is an outbox, moves the rest of them there.
+
+        Args:
+            records_type: Type of data to process. E.g. logs, metrics.
+        Returns: Tuple of a boolean that says whether data was dispatched
+                 and cleaned successfully and a number of collected keys.
+        """
+        keys, records = self.collect_keys_and_records(records_type)
         if not keys:
             logger.debug("[%s] Nothing to dispatch.", self.name)
+            return True, 0
+        accepted, latency, failed = self.timed_dispatch(records)
+        processed = self.confirm_bulk(
+            keys, records, accepted, latency, records_type, failed
+        )
+        return processed, len(keys)
+
+    def drain_pipelined(self, records_type: str, deadline: float) -> bool:
+        """
+        Drains a queue with up to `self.concurrency` bulks being dispatched
+        at the same time.
+
+        While previous bulks are in flight, the next bulk is collected from
+        a Storage. Keys of records that are being dispatched are excluded
+        from it, since they are still the oldest keys in a queue. Records
+        of every bulk are deleted from a Storage as soon as Datadog accepts
+        them.
+
+        New bulks aren't collected after a bulk wasn't full, a dispatch
+        failed or a drain budget was spent, but bulks that are in flight
+        are always awaited.
+
+        Args:
+            records_type: Type of data to process. E.g. logs, metrics.
+            deadline: Timestamp after which new bulks aren't collected.
+        Returns: Whether data was dispatched and cleaned successfully.
+        """
+        in_flight: Dict[Future, Tuple[List[bytes], List[Any]]] = {}
+        processed = True
+        bulks = 0
+        with ThreadPoolExecutor(
+            max_workers=self.concurrency, thread_name_prefix=self.name
+        ) as executor:
+            while processed and time.time() < deadline:
+                sending = set(key for keys, _ in in_flight.values() for key in keys)
+                keys, records = self.collect_pending_records(records_type, sending)
+                if not keys:
+                    break
+                future = executor.submit(self.timed_dispatch, records)
+                in_flight[future] = (keys, records)
+                bulks += 1
+                if len(keys) < self.bulk_size:
+                    break
+                if len(in_flight) >= self.concurrency:
+                    done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+                    processed = self._confirm_bulks(done, in_flight, records_type)
+            done, _ = wait(in_flight)
+            processed = self._confirm_bulks(done, in_flight, records_type) and processed
+        if not bulks:
+            logger.debug("[%s] Nothing to dispatch.", self.name)
+        elif bulks > 1:
+            logger.info(
+                "[%s] Drained %s bulks of %s.", self.name, bulks, records_type
+            )
+        return processed
+
+    def probe_datadog(self) -> bool:
+        """
+        Checks whether Datadog is available again while a circuit is open.
+
+        Until a backoff period has passed it doesn't send anything. After
+        that it sends a probe: an empty payload that is cheap to build.
+
+        Returns: Whether Datadog accepted a probe.
+        """
+        if not self.circuit_breaker:
             return True
-        records = self.collect_records(keys, records_type)
-        dispatched = self.dispatch_to_datadog(records)
-        if not dispatched:
+        wait_for = self.circuit_breaker.opened_till - time.time()
+        if wait_for > 0:
+            logger.info(
+                "[%s] Datadog is unavailable. Next attempt in %s seconds.",
+                self.name,
+                int(wait_for),
+            )
             return False
-        cleaned_up = self.cleanup_records(keys, records_type)
+        probed = self.probe()
+        self.circuit_breaker.record(probed)
+        if probed:
+            logger.info("[%s] Datadog is available again.", self.name)
+        return probed
+
+    def probe(self) -> bool:
+        """
+        Sends an empty payload to check whether Datadog is available.
+
+        Returns: Whether Datadog accepted it.
+        """
+        payload = self.compress(self.payload_chunks([]))
+        try:
+            return self._post_to_datadog(payload, self.ENDPOINT)
+        except PayloadRejected:
+            # Datadog responded, so it's available.
+            return True
+
+    def flush_outbox(self) -> bool:
+        """
+        Dispatches payloads from an outbox in FIFO order.
+
+        Payloads are already compressed, so they are sent as they are.
+        Payloads which records are outdated are evicted beforehand.
+        Dispatching stops on the first payload that wasn't accepted due to
+        a retryable failure. Payloads that Datadog rejected permanently are
+        dropped, so they don't block new dispatches.
+
+        Returns: Whether all the payloads were dispatched.
+        """
+        if not self.outbox:
+            return True
+        self.outbox.evict_outdated(self.ttl)
+        for file_path in self.outbox.payloads():
+            try:
+                encoding = self.outbox.get_encoding(file_path)
+                with open(file_path, "rb") as payload:
+                    dispatched = self._post_to_datadog(
+                        payload, self.ENDPOINT, encoding
+                    )
+            except OSError as error:
+                # An unreadable payload can't be dispatched anyway.
+                logger.warning(
+                    "[%s] Could not read a payload '%s' due to: '%s'.",
+                    self.name,
+                    file_path,
+                    error,
+                )
+                dispatched = True
+            except PayloadRejected as error:
+                logger.error(
+                    "[%s] Dropped a payload '%s' rejected by Datadog: %s",
+                    self.name,
+                    file_path,
+                    error,
+                )
+                dispatched = True
+            if self.circuit_breaker:
+                self.circuit_breaker.record(dispatched)
+            if not dispatched:
+                return False
+            self.outbox.remove(file_path)
+        return True
+
+    def spill_to_outbox(
+        self,
+        keys: List[bytes],
+        records: List[Any],
+        records_type: str,
+        failed: Optional[CompressedPayload] = None,
+    ) -> bool:
+        """
+        Writes records that weren't dispatched due to a retryable failure
+        to an outbox as compressed payloads and deletes them from a Storage.
+
+        A payload is compressed once and isn't built again on every next
+        dispatch attempt. The first part of records is the payload that
+        failed, so if its compressed chunks were kept completely, they are
+        written as they are. Payloads are marked by a timestamp of the
+        oldest record in a queue, which isn't newer than any of their
+        records, so they are evicted as soon as their records can get
+        outdated.
+
+        Args:
+            keys: List of records keys as bytes.
+            records: List of prepared to dispatch records.
+            records_type: Type of records (logs, metrics, etc).
+            failed: CompressedPayload of the first part that wasn't accepted.
+        Returns: Whether records were moved to an outbox.
+        """
+        if not self.outbox:
+            return False
+        request = CollectKeys(records_type, amount=1, wrapped=True)
+        oldest = next((timestamp for _, timestamp in self.storage.ask(request)), None)
+        parts = self.split_records(self.encode_records(records))
+        for number, (part, _) in enumerate(parts):
+            if not number and failed and failed.complete:
+                payload: Iterable[bytes] = failed.compressed
+            else:
+                payload = self.compress(self.payload_chunks(part))
+            if not self.outbox.put(payload, self.compressor.encoding, oldest):
+                return False
+        logger.info(
+            "[%s] Moved %s %s to an outbox.", self.name, len(keys), records_type
+        )
+        return self.cleanup_records(keys, records_type)
+
+    def compress(self, chunks: Iterable[bytes]) -> CompressedPayload:
+        """
+        Wraps payload chunks into a CompressedPayload with a configured
+        compressor and a current compression level.
+
+        Args:
+            chunks: Iterable of uncompressed payload chunks.
+        Returns: CompressedPayload object.
+        """
+        return CompressedPayload(
+            chunks, self.compressor, self.compression_level, keep=bool(self.outbox)
+        )
+
+    def report_compression(self, payload: CompressedPayload, records_type: str):
+        """
+        Passes a compression ratio of a dispatched payload to a compression
+        tuner and sends compression ratio and time as self metrics.
+
+        Args:
+            payload: Dispatched CompressedPayload.
+            records_type: Type of records (logs, metrics, etc).
+        """
+        if self.compression_tuner and payload.level is not None:
+            self.compression_tuner.observe(payload.level, payload.ratio)
+        if self.send_self_metrics:
+            metric = f"chouette.compression.{records_type}"
+            ChouetteClient.gauge(f"{metric}.ratio", payload.ratio)
+            ChouetteClient.gauge(f"{metric}.seconds", payload.seconds)
+
+    def timed_dispatch(
+        self, records: List[Any]
+    ) -> Tuple[int, float, Optional[CompressedPayload]]:
+        """
+        Dispatches records to Datadog, measures how long it took and
+        records a result to a circuit breaker.
+
+        Args:
+            records: List of prepared to dispatch records.
+        Returns: Tuple of a number of leading records that were accepted
+                 by Datadog or dropped, a dispatch duration in seconds and
+                 a CompressedPayload that wasn't accepted, if any.
+        """
+        started = time.monotonic()
+        accepted, failed = self.dispatch_bulk(records)
+        if self.circuit_breaker:
+            self.circuit_breaker.record(accepted == len(records))
+        return accepted, time.monotonic() - started, failed
+
+    def adjust_bulk_size(self, dispatched: bool, latency: float, records: int) -> None:
+        """
+        Adjusts a bulk size by a BulkSizer if a bulk size is adaptive.
+
+        Args:
+            dispatched: Whether a bulk was accepted by Datadog.
+            latency: How long its dispatch took in seconds.
+            records: Number of records in a bulk.
+        """
+        if not self.bulk_sizer:
+            return
+        bulk_size = self.bulk_sizer.update(dispatched, latency, records)
+        if bulk_size != self.bulk_size:
+            logger.info(
+                "[%s] Bulk size changed from %s to %s.",
+                self.name,
+                self.bulk_size,
+                bulk_size,
+            )
+        self.bulk_size = bulk_size
+
+    def collect_pending_records(
+        self, records_type: str, sending: Set[bytes]
+    ) -> Tuple[List[bytes], List[Any]]:
+        """
+        Requests a `self.bulk_size` amount of the oldest records with their
+        keys, that are not being dispatched at the moment, and prepares them
+        to be dispatched to Datadog.
+
+        Keys and records are collected in a single request, so records stay
+        aligned with their keys, even though records that are being
+        dispatched are collected and skipped.
+
+        Args:
+            records_type: Type of records (logs, metrics, etc).
+            sending: Set of keys of records that are being dispatched.
+        Returns: Tuple of a list of record keys and a list of prepared
+                 to dispatch objects.
+        """
+        amount = self.bulk_size + len(sending)
+        request = CollectRecords(records_type, amount=amount, wrapped=True)
+        keys_and_records = [
+            (key, record)
+            for key, record in self.storage.ask(request)
+            if key not in sending
+        ][: self.bulk_size]
+        keys = [key for key, _ in keys_and_records]
+        records = self.prepare_records(record for _, record in keys_and_records)
+        return keys, records
+
+    def confirm_bulk(
+        self,
+        keys: List[bytes],
+        records: List[Any],
+        accepted: int,
+        latency: float,
+        records_type: str,
+        failed: Optional[CompressedPayload] = None,
+    ) -> bool:
+        """
+        Deletes records of a bulk that were accepted by Datadog from
+        a Storage and moves the rest of them to an outbox. Accepted records
+        are deleted first, so the rest of them are the oldest in a queue.
+
+        Only the leading records of a bulk can be accepted, since its
+        payloads are dispatched in order until the first failure.
+
+        Args:
+            keys: List of records keys as bytes, aligned with records.
+            records: List of prepared to dispatch records.
+            accepted: Number of leading records accepted by Datadog.
+            latency: How long a dispatch took in seconds.
+            records_type: Type of records (logs, metrics, etc).
+            failed: CompressedPayload of the first part that wasn't accepted.
+        Returns: Whether all the records were dispatched and cleaned up.
+        """
+        dispatched = accepted >= len(records)
+        self.adjust_bulk_size(dispatched, latency, len(keys))
+        done = keys if dispatched else keys[:accepted]
+        cleaned_up = not done or self.cleanup_records(done, records_type)
         if not cleaned_up:
             logger.error(
                 "[%s] %s were dispatched, but not cleaned up!",
                 self.name,
                 records_type.capitalize(),
             )
+        if not dispatched:
+            self.spill_to_outbox(
+                keys[accepted:], records[accepted:], records_type, failed
+            )
         return dispatched and cleaned_up
 
+    def _confirm_bulks(
+        self,
+        done: Set[Future],
+        in_flight: Dict[Future, Tuple[List[bytes], List[Any]]],
+        records_type: str,
+    ) -> bool:
+        """
+        Confirms bulks which dispatch has finished.
+
+        Args:
+            done: Set of finished dispatch futures.
+            in_flight: Dict of dispatch futures and keys and records of
+                       their bulks.
+                       Finished futures are removed from it.
+            records_type: Type of records (logs, metrics, etc).
+        Returns: Whether all the bulks were dispatched and cleaned up.
+        """
+        processed = True
+        for future in done:
+            keys, records = in_flight.pop(future)
+            accepted, latency, failed = future.result()
+            confirmed = self.confirm_bulk(
+                keys, records, accepted, latency, records_type, failed
+            )
+            processed = confirmed and processed
+        return processed
+
     def cleanup_outdated_records(self, records_type: str, ttl: int) -> bool:
         """
         Sends a CleanupOutdatedRecords request to a storage.
@@ -138,7 +850,29 @@ class Sender(VitalActor):
         logger.debug("[%s] Collected %s %s.", self.name, len(keys_and_ts), records_type)
         return list(map(lambda pair: pair[0], keys_and_ts))
 
-    def collect_records(self, keys: List[bytes], records_type: str) -> List[dict]:
+    def collect_keys_and_records(
+        self, records_type: str
+    ) -> Tuple[List[bytes], List[Any]]:
+        """
+        Requests a `self.bulk_size` amount of the oldest records with their
+        keys from a Storage in a single request, adds global tags to them and
+        prepares them to be dispatched to Datadog.
+
+        Args:
+            records_type: Type of records (logs, metrics, etc).
+        Returns: Tuple of a list of record keys and a list of prepared
+                 to dispatch objects, aligned with these keys.
+        """
+        request = CollectRecords(records_type, amount=self.bulk_size, wrapped=True)
+        keys_and_records = self.storage.ask(request)
+        logger.debug(
+            "[%s] Collected %s %s.", self.name, len(keys_and_records), records_type
+        )
+        keys = [key for key, _ in keys_and_records]
+        records = self.prepare_records(record for _, record in keys_and_records)
+        return keys, records
+
+    def collect_records(self, keys: List[bytes], records_type: str) -> List[Any]:
         """
         Gets a list of records from a Storage, adds global tags to them and
         prepare them to be dispatched to Datadog.
@@ -153,10 +887,28 @@ class Sender(VitalActor):
         logger.debug("[%s] Collected %s %s.", self.name, len(b_records), records_type)
         return list(self.add_global_tags(b_records))
 
-    def add_global_tags(self, b_records: Iterable[bytes]) -> Iterable[dict]:
+    def prepare_records(self, b_records: Iterable[Optional[bytes]]) -> List[Any]:
+        """
+        Adds global tags to records one by one, so prepared records stay
+        aligned with their keys. Records that are missing or can't be
+        prepared are None: they are never dispatched.
+
+        Args:
+            b_records: Bytes objects representing encoded records or None.
+        Returns: List of prepared to dispatch objects or None.
+        """
+        prepared = []
+        for b_record in b_records:
+            records = list(self.add_global_tags([b_record])) if b_record else []
+            prepared.append(records[0] if records else None)
+        return prepared
+
+    def add_global_tags(self, b_records: Iterable[bytes]) -> Iterable[Any]:
         """
         Tags should be added for most of the records, but in a slightly
         different way, so this method must be implemented individually.
+
+        It returns records prepared to be passed to `dispatch_to_datadog`.
         """
         raise NotImplementedError(
             "Use concrete Sender implementation."
@@ -175,46 +927,359 @@ class Sender(VitalActor):
         delete_request = DeleteRecords(records_type, keys, wrapped=True)
         return self.storage.ask(delete_request)
 
-    def dispatch_to_datadog(self, records: List[dict]) -> bool:
+    @classmethod
+    def get_session(cls, url: str, concurrency: int = 1) -> requests.Session:
         """
-        Datadog dispatching logic must be implemented individually.
+        Returns a long-lived HTTP session for a host of a specified URL.
+
+        If there is no session for this host yet, creates it with
+        a connection pool that keeps connections alive.
+
+        Args:
+            url: URL of a Datadog endpoint.
+            concurrency: How many requests a Sender can send at once.
+        Returns: Session for this URL host.
+        """
+        origin = cls._get_origin(url)
+        with cls._sessions_lock:
+            return cls._get_or_create_session(origin, concurrency)
+
+    @classmethod
+    def acquire_session(cls, url: str, concurrency: int = 1) -> requests.Session:
+        """
+        Returns a long-lived HTTP session like `get_session` and marks it
+        as used, so it's not closed by `reset_session` while a request is
+        being sent. Every acquired session must be released.
+
+        Args:
+            url: URL of a Datadog endpoint.
+            concurrency: How many requests a Sender can send at once.
+        Returns: Session for this URL host.
+        """
+        origin = cls._get_origin(url)
+        with cls._sessions_lock:
+            session = cls._get_or_create_session(origin, concurrency)
+            cls._sessions_users[session] = cls._sessions_users.get(session, 0) + 1
+            return session
+
+    @classmethod
+    def release_session(cls, session: requests.Session) -> None:
+        """
+        Marks an acquired session as not used by a request anymore. If it
+        was reset while it was used, it's closed by its last user.
+
+        Args:
+            session: Session returned by `acquire_session`.
+        """
+        with cls._sessions_lock:
+            users = cls._sessions_users.pop(session, 1) - 1
+            if users:
+                cls._sessions_users[session] = users
+                return
+            if session in cls._sessions.values():
+                return
+        session.close()
+
+    @classmethod
+    def reset_session(cls, url: str) -> None:
+        """
+        Drops a session for a host of a specified URL with all its pooled
+        connections. The next request creates a new session.
+
+        It's used when a connection has failed: pooled connections could
+        be dropped by the server or by NAT while they were idle and there
+        is no point in trying to reuse them.
+
+        A session is closed right away if no request uses it. Otherwise
+        it's closed by the last request that uses it.
+
+        Args:
+            url: URL of a Datadog endpoint.
+        """
+        origin = cls._get_origin(url)
+        with cls._sessions_lock:
+            session = cls._sessions.pop(origin, None)
+            if session is None or session in cls._sessions_users:
+                return
+        session.close()
+
+    @classmethod
+    def _get_or_create_session(cls, origin: str, concurrency: int) -> requests.Session:
+        """
+        Returns a session of an origin, creating it if there is none.
+        Must be called with `_sessions_lock` held.
+
+        Args:
+            origin: Scheme and host of a Datadog URL.
+            concurrency: How many requests a Sender can send at once.
+        Returns: Session for this origin.
+        """
+        session = cls._sessions.get(origin)
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                pool_connections=cls.POOL_CONNECTIONS,
+                pool_maxsize=cls.POOL_MAXSIZE * concurrency,
+                max_retries=Retry(
+                    total=cls.CONNECT_RETRIES,
+                    connect=cls.CONNECT_RETRIES,
+                    read=0,
+                    status=0,
+                    redirect=0,
+                    backoff_factor=0.5,
+                ),
+            )
+            session.mount(f"{origin}/", adapter)
+            cls._sessions[origin] = session
+        return session
+
+    @staticmethod
+    def _get_origin(url: str) -> str:
+        """
+        Extracts a scheme and a host with a port from a URL.
+
+        Args:
+            url: URL as a string.
+        Returns: Origin like 'https://api.datadoghq.com'.
+        """
+        parts = urlsplit(url)
+        return f"{parts.scheme}://{parts.netloc}"
+
+    def dispatch_to_datadog(self, records: List[Any]) -> int:
+        """
+        Dispatches prepared records to Datadog with `dispatch_bulk`.
+
+        Args:
+            records: List of prepared to dispatch records.
+        Returns: Number of leading records that were accepted by Datadog
+                 or dropped. It's the number of records if all of them
+                 were dispatched.
+        """
+        accepted, _ = self.dispatch_bulk(records)
+        return accepted
+
+    def dispatch_bulk(
+        self, records: List[Any]
+    ) -> Tuple[int, Optional[CompressedPayload]]:
+        """
+        Encodes prepared records, splits them into payloads that don't
+        exceed `self.payload_size` bytes and dispatches them one by one.
+
+        Datadog rejects too big payloads and without splitting a bulk
+        like this would be retried forever. Records that don't fit into
+        a payload even alone are dropped.
+
+        Dispatching stops on the first payload that wasn't accepted.
+        Records of payloads that were accepted before it are counted as
+        accepted, so they aren't dispatched again. Payloads that Datadog
+        rejected permanently are dropped, like records that don't fit into
+        a payload, so they don't block the next ones.
+
+        Args:
+            records: List of prepared to dispatch records.
+        Returns: Tuple of a number of leading records that were accepted
+                 by Datadog or dropped and a CompressedPayload that wasn't
+                 accepted or None if all of them were dispatched.
+        """
+        accepted = 0
+        for part, end in self.split_records(self.encode_records(records)):
+            payload = self.compress(self.payload_chunks(part))
+            try:
+                dispatched = self.dispatch_payload(part, payload)
+            except PayloadRejected as error:
+                logger.error(
+                    "[%s] Dropped %s records rejected by Datadog: %s",
+                    self.name,
+                    len(part),
+                    error,
+                )
+                dispatched = True
+            if not dispatched:
+                return accepted, payload
+            accepted = end
+        return len(records), None
+
+    def dispatch_payload(
+        self, records: List[bytes], payload: CompressedPayload
+    ) -> bool:
+        """
+        Dispatching of a single payload must be implemented individually.
         """
         raise NotImplementedError(
             "Use concrete Sender implementation."
         )  # pragma: no cover
 
-    def _post_to_datadog(self, message: bytes, dd_endpoint: str) -> bool:
+    def encode_records(self, records: List[Any]) -> List[Optional[bytes]]:
         """
-        Implements actual HTTPS interaction with Datadog.
+        Encodes prepared records to bytes. Records that are prepared as
+        bytes already are returned as they are.
 
-        On message 202 Accepted returns True, on any other message or
-        RequestsException returns False and logs an error message.
+        Args:
+            records: List of prepared to dispatch records.
+        Returns: List of records as bytes or None for dropped records.
+        """
+        return records
 
-        Arg:
-            message: Compressed message to sent.
+    @staticmethod
+    def payload_chunks(records: List[bytes]) -> Iterator[bytes]:
+        """
+        Payload format must be implemented individually.
+        """
+        raise NotImplementedError(
+            "Use concrete Sender implementation."
+        )  # pragma: no cover
+
+    def split_records(
+        self, records: List[Optional[bytes]]
+    ) -> Iterator[Tuple[List[bytes], int]]:
+        """
+        Splits records into parts, which payloads don't exceed
+        `self.payload_size` bytes. Dropped records, which are None, are
+        skipped.
+
+        Every record takes its own size and a size of a separator.
+
+        Args:
+            records: List of encoded records as bytes or None.
+        Returns: Iterator over tuples of a list of records and an index of
+                 a record that follows the last one of them.
+        """
+        part: List[bytes] = []
+        part_size = self.PAYLOAD_OVERHEAD
+        for index, record in enumerate(records):
+            if record is None:
+                continue
+            record_size = len(record) + 2
+            if self.PAYLOAD_OVERHEAD + record_size > self.payload_size:
+                logger.warning(
+                    "[%s] Dropped a record of %s bytes: it exceeds a payload size.",
+                    self.name,
+                    len(record),
+                )
+                continue
+            if part and part_size + record_size > self.payload_size:
+                yield part, index
+                part = []
+                part_size = self.PAYLOAD_OVERHEAD
+            part.append(record)
+            part_size += record_size
+        if part:
+            yield part, len(records)
+
+    def _post(
+        self, message: Iterable[bytes], dd_endpoint: str, encoding: str
+    ) -> requests.Response:
+        """
+        Sends a message to Datadog via an acquired long-lived session.
+
+        Args:
+            message: Compressed message to send.
             dd_endpoint: Datadog endpoint where we should send a message.
-        Return: Bool that shows whether the message was accepted.
+            encoding: Content-Encoding of a message.
+        Returns: Datadog response.
         """
+        session = self.acquire_session(self.datadog_url, self.concurrency)
         try:
-            dd_response = requests.post(
+            return session.post(
                 f"{self.datadog_url}/{dd_endpoint}",
                 params={"api_key": self.api_key},
                 data=message,
                 headers={
                     "Content-Type": "application/json",
-                    "Content-Encoding": "deflate",
+                    "Content-Encoding": encoding or self.compressor.encoding,
                 },
                 timeout=self.timeout,
             )
-            if dd_response.status_code not in [200, 202]:
+        finally:
+            self.release_session(session)
+
+    @staticmethod
+    def _is_dropped(error: RequestsConnectionError) -> bool:
+        """
+        Checks whether a request failed because an established connection
+        was closed, e.g. with RemoteDisconnected, rather than because
+        a connection couldn't be established at all.
+
+        Args:
+            error: ConnectionError raised by `requests`.
+        Returns: Whether a request can be sent again.
+        """
+        return bool(error.args) and isinstance(error.args[0], ProtocolError)
+
+    @staticmethod
+    def _rewind(message: Iterable[bytes]) -> bool:
+        """
+        Prepares a message to be sent once again.
+
+        Args:
+            message: Compressed message that was already sent.
+        Returns: Whether a message can be sent once again.
+        """
+        if isinstance(message, (bytes, CompressedPayload)):
+            return True
+        if hasattr(message, "seek"):
+            message.seek(0)  # type: ignore
+            return True
+        return False
+
+    def _post_to_datadog(
+        self, message: Iterable[bytes], dd_endpoint: str, encoding: str = ""
+    ) -> bool:
+        """
+        Implements actual HTTPS interaction with Datadog.
+
+        On message 202 Accepted returns True, on any other message or
+        RequestsException returns False and logs an error message.
+
+        If Datadog rejects a payload permanently, with a 4xx status that
+        isn't one of RETRYABLE_STATUSES, it raises PayloadRejected instead.
+
+        Message is sent via a long-lived session of a Datadog host. If
+        a connection fails, the session is reset, so the next dispatch
+        doesn't try to reuse stale connections. If a reused connection
+        was closed by the server, a message is sent once again.
+
+        Arg:
+            message: Compressed message to sent as bytes or as an iterable
+                     of compressed chunks.
+            dd_endpoint: Datadog endpoint where we should send a message.
+            encoding: Content-Encoding of a message. By default it's
+                      an encoding of a configured compressor.
+        Return: Bool that shows whether the message was accepted.
+        Raises:
+            PayloadRejected: If a message is never going to be accepted.
+        """
+        try:
+            try:
+                dd_response = self._post(message, dd_endpoint, encoding)
+            except RequestsConnectionError as error:
+                if not self._is_dropped(error) or not self._rewind(message):
+                    raise
+                # Datadog could close a pooled keep-alive connection right
+                # when it was reused, so a request is sent once again.
+                logger.warning(
+                    "[%s] Connection to %s was closed: %s. Retrying once.",
+                    self.name,
+                    self.datadog_url,
+                    error,
+                )
+                self.reset_session(self.datadog_url)
+                dd_response = self._post(message, dd_endpoint, encoding)
+            status_code = dd_response.status_code
+            if status_code not in [200, 202]:
                 logger.error(
                     "[%s] Unexpected response from Datadog: %s: %s",
                     self.name,
-                    dd_response.status_code,
+                    status_code,
                     dd_response.text,
                 )
+                permanent = status_code not in self.RETRYABLE_STATUSES
+                if 400 <= status_code < 500 and permanent:
+                    raise PayloadRejected(f"{status_code}: {dd_response.text}")
                 return False
         except (RequestException, IOError) as error:
+            if isinstance(error, RequestsConnectionError):
+                self.reset_session(self.datadog_url)
             logger.error(
                 "[%s] Could not dispatch metrics to %s due to an HTTP error: %s",
                 self.name,
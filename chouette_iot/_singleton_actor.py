@@ -2,17 +2,33 @@
 SingletonActor class.
 """
 import logging
-from threading import RLock
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock, RLock
+from typing import Any, Dict, Hashable, Optional, Set
 
+from chouette_iot_client import ChouetteClient  # type: ignore
 from pykka import ActorRef, ActorRegistry, ThreadingActor  # type: ignore
 
 from chouette_iot import Scheduler
+from chouette_iot._runtime import AsyncioRuntime
 
 __all__ = ["SingletonActor", "VitalActor"]
 
 logger = logging.getLogger("chouette-iot")
 
 
+class TickState:
+    """
+    Coalescing state of a single actor: its pending periodic messages and
+    a number of skipped ticks.
+    """
+
+    def __init__(self):
+        self.lock = Lock()
+        self.pending: Set[Hashable] = set()
+        self.skipped = 0
+
+
 class SingletonActor(ThreadingActor):
     """
     SingletonActor is a wrapper around pykka actor objects.
@@ -20,13 +36,32 @@ class SingletonActor(ThreadingActor):
     In Chouette workflow we normally use just one instance of an actor.
     SingletonActor is able to return an ActorRef of a running instance
     of its class or to start a new instance and return its ActorRef.
+
+    Periodic messages are sent via `tick`, that coalesces ticks: a message
+    is not sent while an identical one is pending or in progress, so a
+    busy actor doesn't get a pile of identical jobs in its mailbox.
+    Every actor keeps its own coalescing state, so actors never wait for
+    each other's locks.
+
+    If `runtime` is set, new actors are run as tasks of its event loop
+    instead of their own threads.
     """
 
+    dedicated_worker: bool = False
     lock: RLock = RLock()
+    runtime: Optional[AsyncioRuntime] = None
+    tick_states: Dict[str, TickState] = {}
+    # Skipped ticks self metrics are sent by their own thread, so Redis
+    # writes never delay the scheduler thread:
+    self_metrics = ThreadPoolExecutor(
+        max_workers=1, thread_name_prefix="chouette-tick-metrics"
+    )
 
     def __init__(self):
         super().__init__()
         self.name = self.__class__.__name__
+        self.ticks = TickState()
+        self.tick_states[self.actor_urn] = self.ticks
 
     @classmethod
     def get_instance(cls) -> ActorRef:
@@ -42,6 +77,115 @@ class SingletonActor(ThreadingActor):
                 return instances.pop()
             return cls.start()
 
+    @classmethod
+    def tick(
+        cls, actor_ref: ActorRef, message: Hashable, send_self_metrics: bool = False
+    ) -> bool:
+        """
+        Sends a periodic message to an actor unless an identical message
+        is still pending in its mailbox or in progress.
+
+        Skipped ticks are counted per actor and, if it's requested, sent
+        as a `chouette.skipped_ticks` self metric.
+
+        Messages to actors that are not SingletonActors are sent as is.
+
+        Args:
+            actor_ref: ActorRef of an actor to send a message to.
+            message: Hashable message to send.
+            send_self_metrics: Whether a skipped tick should be sent as
+                               a self metric.
+        Returns: Whether a message was sent.
+        """
+        ticks = cls.tick_states.get(actor_ref.actor_urn)
+        if ticks is None:
+            actor_ref.tell(message)
+            return True
+        actor_name = actor_ref.actor_class.__name__
+        with ticks.lock:
+            if message in ticks.pending:
+                ticks.skipped += 1
+                skipped = ticks.skipped
+            else:
+                ticks.pending.add(message)
+                skipped = 0
+        if skipped:
+            logger.warning(
+                "[%s] Previous '%s' message is not processed yet. "
+                "Skipped %s ticks so far.",
+                actor_name,
+                message,
+                skipped,
+            )
+            if send_self_metrics:
+                cls.self_metrics.submit(
+                    ChouetteClient.count,
+                    "chouette.skipped_ticks",
+                    1,
+                    tags={"actor": actor_name},
+                )
+            return False
+        try:
+            actor_ref.tell(message)
+        except Exception:
+            with ticks.lock:
+                ticks.pending.discard(message)
+            raise
+        return True
+
+    @staticmethod
+    def _create_actor_inbox() -> Any:
+        """
+        Creates an inbox of a runtime if it's set or a pykka one otherwise.
+
+        Returns: Actor inbox.
+        """
+        if SingletonActor.runtime is not None:
+            return SingletonActor.runtime.create_inbox()
+        return ThreadingActor._create_actor_inbox()
+
+    def _start_actor_loop(self) -> None:
+        """
+        Starts an actor as a task of a runtime if it's set or as a thread
+        otherwise.
+        """
+        if self.runtime is not None:
+            self.runtime.start_actor(self)
+        else:
+            super()._start_actor_loop()
+
+    def _handle_receive(self, message: Any) -> Any:
+        """
+        Handles a message by pykka means. If it was a tick, marks it as
+        processed, so the next tick of the same message can be sent.
+
+        Only the actor's own thread discards its pending ticks, so other
+        messages are handled without taking a lock.
+
+        Args:
+            message: Any message.
+        Returns: Result of a message handling.
+        """
+        try:
+            return super()._handle_receive(message)
+        finally:
+            try:
+                is_tick = message in self.ticks.pending
+            except TypeError:
+                is_tick = False
+            if is_tick:
+                with self.ticks.lock:
+                    self.ticks.pending.discard(message)
+
+    def _stop(self) -> None:
+        """
+        Stops an actor by pykka means and forgets its coalescing state.
+        """
+        try:
+            super()._stop()
+        finally:
+            self.tick_states.pop(self.actor_urn, None)
+
     def on_failure(
         self, exception_type: str, exception_value: str, traceback
     ) -> None:  # pragma: no cover
@@ -20,17 +20,35 @@ class ChouetteConfig(BaseSettings):
 
     api_key: str
     global_tags: List[str]
+    adaptive_bulk_size: bool = False
     collector_plugins: List[str] = []
     aggregate_interval: int = 10
+    aggregate_processes: int = 0
+    aggregate_streaming: bool = False
     capture_interval: int = 30
+    circuit_breaker: bool = False
+    circuit_max_backoff: int = 960
+    compression: str = "deflate"
+    compression_level: str = ""
     datadog_url: str = "https://api.datadoghq.com/api"
+    dispatch_concurrency: int = 1
     datadog_logs_url: str = "https://http-intake.logs.datadoghq.com"
+    drain_mode: bool = False
     host: str = ""
     log_level: str = "INFO"
+    log_record_size: int = 1000000
     log_ttl: int = 64800
+    logs_payload_size: int = 5000000
     metrics_bulk_size: int = 10000
+    metrics_payload_size: int = 3200000
     metric_ttl: int = 14400
     metrics_wrapper: str = "datadog"
+    min_bulk_size: int = 100
+    outbox_path: str = ""
+    outbox_size: int = 52428800
     release_interval: int = 60
+    runtime: str = "threading"
+    runtime_workers: int = 2
     send_self_metrics: bool = True
+    storage_workers: int = 1
     chouette_storage_type: str = "redis"
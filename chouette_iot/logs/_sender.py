@@ -3,12 +3,12 @@ LogsSender actor.
 """
 import json
 import logging
-import zlib
-from typing import Any, List, Iterable
+from typing import Any, List, Iterable, Iterator, Optional
 
 from chouette_iot_client import ChouetteClient  # type: ignore
 
-from chouette_iot._sender import Sender
+from chouette_iot._sender import CompressedPayload, Sender
+from chouette_iot.storage.codecs import CodecsFactory
 
 __all__ = ["LogsSender"]
 
@@ -23,15 +23,23 @@ class LogsSender(Sender):
     records, compress them and dispatch to Datadog API.
     """
 
+    ENDPOINT = "v1/input"
+    ENCODINGS = {"deflate", "gzip"}
+    TRUNCATED_MARK = "...TRUNCATED"
+
     def __init__(self):
         """
         Next configuration is being extracted from ChouetteConfig:
 
         * api_key: Datadog API key.
         * datadog_url: Datadog URL. It has a default value 'datadog_logs_url'.
+        * log_record_size: Maximum size of a single log record. Datadog
+            truncates log entries bigger than 1MB.
         * log_ttl: Datadog drops outdated logs, so we clean them before
             sending data. This option says how many seconds is considered
             being "outdated". Logs older than TTL are being dropped.
+        * payload_size: Maximum size of an uncompressed logs request.
+            Datadog rejects payloads bigger than 5MB.
         * tags: List of global tags to add to every log. Should have
             something that gives you a chance to understand what device
             send these logs.
@@ -41,6 +49,8 @@ class LogsSender(Sender):
         super().__init__()
         self.bulk_size = 500
         self.datadog_url = self.config.datadog_logs_url
+        self.payload_size = self.config.logs_payload_size
+        self.record_size = self.config.log_record_size
         self.ttl = self.config.log_ttl
 
     def on_receive(self, message: Any) -> bool:
@@ -55,19 +65,19 @@ class LogsSender(Sender):
 
     def add_global_tags(self, b_records: Iterable[bytes]) -> Iterable[dict]:
         """
-        Takes a bytes objects that is expected to represent a JSON object,
-        casts it to dict and adds global tags to it list of tags.
+        Takes a bytes objects that is expected to represent an encoded record,
+        decodes it to dict and adds global tags to it list of tags.
 
         Also it adds a "host" value if this value is specified.
 
         Args:
-            b_records: Bytes objects representing logs as JSON objects.
+            b_records: Bytes objects representing encoded logs.
         Returns: Iterable of dicts representing logs with updated tags.
         """
         for b_record in b_records:
             try:
-                d_log = json.loads(b_record)
-            except (TypeError, json.JSONDecodeError):
+                d_log = CodecsFactory.decode(b_record)
+            except (TypeError, ValueError):
                 continue
             tags = d_log.get("ddtags", []) + self.tags
             d_log["ddtags"] = ",".join(tags)
@@ -75,15 +85,18 @@ class LogsSender(Sender):
                 d_log["host"] = self.host
             yield d_log
 
-    def dispatch_to_datadog(self, records: List[dict]) -> bool:
+    def dispatch_payload(
+        self, records: List[bytes], payload: CompressedPayload
+    ) -> bool:
         """
         Dispatches logs to Datadog:
 
         https://docs.datadoghq.com/api/v1/logs/#send-logs
 
-        1. It takes the list of prepared logs.
-        3. Compresses it.
-        4. Tries to send it to Datadog.
+        1. It takes the list of encoded logs.
+        2. Concatenates them to a JSON list.
+        3. Sends a payload that compresses it chunk by chunk.
+        4. Reports a compression ratio of a dispatched payload.
 
         If Chouette is expected to send self metrics, as a side
         effect, this function sends 2 metrics:
@@ -91,20 +104,82 @@ class LogsSender(Sender):
         3. How many bytes were sent (if they were sent).
 
         Args:
-            records: List of prepared to dispatch logs.
+            records: List of encoded logs as bytes.
+            payload: CompressedPayload with these records.
         Returns: Whether these logs were accepted by Datadog.
         """
-        compressed_message: bytes = zlib.compress(json.dumps(records).encode())
         logs_num = len(records)
-        message_size = len(compressed_message)
+        logger.info("[%s] Dispatching %s logs.", self.name, logs_num)
+        dispatched = self._post_to_datadog(payload, self.ENDPOINT)
         logger.info(
-            "[%s] Dispatching %s logss. Sending around %s KBs of data.",
-            self.name,
-            logs_num,
-            int(message_size / 1024),
+            "[%s] Sent around %s KBs of data.", self.name, int(payload.size / 1024)
         )
-        dispatched = self._post_to_datadog(compressed_message, "v1/input")
+        if dispatched:
+            self.report_compression(payload, "logs")
         if dispatched and self.send_self_metrics:
             ChouetteClient.count("chouette.dispatched.logs.number", logs_num)
-            ChouetteClient.count("chouette.dispatched.logs.bytes", message_size)
+            ChouetteClient.count("chouette.dispatched.logs.bytes", payload.size)
         return dispatched
+
+    def encode_records(self, records: List[Optional[dict]]) -> List[Optional[bytes]]:
+        """
+        Encodes logs to JSON objects, truncating or dropping oversized ones.
+
+        Args:
+            records: List of prepared to dispatch logs or None.
+        Returns: List of encoded logs as bytes or None for dropped logs.
+        """
+        return [
+            None if record is None else self.encode_log(record) for record in records
+        ]
+
+    def encode_log(self, record: dict) -> Optional[bytes]:
+        """
+        Encodes a log to a JSON object.
+
+        If it's bigger than `self.record_size`, its message is truncated
+        and marked by a TRUNCATED_MARK. If it's still too big, it's dropped.
+
+        Args:
+            record: Prepared to dispatch log.
+        Returns: JSON object as bytes or None if a log was dropped.
+        """
+        b_record = json.dumps(record).encode()
+        message = record.get("message")
+        if len(b_record) > self.record_size and isinstance(message, str):
+            # Encoded message takes `len(json.dumps(message))` bytes of a log.
+            allowed = self.record_size - len(b_record) + len(json.dumps(message))
+            allowed -= len(self.TRUNCATED_MARK)
+            # Non ASCII characters take several bytes, so the longest
+            # message prefix that fits is searched for by a bisection.
+            low, high = 0, len(message)
+            while low < high:
+                middle = (low + high + 1) // 2
+                if len(json.dumps(message[:middle])) <= allowed:
+                    low = middle
+                else:
+                    high = middle - 1
+            record = {**record, "message": message[:low] + self.TRUNCATED_MARK}
+            b_record = json.dumps(record).encode()
+        if len(b_record) > self.record_size:
+            logger.warning(
+                "[%s] Dropped a log of %s bytes: it exceeds a log size.",
+                self.name,
+                len(b_record),
+            )
+            return None
+        return b_record
+
+    @staticmethod
+    def payload_chunks(records: List[bytes]) -> Iterator[bytes]:
+        """
+        Generates chunks of a JSON list of logs, one log at a time.
+
+        Args:
+            records: List of encoded logs as bytes.
+        Returns: Iterator over body chunks.
+        """
+        yield b"["
+        for number, record in enumerate(records):
+            yield b", " + record if number else record
+        yield b"]"
@@ -2,7 +2,11 @@
 MetricsAggregator actor
 """
 import logging
-from typing import Any, List, Tuple
+import multiprocessing
+import sys
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from typing import Any, Deque, Dict, Iterable, Iterator, List, Optional, Tuple
 
 from chouette_iot import ChouetteConfig
 from chouette_iot._singleton_actor import VitalActor
@@ -10,18 +14,47 @@ from chouette_iot.storage import StorageActor
 from chouette_iot.storage.messages import (
     CleanupOutdatedRecords,
     CollectKeys,
+    CollectRecords,
     CollectValues,
     DeleteRecords,
     StoreRecords,
 )
 from ._merger import MetricsMerger
 from ._metrics import WrappedMetric
-from .wrappers import WrappersFactory
+from .wrappers import MetricsWrapper, WrappersFactory
 
 __all__ = ["MetricsAggregator"]
 
 logger = logging.getLogger("chouette-iot")
 
+# Wrappers of aggregation worker processes by their names:
+_wrappers: Dict[str, Optional[MetricsWrapper]] = {}
+
+
+def wrap_records(
+    records: List[bytes], flush_interval: int, wrapper_name: str
+) -> List[WrappedMetric]:
+    """
+    Merges raw metrics records and wraps them with a MetricsWrapper.
+
+    It's executed by aggregation worker processes, so it takes raw bytes
+    and a wrapper name instead of a wrapper itself, and every process
+    creates its wrapper once.
+
+    Args:
+        records: List of bytes, presumably with metrics.
+        flush_interval: Aggregation interval in seconds.
+        wrapper_name: Name of a MetricsWrapper.
+    Returns: List of WrappedMetrics.
+    """
+    if wrapper_name not in _wrappers:
+        _wrappers[wrapper_name] = WrappersFactory.get_wrapper(wrapper_name)
+    wrapper = _wrappers[wrapper_name]
+    if not wrapper:
+        return []
+    merged_metrics = MetricsMerger.merge_metrics(records, flush_interval)
+    return list(wrapper.wrap_metrics(merged_metrics))
+
 
 class MetricsAggregator(VitalActor):
     """
@@ -46,18 +79,38 @@ class MetricsAggregator(VitalActor):
     intentionally has a blocking workflow based on `ask` patterns.
 
     If one aggregate call takes more than `flush_interval` to
-    finish, other calls will be queued in the actor's mailbox and
-    will be executed only when the first call is finished and processed
-    metrics are cleaned up from a storage.
+    finish, scheduled ticks are skipped until it's finished and processed
+    metrics are cleaned up from a storage, so identical calls don't pile
+    up in the actor's mailbox and don't rescan the same raw queue.
+
+    If `aggregate_streaming` option is set, MetricsAggregator doesn't
+    collect all the raw keys at once. Instead it walks the raw metrics
+    queue one `flush_interval` window at a time, so its memory usage is
+    bounded by the size of a single window and not by the size of the
+    whole backlog.
+
+    If `aggregate_processes` option is bigger than 0, merging and wrapping
+    of every group is done by a pool of worker processes, so this CPU work
+    doesn't compete for the GIL with other actors and several groups are
+    processed in parallel on multi-core devices. Groups are still stored
+    and cleaned up one by one in their order.
     """
 
+    # Aggregation of a big backlog takes long, so in an asyncio runtime
+    # MetricsAggregator has its own worker and doesn't starve other actors.
+    dedicated_worker = True
+
     def __init__(self):
         super().__init__()
         config = ChouetteConfig()
         self.flush_interval = config.aggregate_interval
+        self.streaming = config.aggregate_streaming
         self.ttl = config.metric_ttl
         self.metrics_wrapper = WrappersFactory.get_wrapper(config.metrics_wrapper)
+        self.pool: Optional[ProcessPoolExecutor] = None
+        self.processes = max(config.aggregate_processes, 0)
         self.storage = None
+        self.wrapper_name = config.metrics_wrapper
 
         if not self.metrics_wrapper:
             logger.warning(
@@ -85,11 +138,14 @@ class MetricsAggregator(VitalActor):
         Return: Whether all the raw metrics were processed and stored.
         """
         logger.debug("[%s] Cleaning up outdated raw metrics.", self.name)
-        self.storage = StorageActor.get_instance()
+        self.storage = StorageActor.get_storage()
         self._cleanup_outdated_raw_metrics(self.ttl)
         if not self.metrics_wrapper:
             return True
 
+        if self.streaming:
+            return self._process_groups(self._collect_windows())
+
         keys_and_ts = self._collect_raw_keys_and_timestamps()
         grouped_keys = MetricsMerger.group_metric_keys(keys_and_ts, self.flush_interval)
 
@@ -102,8 +158,15 @@ class MetricsAggregator(VitalActor):
                 self.flush_interval,
             )
 
-        processing_results = [self._process_metrics(keys) for keys in grouped_keys]
-        return all(processing_results)
+        groups = ((keys, self._collect_raw_records(keys)) for keys in grouped_keys)
+        return self._process_groups(groups)
+
+    def on_stop(self) -> None:
+        """
+        Shuts down aggregation worker processes if they were started.
+        """
+        self._drop_pool()
+        super().on_stop()
 
     def _cleanup_outdated_raw_metrics(self, ttl: int) -> bool:
         """
@@ -116,32 +179,225 @@ class MetricsAggregator(VitalActor):
         cleanup_request = CleanupOutdatedRecords("metrics", ttl=ttl, wrapped=False)
         return self.storage.ask(cleanup_request)
 
-    def _collect_raw_keys_and_timestamps(self) -> List[Tuple[bytes, float]]:
+    def _collect_windows(self) -> Iterator[Tuple[List[bytes], List[bytes]]]:
+        """
+        Streaming version of records collection.
+
+        It uses a cursor to walk the 'raw' metrics queue window by window:
+
+        1. Gets the oldest key that is not older than the cursor.
+        2. Calculates a `flush_interval` window this key belongs to.
+        3. Collects records of this window only and yields them.
+        4. Moves the cursor to the end of this window.
+
+        Windows are yielded one by one, so only windows that are being
+        processed are kept in memory.
+
+        Returns: Iterator over tuples (keys, records) of every window.
+        """
+        windows = 0
+        cursor: Optional[float] = None
+        while True:
+            oldest_key = self._collect_raw_keys_and_timestamps(amount=1, since=cursor)
+            if not oldest_key:
+                break
+            _, timestamp = oldest_key[0]
+            window_start = timestamp // self.flush_interval * self.flush_interval
+            cursor = window_start + self.flush_interval
+            keys_and_records = self._collect_raw_window(window_start, cursor)
+            keys = [key for key, _ in keys_and_records]
+            records = [record for _, record in keys_and_records if record]
+            yield keys, records
+            windows += 1
+
+        if windows:
+            logger.info(
+                "[%s] Processed %s windows of %s seconds.",
+                self.name,
+                windows,
+                self.flush_interval,
+            )
+
+    def _process_groups(
+        self, groups: Iterable[Tuple[List[bytes], List[bytes]]]
+    ) -> bool:
+        """
+        Processes groups of raw metrics records one by one or, if there are
+        aggregation worker processes, in a pipeline.
+
+        In a pipeline up to `processes` groups are merged and wrapped by
+        worker processes at the same time, while results of the oldest
+        group are stored and its raw metrics are cleaned up.
+
+        Args:
+            groups: Iterable of tuples (keys, records) of every group.
+        Returns: Whether all the raw metrics were processed and stored.
+        """
+        if not self.processes:
+            results = [self._process_records(keys, records) for keys, records in groups]
+            return all(results)
+        if not self.pool:
+            self.pool = self._create_pool()
+        results = []
+        in_flight: Deque[Tuple[List[bytes], List[bytes], Optional[Future]]] = deque()
+        for keys, records in groups:
+            in_flight.append((keys, records, self._submit_group(records)))
+            # Once the pool is dropped, the rest is processed by the actor:
+            while in_flight and (len(in_flight) >= self.processes or not self.pool):
+                results.append(self._store_group(*in_flight.popleft()))
+        while in_flight:
+            results.append(self._store_group(*in_flight.popleft()))
+        return all(results)
+
+    def _create_pool(self) -> Optional[ProcessPoolExecutor]:
+        """
+        Creates a pool of aggregation worker processes.
+
+        Workers are spawned, so they don't inherit threads of actors.
+        ProcessPoolExecutor accepts a multiprocessing context only since
+        Python 3.7, so on Python 3.6 workers use a default context.
+
+        Returns: ProcessPoolExecutor or None if it couldn't be created.
+                 Without a pool raw metrics are processed by the actor.
+        """
+        options: Dict[str, Any] = {}
+        if sys.version_info >= (3, 7):
+            options["mp_context"] = multiprocessing.get_context("spawn")
+        try:
+            return ProcessPoolExecutor(max_workers=self.processes, **options)
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(
+                "[%s] Could not create aggregation workers due to: '%s'. "
+                "Raw metrics are processed by the actor.",
+                self.name,
+                error,
+            )
+            return None
+
+    def _submit_group(self, records: List[bytes]) -> Optional[Future]:
+        """
+        Submits a group of raw metrics records to a worker process.
+
+        Args:
+            records: List of bytes, presumably with metrics.
+        Returns: Future of a list of WrappedMetrics or None if there is no
+                 pool to submit a group to.
+        """
+        if not self.pool:
+            return None
+        try:
+            return self.pool.submit(
+                wrap_records, records, self.flush_interval, self.wrapper_name
+            )
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(
+                "[%s] Could not submit raw metrics to an aggregation worker "
+                "due to: '%s'.",
+                self.name,
+                error,
+            )
+            self._drop_pool()
+            return None
+
+    def _drop_pool(self) -> None:
+        """
+        Shuts down a pool of worker processes. It's recreated on the next run.
+        """
+        if self.pool:
+            self.pool.shutdown(wait=False)
+            self.pool = None
+
+    def _store_group(
+        self, keys: List[bytes], records: List[bytes], future: Optional[Future]
+    ) -> bool:
+        """
+        Waits for a group to be wrapped by a worker process and stores it.
+
+        If a group wasn't submitted or a worker process failed, the group is
+        wrapped by the actor itself. After a failure the pool is dropped and
+        it is recreated on the next run.
+
+        Args:
+            keys: List of keys of the records to remove after processing.
+            records: List of bytes, presumably with metrics.
+            future: Future of a list of WrappedMetrics or None.
+        Returns: Whether metrics were processed and cleaned up.
+        """
+        if future is None:
+            return self._process_records(keys, records)
+        try:
+            wrapped_metrics = future.result()
+        except Exception as error:  # pylint: disable=broad-except
+            logger.warning(
+                "[%s] Aggregation worker failed due to: '%s'. "
+                "Wrapping %s raw metrics in the actor.",
+                self.name,
+                error,
+                len(records),
+            )
+            self._drop_pool()
+            return self._process_records(keys, records)
+        logger.info(
+            "[%s] Wrapped %s raw metrics into %s Wrapped Metrics.",
+            self.name,
+            len(records),
+            len(wrapped_metrics),
+        )
+        return self._store_wrapped_metrics(keys, wrapped_metrics)
+
+    def _collect_raw_keys_and_timestamps(
+        self,
+        amount: int = 0,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ) -> List[Tuple[bytes, float]]:
         """
-        Collects all the metric keys from the 'raw' metrics queue with
-        their timestamps.
+        Collects metric keys from the 'raw' metrics queue with
+        their timestamps. By default it collects all of them.
 
+        Args:
+            amount: Maximum number of keys to collect. 0 is all.
+            since: Minimal timestamp of keys to collect (inclusive).
+            until: Maximal timestamp of keys to collect (exclusive).
         Returns: List of tuples (key, metric timestamp).
         """
-        collect_keys_request = CollectKeys("metrics", wrapped=False)
+        collect_keys_request = CollectKeys(
+            "metrics", wrapped=False, amount=amount, since=since, until=until
+        )
         return self.storage.ask(collect_keys_request)
 
-    def _process_metrics(self, keys: List[bytes]) -> bool:
+    def _collect_raw_window(
+        self, since: float, until: float
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Collects metric keys with their records from the 'raw' metrics
+        queue for a single window of timestamps [since, until).
+
+        Args:
+            since: Window start timestamp (inclusive).
+            until: Window end timestamp (exclusive).
+        Returns: List of tuples (key, record).
+        """
+        collect_records_request = CollectRecords(
+            "metrics", wrapped=False, since=since, until=until
+        )
+        return self.storage.ask(collect_records_request)
+
+    def _process_records(self, keys: List[bytes], records: List[bytes]) -> bool:
         """
-        Processes metrics.
+        Processes raw metrics records.
 
-        1. Fetches metrics from a storage by their keys.
-        2. Merges them into a list of MergedMetric objects.
-        3. Casts these MergedMetrics into WrappedMetrics using logic
+        1. Merges them into a list of MergedMetric objects.
+        2. Casts these MergedMetrics into WrappedMetrics using logic
         of a specified MetricsWrapper.
-        4. Stores produced WrappedMetrics to a storage.
-        5. Removes original raw metrics from a storage.
+        3. Stores produced WrappedMetrics to a storage.
+        4. Removes original raw metrics from a storage.
 
         Args:
-            keys: List of metric keys to fetch data from a storage.
+            keys: List of keys of the records to remove after processing.
+            records: List of bytes, presumably with metrics.
         Returns: Whether metrics were processed and cleaned up.
         """
-        records = self._collect_raw_records(keys)
         merged_metrics = MetricsMerger.merge_metrics(records, self.flush_interval)
         logger.info(
             "[%s] Merged %s raw metrics into %s Merged Metrics.",
@@ -149,20 +405,34 @@ class MetricsAggregator(VitalActor):
             len(records),
             len(merged_metrics),
         )
-        wrapped_metrics = self.metrics_wrapper.wrap_metrics(merged_metrics)
+        wrapped_metrics = list(self.metrics_wrapper.wrap_metrics(merged_metrics))
         logger.info(
             "[%s] Wrapped %s Merged Metrics into %s Wrapped Metrics.",
             self.name,
             len(merged_metrics),
             len(wrapped_metrics),
         )
-        metrics_stored = self._store_wrapped_metrics(wrapped_metrics)
+        return self._store_wrapped_metrics(keys, wrapped_metrics)
+
+    def _store_wrapped_metrics(
+        self, keys: List[bytes], wrapped_metrics: List[WrappedMetric]
+    ) -> bool:
+        """
+        Stores WrappedMetrics to a storage and removes original raw metrics.
+
+        Args:
+            keys: List of keys of the raw records to remove.
+            wrapped_metrics: List of WrappedMetrics to store.
+        Returns: Whether metrics were stored and cleaned up.
+        """
+        store_request = StoreRecords("metrics", wrapped_metrics, wrapped=True)
+        metrics_stored = self.storage.ask(store_request)
         if not metrics_stored:
             logger.warning(
                 "[%s] Could not store %s Wrapped Metrics to a storage. "
                 "Raw metrics are not cleaned.",
                 self.name,
-                len(wrapped_metrics),
+                len(store_request.records),
             )
             return False
         cleaned_up = self._delete_raw_records(keys)
@@ -171,7 +441,7 @@ class MetricsAggregator(VitalActor):
                 "[%s] Wrapped metrics were stored, but %s raw metrics "
                 "were not cleaned up. Metrics can be duplicated!",
                 self.name,
-                len(records),
+                len(keys),
             )
         return metrics_stored and cleaned_up
 
@@ -186,17 +456,6 @@ class MetricsAggregator(VitalActor):
         collect_records_request = CollectValues("metrics", keys, wrapped=False)
         return self.storage.ask(collect_records_request)
 
-    def _store_wrapped_metrics(self, metrics: List[WrappedMetric]) -> bool:
-        """
-        Stores wrapped metrics to the 'wrapped' metrics queue.
-
-        Args:
-            metrics: List of WrappedMetric objects.
-        Returns: Whether storing was executed successfully.
-        """
-        store_request = StoreRecords("metrics", metrics, wrapped=True)
-        return self.storage.ask(store_request)
-
     def _delete_raw_records(self, keys: List[bytes]) -> bool:
         """
         Deletes raw metrics from the 'raw' metrics queue.
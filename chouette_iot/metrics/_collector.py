@@ -54,7 +54,7 @@ class MetricsCollector(VitalActor):
         if isinstance(message, StatsResponse):
             sender = message.producer
             logger.info("[%s] Storing collected stats from '%s'.", self.name, sender)
-            storage = StorageActor.get_instance()
+            storage = StorageActor.get_storage()
             storage.tell(StoreRecords("metrics", message.stats, wrapped=True))
         else:
             plugins = map(PluginsFactory.get_plugin, self.plugins)
@@ -1,11 +1,10 @@
 """
 MetricsMerger object that is used in the MetricsAggregator workflow.
 """
-import json
-from functools import reduce
 from itertools import groupby
-from typing import List, Iterable, Tuple
+from typing import Dict, List, Iterable, Tuple
 
+from chouette_iot.storage.codecs import CodecsFactory
 from ._metrics import MergedMetric
 
 __all__ = ["MetricsMerger"]
@@ -53,17 +52,25 @@ class MetricsMerger:
         Takes a list of bytes presumably representing JSON encoded raw
         metrics and tries to cast them to a list of MergedMetrics.
 
+        Metrics are merged in a single pass using a dict keyed by
+        MergedMetric id, so every id produces exactly one MergedMetric
+        regardless of the order of records in a storage. Values and
+        timestamps are appended in place to avoid copying lists on every
+        merge.
+
         Args:
-            records: List of bytes objects representing raw metrics as jsons.
+            records: List of bytes objects representing encoded raw metrics.
             interval: Flush interval value.
         Returns: List of MergedMetric objects.
         """
-        single_metrics = cls._cast_to_merged_metrics(records, interval)
-        grouped_metrics = groupby(single_metrics, lambda metric: metric.id)
-        merged_metrics = [
-            reduce(lambda a, b: a + b, metrics) for _, metrics in grouped_metrics
-        ]
-        return merged_metrics
+        merged_metrics: Dict[str, MergedMetric] = {}
+        for metric in cls._cast_to_merged_metrics(records, interval):
+            merged_metric = merged_metrics.get(metric.id)
+            if merged_metric is None:
+                merged_metrics[metric.id] = metric
+            else:
+                merged_metric += metric
+        return list(merged_metrics.values())
 
     @staticmethod
     def _cast_to_merged_metrics(
@@ -80,7 +87,7 @@ class MetricsMerger:
         """
         for record in records:
             try:
-                dict_metric = json.loads(record)
+                dict_metric = CodecsFactory.decode(record)
                 merged_metric = MergedMetric(
                     metric=dict_metric["metric"],
                     type=dict_metric["type"],
@@ -89,6 +96,6 @@ class MetricsMerger:
                     tags=dict_metric.get("tags"),
                     interval=interval,
                 )
-            except (json.JSONDecodeError, TypeError, KeyError):
+            except (ValueError, TypeError, KeyError):
                 continue
             yield merged_metric
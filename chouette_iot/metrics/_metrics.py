@@ -112,6 +112,24 @@ class MergedMetric(Metric):
             tags=self.tags,
         )
 
+    def __iadd__(self, other: "MergedMetric"):
+        """
+        In-place version of the Merge operation.
+
+        Instead of creating a new MergedMetric and copying values and
+        timestamps of both metrics, it extends this metric's lists with
+        values and timestamps of the other metric.
+
+        Args:
+            other: MergedMetric object to merge into this metric.
+        Returns: This metric with merged values and timestamps.
+        """
+        if self.id != other.id:
+            raise ValueError("Can't merge different metrics.")
+        self.values.extend(other.values)
+        self.timestamps.extend(other.timestamps)
+        return self
+
     def asdict(self):
         """
         Returns: Dict representation of the metric.
@@ -163,16 +181,19 @@ class WrappedMetric(Metric):
         Returns a dict form of the metric that is ready to be cast
         to JSON and stored for releasing.
 
+        Tags are always the last key, so MetricsSender can append global
+        tags to a stored JSON record without decoding it.
+
         Return: Dict that represents the metric.
         """
         dict_representation = {
             "metric": self.metric,
-            "tags": self.tags,
             "points": [[self.timestamp, self.value]],
             "type": self.type,
         }
         if self.interval:
             dict_representation.update({"interval": self.interval})
+        dict_representation.update({"tags": self.tags})
         return dict_representation
 
     def __hash__(self):
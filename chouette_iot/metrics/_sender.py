@@ -3,12 +3,12 @@ MetricsSender actor.
 """
 import json
 import logging
-import zlib
-from typing import Any, List, Iterable
+from typing import Any, List, Iterable, Iterator, Optional, Tuple
 
 from chouette_iot_client import ChouetteClient  # type: ignore
 
-from chouette_iot._sender import Sender
+from chouette_iot._sender import CompressedPayload, Sender
+from chouette_iot.storage.codecs import CodecsFactory
 from chouette_iot.storage.messages import GetQueueSize
 
 __all__ = ["MetricsSender"]
@@ -24,6 +24,9 @@ class MetricsSender(Sender):
     metrics, compress them and dispatch to Datadog API.
     """
 
+    ENDPOINT = "v1/series"
+    ENCODINGS = {"deflate", "gzip"}
+
     def __init__(self):
         """
         Next configuration is being extracted from ChouetteConfig:
@@ -36,6 +39,9 @@ class MetricsSender(Sender):
         * metric_ttl: Datadog drops outdated metric, so we clean them before
             sending data. This option says how many seconds is considered
             being "outdated". Metrics older than TTL are being dropped.
+        * payload_size: Maximum size of an uncompressed "series" request.
+            Datadog limits compressed payloads by 3.2MB, so an uncompressed
+            limit of the same size is always safe.
         * tags: List of global tags to add to every metric. Should have
             something that gives you a chance to understand what device
             send these metrics.
@@ -44,7 +50,11 @@ class MetricsSender(Sender):
         """
         super().__init__()
         self.bulk_size = self.config.metrics_bulk_size
+        self.payload_size = self.config.metrics_payload_size
         self.ttl = self.config.metric_ttl
+        # Global tags and host as JSON fragments to splice into records:
+        self.tags_json = ", ".join(json.dumps(tag) for tag in self.tags).encode()
+        self.host_json = f'"host": {json.dumps(self.host)}, '.encode()
 
     def on_receive(self, message: Any) -> bool:
         """
@@ -56,66 +66,90 @@ class MetricsSender(Sender):
         """
         return self.process_records("metrics")
 
-    def add_global_tags(self, b_records: Iterable[bytes]) -> Iterable[dict]:
+    def add_global_tags(self, b_records: Iterable[bytes]) -> Iterable[bytes]:
         """
-        Takes a bytes objects that is expected to represent a JSON object,
-        casts it to dict and adds global tags to it list of tags.
+        Takes a bytes objects that is expected to represent an encoded record
+        and adds global tags to it list of tags.
 
         Also it adds a "host" value if this value is specified.
 
+        WrappedMetrics are stored as JSON objects with "tags" as their last
+        key, so global tags and host are spliced into them as bytes without
+        decoding. Records in other formats are decoded, updated and encoded
+        to JSON.
+
         Args:
-            b_records: Bytes objects representing metrics as JSON objects.
-        Returns: Dicts representing metrics with updated tags.
+            b_records: Bytes objects representing encoded metrics.
+        Returns: JSON objects as bytes representing metrics with updated tags.
         """
         for b_record in b_records:
+            if self._is_spliceable(b_record):
+                yield self._splice_global_tags(b_record)
+                continue
             try:
-                d_metric = json.loads(b_record)
-            except (TypeError, json.JSONDecodeError):
+                d_metric = CodecsFactory.decode(b_record)
+                d_metric["tags"] = d_metric.get("tags", []) + self.tags
+            except (TypeError, ValueError, AttributeError):
                 continue
-            d_metric["tags"] = d_metric.get("tags", []) + self.tags
             if self.host:
                 d_metric["host"] = self.host
-            yield d_metric
+            yield json.dumps(d_metric).encode()
+
+    def dispatch_bulk(
+        self, records: List[bytes]
+    ) -> Tuple[int, Optional[CompressedPayload]]:
+        """
+        Dispatches metrics to Datadog as one or more "series" requests.
+
+        If Chouette is expected to send self metrics, as a side effect,
+        this function sends a metric that says how many messages are
+        queued to be dispatched this minute.
+
+        Args:
+            records: List of prepared to dispatch metrics as bytes.
+        Returns: Tuple of a number of leading metrics that were accepted
+                 by Datadog or dropped and a CompressedPayload that wasn't
+                 accepted or None.
+        """
+        # Send a 'chouette.queued.metrics' metric.
+        if self.send_self_metrics:
+            self.store_queue_size()
+        return super().dispatch_bulk(records)
 
-    def dispatch_to_datadog(self, records: List[dict]) -> bool:
+    def dispatch_payload(
+        self, records: List[bytes], payload: CompressedPayload
+    ) -> bool:
         """
         Dispatches metrics to Datadog as a "series" POST request.
 
         https://docs.datadoghq.com/api/v1/metrics/#submit-metrics
 
-        1. It takes the list of prepared metrics.
-        2. Casts it to a single "series" request.
-        3. Compresses it.
-        4. Tries to send it to Datadog.
+        1. It takes the list of prepared metrics as JSON objects.
+        2. Concatenates them to a single "series" request.
+        3. Sends a payload that compresses it chunk by chunk.
+        4. Reports a compression ratio of a dispatched payload.
 
         If Chouette is expected to send self metrics, as a side
-        effect, this function sends 3 metrics:
-        1. How many messages are queued to be dispatched this
-        minute.
-        2. How many metrics were sent (if they were sent).
-        3. How many bytes were sent (if they were sent).
+        effect, this function sends 2 metrics:
+        1. How many metrics were sent (if they were sent).
+        2. How many bytes were sent (if they were sent).
 
         Args:
-            records: List of prepared to dispatch metrics.
+            records: List of prepared to dispatch metrics as bytes.
+            payload: CompressedPayload with these records.
         Returns: Whether these metrics were accepted by Datadog.
         """
-        # Send a 'chouette.queued.metrics' metric.
-        if self.send_self_metrics:
-            self.store_queue_size()
-        series = json.dumps({"series": records})
-        compressed_message: bytes = zlib.compress(series.encode())
         metrics_num = len(records)
-        message_size = len(compressed_message)
+        logger.info("[%s] Dispatching %s metrics.", self.name, metrics_num)
+        dispatched = self._post_to_datadog(payload, self.ENDPOINT)
         logger.info(
-            "[%s] Dispatching %s metrics. Sending around %s KBs of data.",
-            self.name,
-            metrics_num,
-            int(message_size / 1024),
+            "[%s] Sent around %s KBs of data.", self.name, int(payload.size / 1024)
         )
-        dispatched = self._post_to_datadog(compressed_message, "v1/series")
+        if dispatched:
+            self.report_compression(payload, "metrics")
         if dispatched and self.send_self_metrics:
             ChouetteClient.count("chouette.dispatched.metrics.number", metrics_num)
-            ChouetteClient.count("chouette.dispatched.metrics.bytes", message_size)
+            ChouetteClient.count("chouette.dispatched.metrics.bytes", payload.size)
         return dispatched
 
     def store_queue_size(self) -> None:
@@ -133,3 +167,52 @@ class MetricsSender(Sender):
         queue_size = self.storage.ask(size_request)
         if queue_size > 0:
             ChouetteClient.gauge("chouette.queued.metrics", queue_size)
+
+    @staticmethod
+    def payload_chunks(records: List[bytes]) -> Iterator[bytes]:
+        """
+        Generates chunks of a "series" request body from JSON objects.
+
+        Args:
+            records: List of prepared to dispatch metrics as bytes.
+        Returns: Iterator over body chunks.
+        """
+        yield b'{"series": ['
+        for number, record in enumerate(records):
+            yield b", " + record if number else record
+        yield b"]}"
+
+    @staticmethod
+    def _is_spliceable(b_record: bytes) -> bool:
+        """
+        Checks whether a record is a JSON object with a list of tags as its
+        last key.
+
+        JSON strings can't contain unescaped quotes, so if there is no
+        `": ` sequence after the last `"tags": [`, tags are the last key.
+        Tags that contain this sequence just make a record not spliceable.
+
+        Args:
+            b_record: Stored record as bytes.
+        Returns: Whether global tags can be spliced into a record.
+        """
+        if not b_record or b_record[:1] != b"{" or b_record[-2:] != b"]}":
+            return False
+        tags_start = b_record.rfind(b'"tags": [')
+        return tags_start > 0 and b'": ' not in b_record[tags_start + 9 :]
+
+    def _splice_global_tags(self, b_record: bytes) -> bytes:
+        """
+        Appends global tags to the last key of a record and adds a host
+        as its first key.
+
+        Args:
+            b_record: JSON object with "tags" as its last key as bytes.
+        Returns: Updated JSON object as bytes.
+        """
+        if self.tags_json:
+            separator = b"" if b_record[-3:-2] == b"[" else b", "
+            b_record = b_record[:-2] + separator + self.tags_json + b"]}"
+        if self.host:
+            b_record = b"{" + self.host_json + b_record[1:]
+        return b_record
@@ -3,16 +3,23 @@ Concrete simplified implementation of a Datadog wrapper.
 """
 # pylint: disable=too-few-public-methods
 import math
-from itertools import chain
-from typing import Any, List, Set
+from typing import Any, Dict, List, Sequence, Set, Union
 
 from pydantic import BaseSettings  # type: ignore
 
+try:
+    import numpy
+except ImportError:  # pragma: no cover
+    numpy = None  # type: ignore
+
 from ._metrics_wrapper import MetricsWrapper
 from .._metrics import MergedMetric, WrappedMetric
 
 __all__ = ["DatadogWrapper"]
 
+# Values sorted by numpy or by a pure Python implementation.
+SortedValues = Union["numpy.ndarray", Sequence[float]]
+
 
 class DatadogWrapperConfig(BaseSettings):
     """
@@ -21,6 +28,7 @@ class DatadogWrapperConfig(BaseSettings):
 
     histogram_aggregates: List[str] = ["max", "median", "avg", "count"]
     histogram_percentiles: List[float] = [0.95]
+    histogram_vectorize_threshold: int = 1000
 
 
 class DatadogWrapper(MetricsWrapper):
@@ -47,6 +55,7 @@ class DatadogWrapper(MetricsWrapper):
 
     histogram_percentiles = DatadogWrapperConfig().histogram_percentiles
     histogram_aggregates = DatadogWrapperConfig().histogram_aggregates
+    histogram_vectorize_threshold = DatadogWrapperConfig().histogram_vectorize_threshold
 
     @classmethod
     def _wrap_metric(cls, merged_metric: MergedMetric) -> List[WrappedMetric]:
@@ -162,8 +171,12 @@ class DatadogWrapper(MetricsWrapper):
             merged_metric: MergedMetric to wrap.
         Returns: List of WrappedMetric produced by the wrapping method.
         """
+        values_set: Set[Any] = set()
         try:
-            values_set: Set[Any] = set(sum(merged_metric.values, []))
+            for values in merged_metric.values:
+                if not isinstance(values, list):
+                    raise TypeError("Set metric values must be lists.")
+                values_set.update(values)
             set_count_metric = cls._create_wrapped_metric(
                 metric_name=merged_metric.metric,
                 metric_type="count",
@@ -192,8 +205,8 @@ class DatadogWrapper(MetricsWrapper):
         Other metrics like `sum`, `min` or other percentiles can be
         configured via configuration mentioned above.
 
-        To avoid bringing Numpy just to calculate percentiles, a `_percentile`
-        method is used. In tests it provided the same values as numpy.
+        All the aggregates and percentiles are read from a single summary
+        of values that is calculated by the `_summarize` method.
 
         Args:
             merged_metric: MergedMetric to wrap.
@@ -202,49 +215,91 @@ class DatadogWrapper(MetricsWrapper):
         interval = float(merged_metric.interval)
         timestamp = min(merged_metric.timestamps)
         tags = merged_metric.tags
-        values = merged_metric.values
         name = merged_metric.metric
-        metrics_count = len(values)
-        metrics_to_generate = (
-            (f"{name}.avg", "gauge", sum(values) / metrics_count, None),
-            (f"{name}.count", "rate", metrics_count / interval, int(interval)),
-            (f"{name}.sum", "gauge", sum(values), None),
-            (f"{name}.min", "gauge", min(values), None),
-            (f"{name}.max", "gauge", max(values), None),
-            (f"{name}.median", "gauge", cls._percentile(values, 0.5), None),
-        )
-        percentiles_metrics_to_generate = (
-            (
-                f"{name}.{int(percentile * 100)}percentile",
-                "gauge",
-                cls._percentile(values, percentile),
-                None,
-            )
-            for percentile in cls.histogram_percentiles
+        summary = cls._summarize(merged_metric.values, cls.histogram_percentiles)
+        to_generate = (
+            (aggregate, "rate", value / interval, int(interval))
+            if aggregate == "count"
+            else (aggregate, "gauge", value, None)
+            for aggregate, value in summary.items()
         )
-        to_generate = chain(metrics_to_generate, percentiles_metrics_to_generate)
         generated_metrics = [
             cls._create_wrapped_metric(
-                metric_name, metric_type, timestamp, value, tags, interval,
+                f"{name}.{aggregate}",
+                metric_type,
+                timestamp,
+                value,
+                tags,
+                metric_interval,
             )
-            for metric_name, metric_type, value, interval in to_generate
-            if "percentile" in metric_name
-            or metric_name.split(".")[-1] in cls.histogram_aggregates
+            for aggregate, metric_type, value, metric_interval in to_generate
+            if "percentile" in aggregate or aggregate in cls.histogram_aggregates
         ]
         return generated_metrics
 
+    @classmethod
+    def _summarize(
+        cls, values: List[float], percentiles: List[float]
+    ) -> Dict[str, float]:
+        """
+        Calculates all the histogram aggregates and percentiles at once.
+
+        Values are sorted only once, then `min`, `max`, `median` and all
+        the percentiles are read from this sorted sequence.
+
+        If numpy is installed and there are at least
+        `histogram_vectorize_threshold` values, sorting, summing and
+        percentiles calculation are vectorized. Without numpy a pure Python
+        implementation is used, in tests it provided the same values as numpy.
+
+        Args:
+            values: List of float or integer values.
+            percentiles: List of percentiles to calculate.
+        Returns: Dict of aggregate values, e.g. {"avg": 1.5, "95percentile": 2}.
+        """
+        count = len(values)
+        sorted_values: SortedValues
+        if numpy is not None and count >= cls.histogram_vectorize_threshold:
+            sorted_values = numpy.sort(numpy.asarray(values))
+            total = sorted_values.sum().item()
+            minimum, maximum = sorted_values[0].item(), sorted_values[-1].item()
+            median, *percentiles_values = numpy.percentile(
+                sorted_values, [50] + [percent * 100 for percent in percentiles]
+            ).tolist()
+        else:
+            sorted_values = sorted(values)
+            total = sum(sorted_values)
+            minimum, maximum = sorted_values[0], sorted_values[-1]
+            median = cls._percentile(sorted_values, 0.5)
+            percentiles_values = [
+                cls._percentile(sorted_values, percent) for percent in percentiles
+            ]
+        summary = {
+            "avg": total / count,
+            "count": count,
+            "sum": total,
+            "min": minimum,
+            "max": maximum,
+            "median": median,
+        }
+        for percent, value in zip(percentiles, percentiles_values):
+            summary[f"{int(percent * 100)}percentile"] = value
+        return summary
+
     @staticmethod
-    def _percentile(data_set: List[float], percent: float) -> float:
+    def _percentile(sorted_ds: SortedValues, percent: float) -> float:
         """
         Since we just need to calculate percentile and median and we don't
         want to bring the whole numpy here for this task.
 
+        Values must be already sorted, so that a number of percentiles can
+        be calculated for the same data set without sorting it again.
+
         Args:
-            data_set: List of float or integer values.
+            sorted_ds: Sorted sequence or numpy array of float values.
             percent: What percentile should be returned.
         return: Float value of a percentile.
         """
-        sorted_ds = sorted(data_set)
         idx = (len(sorted_ds) - 1) * percent
         if idx % 1 == 0:
             return sorted_ds[int(idx)]
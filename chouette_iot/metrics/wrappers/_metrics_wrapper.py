@@ -3,7 +3,8 @@ MetricsWrapper abstract class.
 """
 # pylint: disable=too-few-public-methods
 from abc import ABC, abstractmethod
-from typing import Dict, List
+from itertools import chain
+from typing import Dict, Iterable, Iterator, List
 
 from .._metrics import MergedMetric, WrappedMetric
 
@@ -19,19 +20,25 @@ class MetricsWrapper(ABC):
     """
 
     @classmethod
-    def wrap_metrics(cls, merged_metrics: List[MergedMetric]) -> List[WrappedMetric]:
+    def wrap_metrics(
+        cls, merged_metrics: Iterable[MergedMetric]
+    ) -> Iterator[WrappedMetric]:
         """
         This is the only public method of a MetricsWrapper.
 
-        It should take merged "raw" metrics and provide a list of wrapped
-        metrics ready to be sent to Datadog.
+        It should take merged "raw" metrics and provide an iterator over
+        wrapped metrics ready to be sent to Datadog.
+
+        Wrapped metrics are generated lazily one MergedMetric at a time,
+        so they can be passed straight to a StoreRecords message without
+        building and concatenating intermediate lists.
 
         Args:
-            merged_metrics: List of MergedMetric objects with raw metrics.
-        Returns: List of WrappedMetric objects ready to be sent to Datadog.
+            merged_metrics: Iterable of MergedMetric objects with raw metrics.
+        Returns: Iterator over WrappedMetric objects ready to be sent to Datadog.
         """
-        metrics = [cls._wrap_metric(metric) for metric in merged_metrics]
-        return sum(metrics, [])
+        metrics = (cls._wrap_metric(metric) for metric in merged_metrics)
+        return chain.from_iterable(metrics)
 
     @classmethod
     @abstractmethod
@@ -1,6 +1,7 @@
 """
 chouette.storage
 """
+from ._router import StorageRouter
 from ._storage import StorageActor
 
-__all__ = ["StorageActor"]
+__all__ = ["StorageActor", "StorageRouter"]
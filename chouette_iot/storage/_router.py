@@ -0,0 +1,177 @@
+"""
+Router of storage messages to a pool of StorageActor workers.
+"""
+import itertools
+import logging
+from threading import RLock
+from typing import Any, Dict, List, Optional
+
+from pykka import ActorRef, Future, Timeout  # type: ignore
+
+from .messages import StoreRecords
+
+__all__ = ["StorageRouter"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class StorageRouter:
+    """
+    StorageRouter routes storage messages to a pool of StorageActor workers.
+
+    It can be used instead of a StorageActor ActorRef, since it supports
+    `ask` and `tell` requests.
+
+    StoreRecords messages only append records with unique keys, so they
+    are routed to the least busy worker: a worker with the fewest
+    StoreRecords messages in flight. All the other messages of a queue
+    (collections, deletions and cleanups) are always routed to the same
+    worker, so their order is preserved. Queues get workers in turns when
+    they are seen for the first time, so independent queues (metrics and
+    logs, raw and wrapped) are processed in parallel as long as there are
+    enough workers.
+    """
+
+    def __init__(self, workers: List[ActorRef]):
+        """
+        Args:
+            workers: ActorRefs of StorageActor workers.
+        """
+        self.counter = itertools.count()
+        self.in_flight: Dict[str, List[Future]] = {
+            worker.actor_urn: [] for worker in workers
+        }
+        self.lock = RLock()
+        self.name = "StorageRouter"
+        self.queue_workers: Dict[str, ActorRef] = {}
+        self.workers = workers
+
+    def ask(
+        self, message: Any, block: bool = True, timeout: Optional[float] = None
+    ) -> Any:
+        """
+        Sends a message to a worker of its queue and waits for a reply.
+
+        Args:
+            message: Storage message.
+            block: Whether to block while waiting for a reply.
+            timeout: Seconds to wait for a reply.
+        Returns: Reply or a future of a reply if `block` is False.
+        """
+        if isinstance(message, StoreRecords):
+            future = self.store(message)
+            return future.get(timeout=timeout) if block else future
+        return self.route(message).ask(message, block=block, timeout=timeout)
+
+    def tell(self, message: Any) -> None:
+        """
+        Sends a message to a worker of its queue.
+
+        Args:
+            message: Storage message.
+        """
+        if isinstance(message, StoreRecords):
+            self.store(message)
+        else:
+            self.route(message).tell(message)
+
+    def store(self, message: StoreRecords) -> Future:
+        """
+        Sends a StoreRecords message to the least busy worker and keeps
+        a future of its reply while the message is in flight.
+
+        Args:
+            message: StoreRecords message.
+        Returns: Future of a reply.
+        """
+        with self.lock:
+            worker = self.get_free_worker()
+            future = worker.ask(message, block=False)
+            self.in_flight[worker.actor_urn].append(future)
+        return future
+
+    def is_alive(self) -> bool:
+        """
+        Returns: Whether all the workers are alive.
+        """
+        return all(worker.is_alive() for worker in self.workers)
+
+    def stop(self, block: bool = True, timeout: Optional[float] = None) -> None:
+        """
+        Stops all the workers.
+
+        Args:
+            block: Whether to block until workers are stopped.
+            timeout: Seconds to wait for every worker.
+        """
+        for worker in self.workers:
+            worker.stop(block=block, timeout=timeout)
+
+    def route(self, message: Any) -> ActorRef:
+        """
+        Picks a worker for a message.
+
+        StoreRecords messages are routed to the least busy worker. Other
+        messages are routed to a worker of their queue and messages without
+        a queue are routed to the first worker.
+
+        Args:
+            message: Storage message.
+        Returns: ActorRef of a worker.
+        """
+        if isinstance(message, StoreRecords):
+            return self.get_free_worker()
+        data_type = getattr(message, "data_type", None)
+        if data_type is None:
+            return self.workers[0]
+        queue_type = "wrapped" if getattr(message, "wrapped", False) else "raw"
+        return self.get_queue_worker(f"chouette:{data_type}:{queue_type}")
+
+    def get_queue_worker(self, queue_name: str) -> ActorRef:
+        """
+        Returns a worker of a queue. A queue that is seen for the first time
+        gets the next worker in turns.
+
+        Args:
+            queue_name: Name of a queue.
+        Returns: ActorRef of a worker that processes a queue.
+        """
+        with self.lock:
+            if queue_name not in self.queue_workers:
+                index = len(self.queue_workers) % len(self.workers)
+                self.queue_workers[queue_name] = self.workers[index]
+            return self.queue_workers[queue_name]
+
+    def get_free_worker(self) -> ActorRef:
+        """
+        Picks a worker with the fewest StoreRecords messages in flight.
+        Workers are checked starting from the next one every time, so idle
+        workers get messages in turns.
+
+        Returns: ActorRef of a worker.
+        """
+        with self.lock:
+            for futures in self.in_flight.values():
+                futures[:] = [future for future in futures if not is_done(future)]
+            start = next(self.counter) % len(self.workers)
+            workers = self.workers[start:] + self.workers[:start]
+            return min(
+                workers, key=lambda worker: len(self.in_flight[worker.actor_urn])
+            )
+
+
+def is_done(future: Future) -> bool:
+    """
+    Checks whether a worker has replied to a message without waiting.
+
+    Args:
+        future: Future of a reply.
+    Returns: Whether there is a reply or an exception.
+    """
+    try:
+        future.get(timeout=0)
+    except Timeout:
+        return False
+    except Exception:  # pylint: disable=broad-except
+        return True
+    return True
@@ -3,14 +3,18 @@ Actor that handles all interactions with the Redis storage.
 """
 # pylint: disable=too-few-public-methods
 import logging
-from typing import Any, Union
+from typing import Any, Optional, Union
+
+from pykka import ActorRef, ActorRegistry  # type: ignore
 
 from chouette_iot import ChouetteConfig
 from chouette_iot._singleton_actor import SingletonActor
+from ._router import StorageRouter
 from .engines import EnginesFactory
 from .messages import (
     CleanupOutdatedRecords,
     CollectKeys,
+    CollectRecords,
     CollectValues,
     DeleteRecords,
     GetQueueSize,
@@ -44,13 +48,60 @@ class StorageActor(SingletonActor):
 
     Is intentionally expected to be almost always used with `ask` pattern
     to ensure that consumers always execute their logic in a correct order.
+    That's why it needs a dedicated worker in an asyncio runtime.
+
+    If `storage_workers` option is bigger than 1 and a storage engine can be
+    used concurrently, `get_storage` returns a StorageRouter with a pool of
+    StorageActor workers instead of a single actor, so a big request to one
+    queue doesn't block requests to other queues.
     """
 
+    dedicated_worker = True
+    router: Optional[StorageRouter] = None
+
     def __init__(self):
         super().__init__()
         storage_type = ChouetteConfig().chouette_storage_type
         self.storage = EnginesFactory.get_engine(storage_type)
 
+    @classmethod
+    def get_storage(cls) -> Union[ActorRef, StorageRouter]:
+        """
+        Returns a running StorageRouter if there is a pool of workers or
+        a running instance of an actor otherwise, starting them if they
+        are not running.
+
+        Consumers of a storage should use it instead of `get_instance`,
+        that always returns a single actor.
+
+        Returns: ActorRef or StorageRouter.
+        """
+        with cls.lock:
+            if cls.router is not None and cls.router.is_alive():
+                return cls.router
+            instances = ActorRegistry.get_by_class(cls)
+            if instances and cls.router is None:
+                return instances.pop()
+            config = ChouetteConfig()  # type: ignore
+            workers = config.storage_workers
+            engine_class = EnginesFactory.get_engine_class(
+                config.chouette_storage_type
+            )
+            if workers > 1 and not engine_class.CONCURRENT:
+                logger.warning(
+                    "[%s] Storage type '%s' doesn't support several workers. "
+                    "Using one.",
+                    cls.__name__,
+                    config.chouette_storage_type,
+                )
+                workers = 1
+            if workers <= 1:
+                return cls.get_instance()
+            if cls.router is not None:
+                cls.router.stop(block=False)
+            cls.router = StorageRouter([cls.start() for _ in range(workers)])
+            return cls.router
+
     def on_receive(self, message: Any) -> Union[int, list, bool, None]:
         """
         Messages handling routine.
@@ -72,6 +123,9 @@ class StorageActor(SingletonActor):
         if isinstance(message, CollectKeys):
             return self.storage.collect_keys(message)
 
+        if isinstance(message, CollectRecords):
+            return self.storage.collect_records(message)
+
         if isinstance(message, CollectValues):
             return self.storage.collect_values(message)
 
@@ -0,0 +1,100 @@
+"""
+chouette.storage.codecs
+"""
+# pylint: disable=too-few-public-methods
+import logging
+from typing import Any, Dict, Type
+
+from pydantic import BaseSettings  # type: ignore
+
+from ._json_codec import JsonCodec
+from ._msgpack_codec import MsgPackCodec
+from ._record_codec import RecordCodec
+
+__all__ = ["CodecsFactory", "JsonCodec", "MsgPackCodec", "RecordCodec"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class CodecConfig(BaseSettings):
+    """
+    Record codec environment configuration object.
+    """
+
+    record_codec: str = "json"
+
+
+class CodecsFactory:
+    """
+    CodecsFactory creates record codecs and decodes records of any
+    known format by their tags.
+    """
+
+    codec_classes: Dict[str, Type[RecordCodec]] = {
+        "json": JsonCodec,
+        "msgpack": MsgPackCodec,
+    }
+    _decoders: Dict[bytes, RecordCodec] = {}
+
+    @classmethod
+    def get_codec(cls, codec_name: str = "") -> RecordCodec:
+        """
+        Takes a codec name and returns a codec instance.
+
+        If a name is not specified, it's taken from the `RECORD_CODEC`
+        environment variable. Default codec is JsonCodec. It's also used
+        if a codec can't be created, e.g. its package is not installed.
+
+        Args:
+            codec_name: Name of a codec as a string.
+        Returns: RecordCodec instance.
+        """
+        codec_name = codec_name or CodecConfig().record_codec
+        codec_class = cls.codec_classes.get(codec_name.lower(), JsonCodec)
+        try:
+            return codec_class()
+        except ImportError as error:
+            logger.warning(
+                "[CodecsFactory] Could not create '%s' codec due to: '%s'. "
+                "Using JSON.",
+                codec_name,
+                error,
+            )
+            return JsonCodec()
+
+    @classmethod
+    def decode(cls, record: bytes) -> Any:
+        """
+        Decodes a record with a codec that is determined by its tag.
+
+        Records without a known tag are decoded as JSON.
+
+        Args:
+            record: Encoded record as bytes.
+        Returns: Decoded object.
+        Raises: ValueError if a record can't be decoded.
+        """
+        tag = record[:1]
+        decoder = cls._decoders.get(tag)
+        if decoder is None:
+            decoder = cls._get_decoder(tag)
+            cls._decoders[tag] = decoder
+        return decoder.decode(record)
+
+    @classmethod
+    def _get_decoder(cls, tag: bytes) -> RecordCodec:
+        """
+        Creates a codec that decodes records with a specified tag.
+
+        Args:
+            tag: First byte of a record.
+        Returns: RecordCodec instance.
+        Raises: ValueError if this codec can't be created.
+        """
+        for codec_class in cls.codec_classes.values():
+            if codec_class.tag and codec_class.tag == tag:
+                try:
+                    return codec_class()
+                except ImportError as error:
+                    raise ValueError(f"Can't decode a record: {error}") from error
+        return JsonCodec()
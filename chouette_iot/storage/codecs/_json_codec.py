@@ -0,0 +1,41 @@
+"""
+Concrete implementation of a JSON record codec.
+"""
+import json
+from typing import Any
+
+from ._record_codec import RecordCodec
+
+__all__ = ["JsonCodec"]
+
+
+class JsonCodec(RecordCodec):
+    """
+    JsonCodec stores records as JSON objects.
+
+    Its tag is empty, because it's the format Chouette-IoT-Client uses, so
+    every record that has no tag is a JSON record.
+    """
+
+    tag = b""
+
+    def encode(self, data: Any) -> bytes:
+        """
+        Encodes data as JSON.
+
+        Args:
+            data: Dict or another object to encode.
+        Returns: JSON as bytes.
+        """
+        return json.dumps(data).encode()
+
+    def decode(self, record: bytes) -> Any:
+        """
+        Decodes a JSON record.
+
+        Args:
+            record: JSON as bytes.
+        Returns: Decoded object.
+        Raises: ValueError if a record is not a valid JSON.
+        """
+        return json.loads(record)
@@ -0,0 +1,56 @@
+"""
+Concrete implementation of a MessagePack record codec.
+"""
+from typing import Any
+
+try:
+    import msgpack  # type: ignore
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+from ._record_codec import RecordCodec
+
+__all__ = ["MsgPackCodec"]
+
+
+class MsgPackCodec(RecordCodec):
+    """
+    MsgPackCodec stores records as MessagePack objects.
+
+    MessagePack records are smaller than JSON ones and faster to encode
+    and decode. It requires an optional `msgpack` package.
+
+    Its tag is a 0x01 byte, that can't start a valid JSON.
+    """
+
+    tag = b"\x01"
+
+    def __init__(self):
+        if msgpack is None:
+            raise ImportError("MessagePack codec requires a 'msgpack' package.")
+
+    def encode(self, data: Any) -> bytes:
+        """
+        Encodes data as tagged MessagePack.
+
+        Args:
+            data: Dict or another object to encode.
+        Returns: Tagged MessagePack as bytes.
+        """
+        return self.tag + msgpack.packb(data, use_bin_type=True)
+
+    def decode(self, record: bytes) -> Any:
+        """
+        Decodes a tagged MessagePack record.
+
+        Args:
+            record: Tagged MessagePack as bytes.
+        Returns: Decoded object.
+        Raises: ValueError if a record is not a valid MessagePack.
+        """
+        if not record.startswith(self.tag):
+            raise ValueError("Record is not tagged as MessagePack.")
+        try:
+            return msgpack.unpackb(record[len(self.tag) :], raw=False)
+        except Exception as error:  # pylint: disable=broad-except
+            raise ValueError(f"Invalid MessagePack record: {error}") from error
@@ -0,0 +1,43 @@
+"""
+RecordCodec abstract class.
+"""
+from abc import ABC, abstractmethod
+from typing import Any
+
+__all__ = ["RecordCodec"]
+
+
+class RecordCodec(ABC):
+    """
+    RecordCodec encodes records to bytes before they are stored and decodes
+    them back after they are collected.
+
+    Every codec has a tag: a prefix of every record it encodes. It tells
+    which codec and which version of its format was used to encode a
+    record, so a queue can contain records encoded by different codecs.
+    """
+
+    tag: bytes = b""
+
+    @abstractmethod
+    def encode(self, data: Any) -> bytes:
+        """
+        Encodes data to tagged bytes.
+
+        Args:
+            data: Dict or another object to encode.
+        Returns: Encoded record as bytes.
+        """
+        raise NotImplementedError("Use a concrete RecordCodec class.")
+
+    @abstractmethod
+    def decode(self, record: bytes) -> Any:
+        """
+        Decodes a tagged record.
+
+        Args:
+            record: Encoded record as bytes.
+        Returns: Decoded object.
+        Raises: ValueError if a record can't be decoded.
+        """
+        raise NotImplementedError("Use a concrete RecordCodec class.")
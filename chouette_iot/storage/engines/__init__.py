@@ -4,7 +4,11 @@ Storage Engines Factory
 # pylint: disable=too-few-public-methods
 from typing import Dict, Type
 
+from ._memory_engine import MemoryEngine
 from ._redis_engine import RedisEngine
+from ._redis_streams_engine import RedisStreamsEngine
+from ._segment_log_engine import SegmentLogEngine
+from ._sqlite_engine import SQLiteEngine
 from ._storage_engine import StorageEngine
 
 __all__ = ["EnginesFactory"]
@@ -15,7 +19,26 @@ class EnginesFactory:
     Storage Engines factory tries to generate a specified storage engine.
     """
 
-    storage_classes: Dict[str, Type[StorageEngine]] = {"redis": RedisEngine}
+    storage_classes: Dict[str, Type[StorageEngine]] = {
+        "memory": MemoryEngine,
+        "redis": RedisEngine,
+        "redis-streams": RedisStreamsEngine,
+        "segment-log": SegmentLogEngine,
+        "sqlite": SQLiteEngine,
+    }
+
+    @classmethod
+    def get_engine_class(cls, storage_type: str) -> Type[StorageEngine]:
+        """
+        Takes a storage type string and returns a StorageEngine class.
+
+        Default engine class is RedisEngine.
+
+        Args:
+            storage_type: Engine type string.
+        Returns: StorageEngine class.
+        """
+        return cls.storage_classes.get(storage_type.lower(), RedisEngine)
 
     @classmethod
     def get_engine(cls, storage_type: str) -> StorageEngine:
@@ -29,6 +52,6 @@ class EnginesFactory:
             storage_type: Engine type string.
         Returns: StorageEngine object.
         """
-        engine_class = cls.storage_classes.get(storage_type.lower(), RedisEngine)
+        engine_class = cls.get_engine_class(storage_type)
         engine_instance = engine_class()
         return engine_instance
@@ -0,0 +1,420 @@
+"""
+Storage Engine for Memory storage type.
+"""
+import bisect
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Any, Deque, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseSettings
+from ._storage_engine import StorageEngine
+from ..codecs import CodecsFactory
+from ..messages import (
+    CleanupOutdatedRecords,
+    CollectKeys,
+    CollectRecords,
+    CollectValues,
+    DeleteRecords,
+    GetQueueSize,
+    StoreRecords,
+)
+
+__all__ = ["MemoryEngine"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class MemoryConfig(BaseSettings):
+    """
+    MemoryStorage environment configuration object.
+    Reads queues size cap and snapshotting settings from environment variables.
+    """
+
+    memory_queue_size: int = 100000
+    memory_snapshot_path: str = ""
+    memory_snapshot_interval: int = 60
+
+
+class MemoryQueue:
+    """
+    Time-ordered in-memory queue of encoded records.
+
+    Records are kept in a dict by their keys, their order is kept in a
+    deque of (timestamp, key) tuples. Records are usually stored in the
+    order of their timestamps, so they are appended to the deque. Deleted
+    keys are removed from the deque lazily.
+    """
+
+    def __init__(self, max_size: int):
+        """
+        Args:
+            max_size: Maximal number of records. The oldest records are
+                      dropped when it's exceeded.
+        """
+        self.max_size = max_size
+        self.records: Dict[bytes, Tuple[float, bytes]] = {}
+        self.order: Deque[Tuple[float, bytes]] = deque()
+        self.counter = 0
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def append(self, timestamp: float, value: bytes) -> int:
+        """
+        Adds a record to a queue keeping records ordered by timestamps.
+
+        Args:
+            timestamp: Record timestamp.
+            value: Encoded record.
+        Returns: Number of the oldest records dropped due to the size cap.
+        """
+        self.counter += 1
+        key = str(self.counter).encode()
+        self.records[key] = (timestamp, value)
+        if self.order and timestamp < self.order[-1][0]:
+            position = bisect.bisect_right(self.order, (timestamp, key))
+            self.order.insert(position, (timestamp, key))
+        else:
+            self.order.append((timestamp, key))
+        dropped = 0
+        while len(self.records) > self.max_size:
+            _, oldest_key = self.order.popleft()
+            if self.records.pop(oldest_key, None) is not None:
+                dropped += 1
+        return dropped
+
+    def delete(self, key: bytes) -> None:
+        """
+        Deletes a record. Its key is removed from the order deque lazily.
+
+        Args:
+            key: Record key.
+        """
+        self.records.pop(key, None)
+        while self.order and self.order[0][1] not in self.records:
+            self.order.popleft()
+        if len(self.order) > 2 * len(self.records) + 1000:
+            self.order = deque(item for item in self.order if item[1] in self.records)
+
+    def iterate(
+        self, since: Optional[float] = None, until: Optional[float] = None
+    ) -> Iterator[Tuple[bytes, float, bytes]]:
+        """
+        Iterates over records from the oldest one.
+
+        Args:
+            since: Optional minimal timestamp.
+            until: Optional timestamp that records should be older than.
+        Returns: Iterator over (key, timestamp, value) tuples.
+        """
+        for timestamp, key in self.order:
+            if until is not None and timestamp >= until:
+                return
+            if since is not None and timestamp < since:
+                continue
+            record = self.records.get(key)
+            if record:
+                yield key, timestamp, record[1]
+
+
+class MemoryEngine(StorageEngine):
+    """
+    Storage engine for Memory storage type.
+
+    Queues are kept in the process memory as time-ordered deques of
+    records that are already encoded to JSON, so storing and collecting
+    records doesn't need any network round trips.
+
+    Every queue is capped by `memory_queue_size` records. If
+    `memory_snapshot_path` is set, queues are saved to this file every
+    `memory_snapshot_interval` seconds and on stop, and are loaded from
+    it on start.
+    """
+
+    def __init__(self):
+        config = MemoryConfig()
+        self.max_size = config.memory_queue_size
+        self.snapshot_path = config.memory_snapshot_path
+        self.snapshot_interval = config.memory_snapshot_interval
+        self.queues: Dict[str, MemoryQueue] = {}
+        self.last_snapshot = time.time()
+        self.name = "MemoryEngine"
+        self.codec = CodecsFactory.get_codec()
+        if self.snapshot_path:
+            self._load_snapshot()
+
+    def stop(self) -> None:
+        """
+        Saves a snapshot if snapshotting is enabled.
+        """
+        if self.snapshot_path:
+            self._save_snapshot()
+
+    def cleanup_outdated(self, request: CleanupOutdatedRecords) -> bool:
+        """
+        Cleans up outdated records in a specified queue.
+
+        Args:
+            request: CleanupOutdated message with record type and TTL.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, queue = self._get_queue(request)
+        threshold = time.time() - request.ttl
+        outdated = []
+        for key, timestamp, _ in queue.iterate():
+            if timestamp > threshold:
+                break
+            outdated.append(key)
+        for key in outdated:
+            queue.delete(key)
+        logger.debug(
+            "[%s] Cleaned %s outdated records from a queue '%s'.",
+            self.name,
+            len(outdated),
+            queue_name,
+        )
+        self._snapshot_if_needed()
+        return True
+
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
+        """
+        Tries to collect keys from a specified queue.
+
+        Args:
+            request: CollectKeys message.
+        Returns: List of collected keys as tuples (key, timestamp).
+        """
+        queue_name, queue = self._get_queue(request)
+        keys = [
+            (key, timestamp) for key, timestamp, _ in self._iterate(queue, request)
+        ]
+        logger.debug(
+            "[%s] Collected %s keys from a queue '%s'.",
+            self.name,
+            len(keys),
+            queue_name,
+        )
+        return keys
+
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+
+        Args:
+            request: CollectRecords message.
+        Returns: List of tuples (key: bytes, value: Optional[bytes]).
+        """
+        queue_name, queue = self._get_queue(request)
+        records: List[Tuple[bytes, Optional[bytes]]] = [
+            (key, value) for key, _, value in self._iterate(queue, request)
+        ]
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(records),
+            queue_name,
+        )
+        return records
+
+    def collect_values(self, request: CollectValues) -> List[bytes]:
+        """
+        Tries to collect values by keys from a specified queue.
+
+        Args:
+            request: CollectValues message with specified keys.
+        Returns: List of collected values.
+        """
+        queue_name, queue = self._get_queue(request)
+        values = []
+        for key in request.keys:
+            record = queue.records.get(self._to_bytes(key))
+            if record:
+                values.append(record[1])
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(values),
+            queue_name,
+        )
+        return values
+
+    def delete_records(self, request: DeleteRecords) -> bool:
+        """
+        Deletes records with specified keys.
+
+        Args:
+            request: DeleteRecords message with specified keys.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, queue = self._get_queue(request)
+        for key in request.keys:
+            queue.delete(self._to_bytes(key))
+        logger.debug(
+            "[%s] Deleted %s records from a queue '%s'.",
+            self.name,
+            len(request.keys),
+            queue_name,
+        )
+        self._snapshot_if_needed()
+        return True
+
+    def get_queue_size(self, request: GetQueueSize) -> int:
+        """
+        Gets a size of a specified queue.
+
+        Args:
+            request: GetQueueSize message.
+        Returns: Size of a specified queue.
+        """
+        _, queue = self._get_queue(request)
+        return len(queue)
+
+    def store_records(self, request: StoreRecords) -> bool:
+        """
+        Stores received records to a queue.
+
+        If it can't cast one of the records to a dict via `asdict()` method,
+        it ignores this record and tries to store all other records.
+
+        Args:
+            request: StoreRecords with an iterable of suitable objects.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, queue = self._get_queue(request)
+        stored = 0
+        dropped = 0
+        for record in request.records:
+            try:
+                value = self.codec.encode(record.asdict())
+            except AttributeError:
+                continue
+            dropped += queue.append(record.timestamp, value)
+            stored += 1
+        if dropped:
+            logger.warning(
+                "[%s] Queue '%s' is full. Dropped %s oldest records.",
+                self.name,
+                queue_name,
+                dropped,
+            )
+        logger.debug(
+            "[%s] Stored %s/%s records to a queue '%s'.",
+            self.name,
+            stored,
+            len(request.records),
+            queue_name,
+        )
+        self._snapshot_if_needed()
+        return True
+
+    def _iterate(
+        self, queue: MemoryQueue, request: Any
+    ) -> Iterator[Tuple[bytes, float, bytes]]:
+        """
+        Iterates over records for CollectKeys and CollectRecords messages.
+
+        Args:
+            queue: Queue to iterate over.
+            request: CollectKeys or CollectRecords message.
+        Returns: Iterator over (key, timestamp, value) tuples.
+        """
+        records = queue.iterate(request.since, request.until)
+        for number, record in enumerate(records, 1):
+            yield record
+            if number == request.amount:
+                return
+
+    def _get_queue(self, request: Any) -> Tuple[str, MemoryQueue]:
+        """
+        Returns a queue name and a queue depending on a request.
+
+        Args:
+            request: One of `chouette.storage.messages` objects.
+        Return: Tuple of a queue name and a queue.
+        """
+        queue_type = "wrapped" if request.wrapped else "raw"
+        queue_name = f"chouette:{request.data_type}:{queue_type}"
+        if queue_name not in self.queues:
+            self.queues[queue_name] = MemoryQueue(self.max_size)
+        return queue_name, self.queues[queue_name]
+
+    def _snapshot_if_needed(self) -> None:
+        """
+        Saves a snapshot if it's enabled and its interval has passed.
+        """
+        if not self.snapshot_path:
+            return
+        if time.time() - self.last_snapshot >= self.snapshot_interval:
+            self._save_snapshot()
+
+    def _save_snapshot(self) -> None:
+        """
+        Saves all the queues to a snapshot file.
+
+        Snapshot is written to a temporary file that replaces the previous
+        snapshot, so a crash during writing doesn't corrupt it.
+        Records can be encoded by any codec, so their bytes are saved as
+        latin-1 strings, that map every byte to a single character.
+        """
+        self.last_snapshot = time.time()
+        snapshot = {
+            queue_name: [
+                [timestamp, value.decode("latin-1")]
+                for _, timestamp, value in queue.iterate()
+            ]
+            for queue_name, queue in self.queues.items()
+        }
+        temp_path = f"{self.snapshot_path}.tmp"
+        try:
+            with open(temp_path, "w") as snapshot_file:
+                json.dump(snapshot, snapshot_file)
+            os.replace(temp_path, self.snapshot_path)
+        except OSError as error:
+            logger.warning(
+                "[%s] Could not save a snapshot to '%s' due to: '%s'.",
+                self.name,
+                self.snapshot_path,
+                error,
+            )
+            return
+        logger.debug("[%s] Saved a snapshot to '%s'.", self.name, self.snapshot_path)
+
+    def _load_snapshot(self) -> None:
+        """
+        Loads queues from a snapshot file if it exists.
+        """
+        try:
+            with open(self.snapshot_path, "r") as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not load a snapshot from '%s' due to: '%s'.",
+                self.name,
+                self.snapshot_path,
+                error,
+            )
+            return
+        for queue_name, records in snapshot.items():
+            queue = MemoryQueue(self.max_size)
+            for timestamp, value in records:
+                queue.append(timestamp, value.encode("latin-1"))
+            self.queues[queue_name] = queue
+        logger.debug("[%s] Loaded a snapshot from '%s'.", self.name, self.snapshot_path)
+
+    @staticmethod
+    def _to_bytes(key: Any) -> bytes:
+        """
+        Casts a key to bytes, since keys are returned as bytes.
+
+        Args:
+            key: Key as bytes or as a string.
+        Return: Key as bytes.
+        """
+        return key if isinstance(key, bytes) else str(key).encode()
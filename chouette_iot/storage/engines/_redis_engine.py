@@ -1,19 +1,21 @@
 """
 Storage Engine for Redis storage type.
 """
-import json
 import logging
 import time
-from typing import Any, List, Tuple
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
 from uuid import uuid4
 
-from redis import Redis, RedisError
+from redis import ConnectionPool, Redis, RedisError
 
 from pydantic import BaseSettings
 from ._storage_engine import StorageEngine
+from ..codecs import CodecsFactory
 from ..messages import (
     CleanupOutdatedRecords,
     CollectKeys,
+    CollectRecords,
     CollectValues,
     DeleteRecords,
     GetQueueSize,
@@ -38,19 +40,108 @@ class RedisConfig(BaseSettings):
 class RedisEngine(StorageEngine):
     """
     Storage engine for Redis storage type.
+
+    Operations that touch both a queue's sorted set and its hash are
+    implemented as Lua scripts. They are executed entirely inside Redis,
+    so every such operation is atomic, takes a single round trip and
+    doesn't ship lists of keys over the socket.
+
+    Lua's `unpack` is limited by the Lua stack size, so scripts process
+    keys in chunks of 1000.
+
+    All the engines of the same Redis server share one ConnectionPool, so
+    several StorageActor workers can use Redis concurrently without opening
+    a connection per request.
+    """
+
+    CONCURRENT = True
+    pools: Dict[Tuple[str, int], ConnectionPool] = {}
+    pools_lock: Lock = Lock()
+
+    # KEYS: sorted set, hash. ARGV: threshold timestamp.
+    # Returns a number of deleted records.
+    CLEANUP_SCRIPT = """
+        local keys = redis.call('ZRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+        for i = 1, #keys, 1000 do
+            redis.call('HDEL', KEYS[2], unpack(keys, i, math.min(i + 999, #keys)))
+        end
+        redis.call('ZREMRANGEBYSCORE', KEYS[1], 0, ARGV[1])
+        return #keys
+    """
+
+    # KEYS: sorted set, hash. ARGV: min score, max score, amount (0 is all).
+    # Returns a flat list: key 1, value 1, key 2, value 2, etc.
+    COLLECT_SCRIPT = """
+        local keys
+        if tonumber(ARGV[3]) > 0 then
+            keys = redis.call(
+                'ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[2], 'LIMIT', 0, ARGV[3]
+            )
+        else
+            keys = redis.call('ZRANGEBYSCORE', KEYS[1], ARGV[1], ARGV[2])
+        end
+        local records = {}
+        for i = 1, #keys, 1000 do
+            local last = math.min(i + 999, #keys)
+            local values = redis.call('HMGET', KEYS[2], unpack(keys, i, last))
+            for j = 1, last - i + 1 do
+                records[#records + 1] = keys[i + j - 1]
+                records[#records + 1] = values[j]
+            end
+        end
+        return records
+    """
+
+    # KEYS: sorted set, hash. ARGV: keys to delete.
+    # Returns a number of keys to delete.
+    DELETE_SCRIPT = """
+        for i = 1, #ARGV, 1000 do
+            local last = math.min(i + 999, #ARGV)
+            redis.call('ZREM', KEYS[1], unpack(ARGV, i, last))
+            redis.call('HDEL', KEYS[2], unpack(ARGV, i, last))
+        end
+        return #ARGV
     """
 
     def __init__(self):
         config = RedisConfig()
-        self.redis = Redis(host=config.redis_host, port=config.redis_port)
+        pool = self.get_pool(config.redis_host, config.redis_port)
+        self.redis = Redis(connection_pool=pool)
         # Different versions of Redis use different HSET command formats:
         redis_version = self.redis.info().get("redis_version")
-        self.redis_version = int(redis_version.split(".")[0])
+        self.redis_version = tuple(
+            int(part) for part in redis_version.split(".")[:2]
+        )
         self.name = "RedisEngine"
+        self.codec = CodecsFactory.get_codec()
+        self.cleanup_script = self.redis.register_script(self.CLEANUP_SCRIPT)
+        self.collect_script = self.redis.register_script(self.COLLECT_SCRIPT)
+        self.delete_script = self.redis.register_script(self.DELETE_SCRIPT)
+
+    @classmethod
+    def get_pool(cls, host: str, port: int) -> ConnectionPool:
+        """
+        Returns a shared ConnectionPool of a Redis server, creating it
+        if it doesn't exist yet.
+
+        Args:
+            host: Redis host.
+            port: Redis port.
+        Returns: ConnectionPool object.
+        """
+        with cls.pools_lock:
+            pool = cls.pools.get((host, port))
+            if pool is None:
+                pool = ConnectionPool(host=host, port=port)
+                cls.pools[(host, port)] = pool
+            return pool
 
     def stop(self) -> None:
         """
         Tries to stop Redis connection.
+
+        A shared ConnectionPool isn't disconnected, since other engines
+        can still use it.
         """
         self.redis.close()
 
@@ -68,22 +159,18 @@ class RedisEngine(StorageEngine):
         queue_name, set_name, hash_name = self._get_queue_names(request)
         threshold = time.time() - request.ttl
         try:
-            outdated_keys = self.redis.zrangebyscore(set_name, 0, threshold)
-            if not outdated_keys:
+            cleaned = self.cleanup_script(keys=[set_name, hash_name], args=[threshold])
+            if not cleaned:
                 logger.debug(
                     "[%s] No outdated records to cleanup in a queue '%s'",
                     self.name,
                     queue_name,
                 )
                 return True
-            pipeline = self.redis.pipeline()
-            pipeline.zremrangebyscore(set_name, 0, threshold)
-            pipeline.hdel(hash_name, *outdated_keys)
-            pipeline.execute()
             logger.debug(
                 "[%s] Cleaned %s outdated records from a queue '%s'.",
                 self.name,
-                len(outdated_keys),
+                cleaned,
                 queue_name,
             )
         except RedisError as error:
@@ -96,7 +183,7 @@ class RedisEngine(StorageEngine):
             return False
         return True
 
-    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, int]]:
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
         """
         Tries to collect keys from a specified queue.
 
@@ -104,9 +191,10 @@ class RedisEngine(StorageEngine):
         * data_type - type of a queue, e.g.: 'metrics'.
         * wrapped - whether that's a queue of processed records or not.
         * amount - how many keys should be collected. 0 means `all of them`.
+        * since, until - optional range of timestamps [since, until).
 
         It returns a list of tuples with keys and their timestamps:
-        (key: bytes, timestamp: int).
+        (key: bytes, timestamp: float).
 
         Args:
             request: CollectKeys message.
@@ -114,7 +202,19 @@ class RedisEngine(StorageEngine):
         """
         queue_name, set_name, _ = self._get_queue_names(request)
         try:
-            keys = self.redis.zrange(set_name, 0, request.amount - 1, withscores=True)
+            if request.since is None and request.until is None:
+                keys = self.redis.zrange(
+                    set_name, 0, request.amount - 1, withscores=True
+                )
+            else:
+                keys = self.redis.zrangebyscore(
+                    set_name,
+                    "-inf" if request.since is None else request.since,
+                    "+inf" if request.until is None else f"({request.until}",
+                    start=0 if request.amount else None,
+                    num=request.amount if request.amount else None,
+                    withscores=True,
+                )
         except RedisError as error:
             logger.warning(
                 "[%s] Could not collect keys from a queue '%s' due to: '%s'.",
@@ -131,6 +231,50 @@ class RedisEngine(StorageEngine):
         )
         return keys
 
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+
+        Keys and values are collected by a single Lua script execution, so
+        it takes one round trip instead of ZRANGE and HMGET ones.
+
+        CollectRecords message has the same properties as CollectKeys:
+        * data_type - type of a queue, e.g.: 'metrics'.
+        * wrapped - whether that's a queue of processed records or not.
+        * amount - how many records should be collected. 0 means `all of them`.
+        * since, until - optional range of timestamps [since, until).
+
+        Args:
+            request: CollectRecords message.
+        Returns: List of tuples (key: bytes, value: Optional[bytes]).
+        """
+        queue_name, set_name, hash_name = self._get_queue_names(request)
+        args = [
+            "-inf" if request.since is None else request.since,
+            "+inf" if request.until is None else f"({request.until}",
+            request.amount,
+        ]
+        try:
+            flat_records = self.collect_script(keys=[set_name, hash_name], args=args)
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        records = list(zip(flat_records[::2], flat_records[1::2]))
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(records),
+            queue_name,
+        )
+        return records
+
     def collect_values(self, request: CollectValues) -> List[bytes]:
         """
         Tries to collect values by keys from a specified queue.
@@ -183,11 +327,8 @@ class RedisEngine(StorageEngine):
                 "[%s] Nothing to delete from a queue '%s'.", self.name, queue_name
             )
             return True
-        pipeline = self.redis.pipeline()
-        pipeline.zrem(set_name, *request.keys)
-        pipeline.hdel(hash_name, *request.keys)
         try:
-            pipeline.execute()
+            self.delete_script(keys=[set_name, hash_name], args=request.keys)
         except RedisError as error:
             logger.warning(
                 "[%s] Could not remove %s records from a queue '%s' due to: '%s'.",
@@ -246,12 +387,11 @@ class RedisEngine(StorageEngine):
         """
         queue_name, set_name, hash_name = self._get_queue_names(request)
         pipeline = self.redis.pipeline()
-        records_list = list(request.records)
         keys = {}
         values = {}
-        for record in records_list:
+        for record in request.records:
             try:
-                record_value = json.dumps(record.asdict())
+                record_value = self.codec.encode(record.asdict())
             except AttributeError:
                 continue
             record_key = str(uuid4())
@@ -265,7 +405,7 @@ class RedisEngine(StorageEngine):
             return True
         try:
             pipeline.zadd(set_name, mapping=keys)
-            if self.redis_version >= 4:
+            if self.redis_version >= (4, 0):
                 # From Redis 4.0.0 HMSET command is deprecated.
                 pipeline.hset(hash_name, mapping=values)
             else:
@@ -277,7 +417,7 @@ class RedisEngine(StorageEngine):
                 "[%s] Could not store %s/%s records to queue '%s' due to: '%s'.",
                 self.name,
                 stored_metrics,
-                len(records_list),
+                len(request.records),
                 queue_name,
                 error,
             )
@@ -286,7 +426,7 @@ class RedisEngine(StorageEngine):
             "[%s] Stored %s/%s records to a queue '%s'.",
             self.name,
             stored_metrics,
-            len(records_list),
+            len(request.records),
             queue_name,
         )
         return True
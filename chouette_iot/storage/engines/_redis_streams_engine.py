@@ -0,0 +1,375 @@
+"""
+Storage Engine for Redis Streams storage type.
+"""
+import logging
+import math
+import time
+from typing import Any, List, Optional, Tuple
+
+from redis import RedisError
+
+from ._redis_engine import RedisEngine
+from ..messages import (
+    CleanupOutdatedRecords,
+    CollectKeys,
+    CollectRecords,
+    CollectValues,
+    DeleteRecords,
+    GetQueueSize,
+    StoreRecords,
+)
+
+__all__ = ["RedisStreamsEngine"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class RedisStreamsEngine(RedisEngine):
+    """
+    Storage engine for Redis Streams storage type.
+
+    Queues that are written only by Chouette itself are stored as Redis
+    Streams named `chouette:{type}:{raw|wrapped}.stream`. Every record is
+    a single stream entry with `timestamp` and `value` fields, its key is
+    an auto-generated stream ID. Entries with the same fields are packed
+    together by Redis, so a record takes much less memory than a uuid4 key
+    in a sorted set plus a hash field.
+
+    Stream IDs are generated on insertion, so records are ordered, trimmed
+    and collected by timestamp ranges by the time they were stored, not by
+    their own timestamps.
+    Chouette stores wrapped records right after they were aggregated or
+    collected, so these times are close.
+
+    Queues that are written by applications via Chouette-IoT-Client keep
+    the sorted set and hash layout, since it's the format the client uses.
+    They are handled by the RedisEngine methods.
+    """
+
+    STREAM_QUEUES = ("chouette:metrics:wrapped",)
+
+    def __init__(self):
+        super().__init__()
+        self.name = "RedisStreamsEngine"
+        if self.redis_version < (5, 0):
+            raise RuntimeError(
+                "Storage type 'redis-streams' requires Redis 5.0 or newer, "
+                f"but Redis version is {'.'.join(map(str, self.redis_version))}."
+            )
+
+    def cleanup_outdated(self, request: CleanupOutdatedRecords) -> bool:
+        """
+        Cleans up outdated records in a specified queue.
+
+        Streams are trimmed with XTRIM MINID. Redis versions before 6.2
+        don't support it, so for them outdated IDs are found by XRANGE
+        and deleted by XDEL.
+
+        Args:
+            request: CleanupOutdated message with record type and TTL.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().cleanup_outdated(request)
+        threshold = int((time.time() - request.ttl) * 1000)
+        try:
+            if self.redis_version >= (6, 2):
+                cleaned = self.redis.xtrim(
+                    stream_name, minid=threshold, approximate=False
+                )
+            else:
+                outdated = self.redis.xrange(stream_name, "-", threshold)
+                ids = [entry_id for entry_id, _ in outdated]
+                cleaned = self.redis.xdel(stream_name, *ids) if ids else 0
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not cleanup records in a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Cleaned %s outdated records from a queue '%s'.",
+            self.name,
+            cleaned,
+            queue_name,
+        )
+        return True
+
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
+        """
+        Tries to collect keys from a specified queue.
+
+        Keys of stream queues are stream IDs. If `since` or `until` are
+        specified, entries are collected by the time they were stored.
+
+        Args:
+            request: CollectKeys message.
+        Returns: List of collected keys as tuples (key, timestamp).
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().collect_keys(request)
+        try:
+            entries = self._collect_entries(stream_name, request)
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not collect keys from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        keys = [(entry_id, float(fields[b"timestamp"])) for entry_id, fields in entries]
+        logger.debug(
+            "[%s] Collected %s keys from a queue '%s'.",
+            self.name,
+            len(keys),
+            queue_name,
+        )
+        return keys
+
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+
+        For stream queues it's a single XRANGE call.
+
+        Args:
+            request: CollectRecords message.
+        Returns: List of tuples (key: bytes, value: Optional[bytes]).
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().collect_records(request)
+        try:
+            entries = self._collect_entries(stream_name, request)
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        records = [(entry_id, fields.get(b"value")) for entry_id, fields in entries]
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(records),
+            queue_name,
+        )
+        return records
+
+    def collect_values(self, request: CollectValues) -> List[bytes]:
+        """
+        Tries to collect values by keys from a specified queue.
+
+        Keys are usually collected as a bulk of the oldest entries, so
+        for stream queues values are read by a single XRANGE call from
+        the smallest to the biggest requested ID.
+
+        Args:
+            request: CollectValues message with specified keys.
+        Returns: List of collected values.
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().collect_values(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] No keys were specified to collect values for a queue '%s'.",
+                self.name,
+                queue_name,
+            )
+            return []
+        keys = [self._to_bytes(key) for key in request.keys]
+        ids = sorted(keys, key=self._parse_id)
+        try:
+            entries = self.redis.xrange(stream_name, ids[0], ids[-1])
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        found = {entry_id: fields.get(b"value") for entry_id, fields in entries}
+        values: List[bytes] = [found[key] for key in keys if found.get(key)]
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(values),
+            queue_name,
+        )
+        return values
+
+    def delete_records(self, request: DeleteRecords) -> bool:
+        """
+        Tries to delete records with specified keys.
+
+        Args:
+            request: DeleteRecords message with specified keys.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().delete_records(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] Nothing to delete from a queue '%s'.", self.name, queue_name
+            )
+            return True
+        try:
+            self.redis.xdel(stream_name, *request.keys)
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not remove %s records from a queue '%s' due to: '%s'.",
+                self.name,
+                len(request.keys),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Deleted %s records from a queue '%s'.",
+            self.name,
+            len(request.keys),
+            queue_name,
+        )
+        return True
+
+    def get_queue_size(self, request: GetQueueSize) -> int:
+        """
+        Tried to get a size of a specified queue.
+
+        Args:
+            request: GetQueueSize message.
+        Returns: Size of a specified queue or -1 in case of error.
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().get_queue_size(request)
+        try:
+            queue_size = int(self.redis.xlen(stream_name))
+        except RedisError as error:
+            logger.warning(
+                "[%s] Could not calculate %s queue size due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return -1
+        return queue_size
+
+    def store_records(self, request: StoreRecords) -> bool:
+        """
+        Tries to store received records to a queue.
+
+        Every record is added to a stream by XADD with an auto-generated ID.
+        All XADD commands are sent in a single pipeline.
+
+        Args:
+            request: StoreRecords with an iterable of suitable objects.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name, stream_name = self._get_stream_name(request)
+        if not stream_name:
+            return super().store_records(request)
+        pipeline = self.redis.pipeline()
+        stored_metrics = 0
+        for record in request.records:
+            try:
+                record_value = self.codec.encode(record.asdict())
+            except AttributeError:
+                continue
+            fields = {"timestamp": record.timestamp, "value": record_value}
+            pipeline.xadd(stream_name, fields)
+            stored_metrics += 1
+        if not stored_metrics:
+            logger.debug(
+                "[%s] Nothing to store to a queue '%s'.", self.name, queue_name
+            )
+            return True
+        try:
+            pipeline.execute()
+        except (RedisError, TypeError) as error:
+            logger.warning(
+                "[%s] Could not store %s/%s records to queue '%s' due to: '%s'.",
+                self.name,
+                stored_metrics,
+                len(request.records),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Stored %s/%s records to a queue '%s'.",
+            self.name,
+            stored_metrics,
+            len(request.records),
+            queue_name,
+        )
+        return True
+
+    def _collect_entries(
+        self, stream_name: str, request: Any
+    ) -> List[Tuple[bytes, dict]]:
+        """
+        Collects the oldest stream entries for CollectKeys and CollectRecords.
+
+        A timestamps range [since, until) is translated to a range of
+        stream IDs, so Redis returns only entries stored within it and
+        no more than `amount` of them.
+
+        Args:
+            stream_name: Name of a stream to read.
+            request: CollectKeys or CollectRecords message.
+        Returns: List of tuples (entry ID, entry fields).
+        """
+        count = request.amount if request.amount else None
+        start = "-" if request.since is None else f"{int(request.since * 1000)}-0"
+        # An ID without a sequence number is the last ID of its millisecond:
+        end = "+" if request.until is None else f"{math.ceil(request.until * 1000) - 1}"
+        return self.redis.xrange(stream_name, start, end, count=count)
+
+    def _get_stream_name(self, request: Any) -> Tuple[str, Optional[str]]:
+        """
+        Generates a queue name and a stream name depending on a request.
+
+        Args:
+            request: One of `chouette.storage.messages` objects.
+        Return: Tuple of a queue name and a stream name. Stream name is None
+                if this queue is not stored as a stream.
+        """
+        queue_name, _, _ = self._get_queue_names(request)
+        if queue_name not in self.STREAM_QUEUES:
+            return queue_name, None
+        return queue_name, f"{queue_name}.stream"
+
+    @staticmethod
+    def _parse_id(entry_id: bytes) -> Tuple[int, ...]:
+        """
+        Parses a stream ID like b'1600000000000-0' to make IDs comparable.
+
+        Args:
+            entry_id: Stream ID as bytes.
+        Return: Tuple of integers (milliseconds, sequence number).
+        """
+        return tuple(int(part) for part in entry_id.split(b"-"))
+
+    @staticmethod
+    def _to_bytes(key: Any) -> bytes:
+        """
+        Casts a key to bytes, since Redis returns stream IDs as bytes.
+
+        Args:
+            key: Key as bytes or as a string.
+        Return: Key as bytes.
+        """
+        return key if isinstance(key, bytes) else str(key).encode()
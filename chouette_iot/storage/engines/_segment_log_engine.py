@@ -0,0 +1,619 @@
+"""
+Storage Engine for Segment Log storage type.
+"""
+import logging
+import mmap
+import os
+import struct
+import time
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+from pydantic import BaseSettings
+from ._storage_engine import StorageEngine
+from ..codecs import CodecsFactory
+from ..messages import (
+    CleanupOutdatedRecords,
+    CollectKeys,
+    CollectRecords,
+    CollectValues,
+    DeleteRecords,
+    GetQueueSize,
+    StoreRecords,
+)
+
+__all__ = ["SegmentLogEngine"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class SegmentLogConfig(BaseSettings):
+    """
+    SegmentLogStorage environment configuration object.
+    Reads a segments directory and a segment size from environment variables.
+    """
+
+    segments_path: str = "chouette-segments"
+    segment_size: int = 4 * 1024 * 1024
+
+
+class Segment:
+    """
+    Fixed-size memory-mapped segment file of a queue.
+
+    Every record is a header (status, timestamp, value length) followed
+    by a value. Records are appended one by one, unused space of a segment
+    is filled with zeros, so a zero status marks the end of records.
+    A value is written before its header, so a record that was written
+    partially is not live, and headers that don't fit into a segment mark
+    the end of records as well.
+
+    Deleted records are marked by their status byte. Segments only know
+    offsets and timestamps of their live records, values stay in the
+    mapped file.
+    """
+
+    HEADER = struct.Struct("<BdI")
+    LIVE = 1
+    DELETED = 2
+
+    def __init__(self, path: str, size: int = 0):
+        """
+        Args:
+            path: Path to a segment file.
+            size: Size of a new segment file. 0 opens an existing one.
+        """
+        self.path = path
+        if size:
+            with open(path, "wb") as segment_file:
+                segment_file.truncate(size)
+        with open(path, "r+b") as segment_file:
+            self.mmap = mmap.mmap(segment_file.fileno(), 0)
+        self.records: Dict[int, float] = {}
+        self.position = 0
+        self.max_timestamp = float("-inf")
+        self._scan()
+
+    def append(self, timestamp: float, value: bytes) -> Optional[int]:
+        """
+        Appends a record to a segment if it fits.
+
+        Args:
+            timestamp: Record timestamp.
+            value: Record value.
+        Returns: Record offset or None if a segment is full.
+        """
+        offset = self.position
+        end = offset + self.HEADER.size + len(value)
+        if end > len(self.mmap):
+            return None
+        self.mmap[offset + self.HEADER.size : end] = value
+        self.HEADER.pack_into(self.mmap, offset, self.LIVE, timestamp, len(value))
+        self.records[offset] = timestamp
+        self.position = end
+        self.max_timestamp = max(self.max_timestamp, timestamp)
+        return offset
+
+    def read(self, offset: int) -> Optional[bytes]:
+        """
+        Reads a value of a live record.
+
+        Args:
+            offset: Record offset.
+        Returns: Copy of a record value or None if there is no such live
+                 record.
+        """
+        if offset not in self.records:
+            return None
+        _, _, length = self.HEADER.unpack_from(self.mmap, offset)
+        start = offset + self.HEADER.size
+        return self.mmap[start : start + length]
+
+    def delete(self, offset: int) -> None:
+        """
+        Marks a record as deleted.
+
+        Args:
+            offset: Record offset.
+        """
+        if self.records.pop(offset, None) is not None:
+            self.mmap[offset] = self.DELETED
+
+    def flush(self) -> None:
+        """
+        Flushes changes of a mapped region to a segment file.
+        """
+        self.mmap.flush()
+
+    def close(self) -> None:
+        """
+        Closes a mapped region.
+        """
+        if not self.mmap.closed:
+            self.mmap.close()
+
+    def drop(self) -> None:
+        """
+        Closes a mapped region and removes a segment file.
+        """
+        self.close()
+        os.remove(self.path)
+
+    def _scan(self) -> None:
+        """
+        Reads records headers to find live records and an end of records.
+        """
+        while self.position + self.HEADER.size <= len(self.mmap):
+            status, timestamp, length = self.HEADER.unpack_from(
+                self.mmap, self.position
+            )
+            end = self.position + self.HEADER.size + length
+            if status not in (self.LIVE, self.DELETED) or end > len(self.mmap):
+                break
+            if status == self.LIVE:
+                self.records[self.position] = timestamp
+            self.max_timestamp = max(self.max_timestamp, timestamp)
+            self.position = end
+
+
+class SegmentLogEngine(StorageEngine):
+    """
+    Storage engine for Segment Log storage type.
+
+    Every queue is a directory with a series of fixed-size memory-mapped
+    segment files. Records are appended to the last segment and a new one
+    is created when it's full. Record keys are `{segment}:{offset}`.
+
+    Records are collected in the order they were stored, that for wrapped
+    metrics is close to the order of their timestamps. Segments know the
+    maximal timestamp of their records, so TTL cleanup removes whole
+    segment files. Segments without live records are removed as well.
+
+    Segment ids are never reused, even after all the segments of a queue
+    were removed, so keys collected before a removal never point to new
+    records. The next id of a queue is kept in its `next_segment` file.
+    """
+
+    NEXT_ID_FILE = "next_segment"
+
+    def __init__(self):
+        config = SegmentLogConfig()
+        self.path = config.segments_path
+        self.segment_size = config.segment_size
+        self.queues: Dict[str, Dict[int, Segment]] = {}
+        self.next_ids: Dict[str, int] = {}
+        self.name = "SegmentLogEngine"
+        self.codec = CodecsFactory.get_codec()
+
+    def stop(self) -> None:
+        """
+        Flushes and closes all opened segments.
+        """
+        for segments in self.queues.values():
+            for segment in segments.values():
+                if not segment.mmap.closed:
+                    segment.flush()
+                segment.close()
+        self.queues = {}
+        self.next_ids = {}
+
+    def cleanup_outdated(self, request: CleanupOutdatedRecords) -> bool:
+        """
+        Cleans up outdated records in a specified queue.
+
+        Segments with only outdated records are removed, outdated records
+        of other segments are marked as deleted.
+
+        Args:
+            request: CleanupOutdated message with record type and TTL.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        threshold = time.time() - request.ttl
+        cleaned = 0
+        try:
+            segments = self._get_segments(queue_name)
+            for segment_id, segment in list(segments.items()):
+                if segment.max_timestamp <= threshold:
+                    cleaned += len(segment.records)
+                    segments.pop(segment_id).drop()
+                    continue
+                outdated = [
+                    offset for offset, ts in segment.records.items() if ts <= threshold
+                ]
+                for offset in outdated:
+                    segment.delete(offset)
+                cleaned += len(outdated)
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not cleanup records in a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Cleaned %s outdated records from a queue '%s'.",
+            self.name,
+            cleaned,
+            queue_name,
+        )
+        return True
+
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
+        """
+        Tries to collect keys from a specified queue.
+
+        Args:
+            request: CollectKeys message.
+        Returns: List of collected keys as tuples (key, timestamp).
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            keys = [
+                (self._to_key(segment_id, offset), timestamp)
+                for segment_id, _, offset, timestamp in self._iterate(request)
+            ]
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not collect keys from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        logger.debug(
+            "[%s] Collected %s keys from a queue '%s'.",
+            self.name,
+            len(keys),
+            queue_name,
+        )
+        return keys
+
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+
+        Args:
+            request: CollectRecords message.
+        Returns: List of tuples (key: bytes, value: Optional[bytes]).
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            records = [
+                (self._to_key(segment_id, offset), segment.read(offset))
+                for segment_id, segment, offset, _ in self._iterate(request)
+            ]
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(records),
+            queue_name,
+        )
+        return records
+
+    def collect_values(self, request: CollectValues) -> List[bytes]:
+        """
+        Tries to collect values by keys from a specified queue.
+
+        Every value is a copy of a slice of a mapped segment, no files are
+        read.
+
+        Args:
+            request: CollectValues message with specified keys.
+        Returns: List of collected values.
+        """
+        queue_name = self._get_queue_name(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] No keys were specified to collect values for a queue '%s'.",
+                self.name,
+                queue_name,
+            )
+            return []
+        values = []
+        try:
+            segments = self._get_segments(queue_name)
+            for key in request.keys:
+                segment_id, offset = self._parse_key(key)
+                segment = segments.get(segment_id)
+                value = segment.read(offset) if segment else None
+                if value:
+                    values.append(value)
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(values),
+            queue_name,
+        )
+        return values
+
+    def delete_records(self, request: DeleteRecords) -> bool:
+        """
+        Tries to delete records with specified keys.
+
+        Records are marked as deleted. Segments that have no live records
+        after that are removed, except the last one that is still written.
+
+        Args:
+            request: DeleteRecords message with specified keys.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] Nothing to delete from a queue '%s'.", self.name, queue_name
+            )
+            return True
+        try:
+            segments = self._get_segments(queue_name)
+            touched = set()
+            for key in request.keys:
+                segment_id, offset = self._parse_key(key)
+                if segment_id in segments:
+                    segments[segment_id].delete(offset)
+                    touched.add(segment_id)
+            last_id = max(segments) if segments else None
+            for segment_id in touched:
+                segment = segments[segment_id]
+                if not segment.records and segment_id != last_id:
+                    segments.pop(segment_id).drop()
+                else:
+                    segment.flush()
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not remove %s records from a queue '%s' due to: '%s'.",
+                self.name,
+                len(request.keys),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Deleted %s records from a queue '%s'.",
+            self.name,
+            len(request.keys),
+            queue_name,
+        )
+        return True
+
+    def get_queue_size(self, request: GetQueueSize) -> int:
+        """
+        Tried to get a size of a specified queue.
+
+        Args:
+            request: GetQueueSize message.
+        Returns: Size of a specified queue or -1 in case of error.
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            segments = self._get_segments(queue_name)
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not calculate %s queue size due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return -1
+        return sum(len(segment.records) for segment in segments.values())
+
+    def store_records(self, request: StoreRecords) -> bool:
+        """
+        Tries to store received records to a queue.
+
+        Records are appended to the last segment of a queue. When it's
+        full, a new segment is created. Records bigger than a segment size
+        get a segment of their own size.
+
+        Args:
+            request: StoreRecords with an iterable of suitable objects.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        stored = 0
+        try:
+            segments = self._get_segments(queue_name)
+            touched = set()
+            for record in request.records:
+                try:
+                    value = self.codec.encode(record.asdict())
+                except AttributeError:
+                    continue
+                segment = segments[max(segments)] if segments else None
+                if not segment or segment.append(record.timestamp, value) is None:
+                    segment = self._create_segment(queue_name, len(value))
+                    segment.append(record.timestamp, value)
+                touched.add(segment)
+                stored += 1
+            for segment in touched:
+                segment.flush()
+        except (OSError, ValueError) as error:
+            logger.warning(
+                "[%s] Could not store %s/%s records to queue '%s' due to: '%s'.",
+                self.name,
+                stored,
+                len(request.records),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Stored %s/%s records to a queue '%s'.",
+            self.name,
+            stored,
+            len(request.records),
+            queue_name,
+        )
+        return True
+
+    def _iterate(self, request: Any) -> Iterator[Tuple[int, Segment, int, float]]:
+        """
+        Iterates over live records of a queue in the order they were stored.
+
+        Respects `amount`, `since` and `until` of CollectKeys and
+        CollectRecords messages.
+
+        Args:
+            request: CollectKeys or CollectRecords message.
+        Returns: Iterator over (segment id, segment, offset, timestamp).
+        """
+        since = float("-inf") if request.since is None else request.since
+        until = float("inf") if request.until is None else request.until
+        collected = 0
+        segments = self._get_segments(self._get_queue_name(request))
+        for segment_id in sorted(segments):
+            segment = segments[segment_id]
+            for offset, timestamp in segment.records.items():
+                if not since <= timestamp < until:
+                    continue
+                yield segment_id, segment, offset, timestamp
+                collected += 1
+                if collected == request.amount:
+                    return
+
+    def _get_segments(self, queue_name: str) -> Dict[int, Segment]:
+        """
+        Returns segments of a queue. Opens existing segment files on the
+        first access to a queue.
+
+        Empty segment files are left when a segment was created, but not
+        sized, e.g. because a disk is full. They have no records and can't
+        be mapped, so they are removed.
+
+        Args:
+            queue_name: Name of a queue.
+        Returns: Dict of segments by their ids.
+        """
+        if queue_name not in self.queues:
+            directory = self._get_directory(queue_name)
+            os.makedirs(directory, exist_ok=True)
+            segments = {}
+            for file_name in os.listdir(directory):
+                if not file_name.endswith(".seg"):
+                    continue
+                path = os.path.join(directory, file_name)
+                if not os.path.getsize(path):
+                    os.remove(path)
+                    continue
+                segments[int(file_name.split(".")[0])] = Segment(path)
+            self.queues[queue_name] = segments
+            self.next_ids[queue_name] = max(
+                self._read_next_id(directory), max(segments, default=-1) + 1
+            )
+        return self.queues[queue_name]
+
+    def _create_segment(self, queue_name: str, value_size: int) -> Segment:
+        """
+        Creates a new last segment of a queue.
+
+        The next segment id is saved before a segment file is created,
+        so an id is not reused even if Chouette stops right after that.
+
+        Args:
+            queue_name: Name of a queue.
+            value_size: Size of a value that should fit into a segment.
+        Returns: New segment.
+        """
+        segments = self._get_segments(queue_name)
+        segment_id = self.next_ids[queue_name]
+        directory = self._get_directory(queue_name)
+        self._write_next_id(directory, segment_id + 1)
+        self.next_ids[queue_name] = segment_id + 1
+        size = max(self.segment_size, Segment.HEADER.size + value_size)
+        path = os.path.join(directory, f"{segment_id:020d}.seg")
+        segment = Segment(path, size)
+        segments[segment_id] = segment
+        return segment
+
+    def _read_next_id(self, directory: str) -> int:
+        """
+        Reads the next segment id of a queue.
+
+        Args:
+            directory: Directory of a queue.
+        Returns: Next segment id or 0 if it wasn't saved.
+        """
+        try:
+            with open(os.path.join(directory, self.NEXT_ID_FILE)) as next_id_file:
+                return int(next_id_file.read())
+        except (OSError, ValueError):
+            return 0
+
+    def _write_next_id(self, directory: str, next_id: int) -> None:
+        """
+        Saves the next segment id of a queue. The file is replaced
+        atomically, so it's never read half-written.
+
+        Args:
+            directory: Directory of a queue.
+            next_id: Next segment id.
+        """
+        path = os.path.join(directory, self.NEXT_ID_FILE)
+        with open(f"{path}.tmp", "w") as next_id_file:
+            next_id_file.write(str(next_id))
+        os.replace(f"{path}.tmp", path)
+
+    def _get_directory(self, queue_name: str) -> str:
+        """
+        Generates a directory name for a queue.
+
+        Args:
+            queue_name: Name of a queue.
+        Returns: Path to a directory as a string.
+        """
+        return os.path.join(self.path, queue_name.replace(":", "."))
+
+    @staticmethod
+    def _to_key(segment_id: int, offset: int) -> bytes:
+        """
+        Generates a record key from its segment id and offset.
+
+        Args:
+            segment_id: Id of a segment.
+            offset: Record offset in a segment.
+        Returns: Key as bytes.
+        """
+        return f"{segment_id}:{offset}".encode()
+
+    @staticmethod
+    def _parse_key(key: Any) -> Tuple[int, int]:
+        """
+        Parses a record key into its segment id and offset.
+
+        Args:
+            key: Key as bytes or as a string.
+        Returns: Tuple of a segment id and an offset.
+        """
+        key = key.decode() if isinstance(key, bytes) else str(key)
+        segment_id, offset = key.split(":")
+        return int(segment_id), int(offset)
+
+    @staticmethod
+    def _get_queue_name(request: Any) -> str:
+        """
+        Generates a queue name depending on a request.
+
+        Args:
+            request: One of `chouette.storage.messages` objects.
+        Return: Queue name as a string.
+        """
+        queue_type = "wrapped" if request.wrapped else "raw"
+        return f"chouette:{request.data_type}:{queue_type}"
@@ -0,0 +1,427 @@
+"""
+Storage Engine for SQLite storage type.
+"""
+import logging
+import sqlite3
+import time
+from typing import Any, Iterator, List, Optional, Sequence, Tuple
+
+from pydantic import BaseSettings
+from ._storage_engine import StorageEngine
+from ..codecs import CodecsFactory
+from ..messages import (
+    CleanupOutdatedRecords,
+    CollectKeys,
+    CollectRecords,
+    CollectValues,
+    DeleteRecords,
+    GetQueueSize,
+    StoreRecords,
+)
+
+__all__ = ["SQLiteEngine"]
+
+logger = logging.getLogger("chouette-iot")
+
+
+class SQLiteConfig(BaseSettings):
+    """
+    SQLiteStorage environment configuration object.
+    Reads a path to a database file from environment variables if called.
+    """
+
+    sqlite_path: str = "chouette.sqlite3"
+
+
+class SQLiteEngine(StorageEngine):
+    """
+    Storage engine for SQLite storage type.
+
+    All the queues are stored in a single `records` table of a local
+    database file, that is indexed by (queue, timestamp). Record keys are
+    table row ids. Ids are AUTOINCREMENT ones and are never reused, so a key
+    collected by a Sender can't point to a new record after the old one was
+    deleted.
+
+    The database works in WAL mode, so writes don't block reads and every
+    transaction is a single append to the WAL file, which is gentle to
+    flash storage.
+
+    SQLite can't take more than 999 parameters in one statement in old
+    versions, so keys are processed in chunks of 500.
+    """
+
+    CHUNK_SIZE = 500
+    TABLE = (
+        "CREATE TABLE {} ("
+        "id INTEGER PRIMARY KEY AUTOINCREMENT, "
+        "queue TEXT NOT NULL, "
+        "timestamp REAL NOT NULL, "
+        "value BLOB NOT NULL)"
+    )
+
+    def __init__(self):
+        self.name = "SQLiteEngine"
+        config = SQLiteConfig()
+        # Connection is created by a thread that starts StorageActor and
+        # used by the actor's thread. The actor processes messages one
+        # by one, so the connection is never used concurrently.
+        self.db = sqlite3.connect(
+            config.sqlite_path, isolation_level=None, check_same_thread=False
+        )
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self._create_table()
+        self.db.execute(
+            "CREATE INDEX IF NOT EXISTS records_queue_timestamp "
+            "ON records (queue, timestamp)"
+        )
+        self.codec = CodecsFactory.get_codec()
+
+    def _create_table(self) -> None:
+        """
+        Creates a `records` table.
+
+        Tables created by older versions have ids that can be reused after
+        the last records were deleted. Their records are moved to a new
+        AUTOINCREMENT table in a single transaction.
+        """
+        row = self.db.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'records'"
+        ).fetchone()
+        if row is None:
+            self.db.execute(self.TABLE.format("records"))
+            return
+        if "AUTOINCREMENT" in row[0].upper():
+            return
+        with self.db:
+            self.db.execute("BEGIN")
+            self.db.execute("ALTER TABLE records RENAME TO records_old")
+            self.db.execute(self.TABLE.format("records"))
+            self.db.execute(
+                "INSERT INTO records (id, queue, timestamp, value) "
+                "SELECT id, queue, timestamp, value FROM records_old"
+            )
+            self.db.execute("DROP TABLE records_old")
+        logger.info("[%s] Migrated records to an AUTOINCREMENT table.", self.name)
+
+    def stop(self) -> None:
+        """
+        Tries to close a database connection.
+        """
+        self.db.close()
+
+    def cleanup_outdated(self, request: CleanupOutdatedRecords) -> bool:
+        """
+        Cleans up outdated records in a specified queue.
+
+        Cleanup is a single range delete over the (queue, timestamp) index.
+
+        Args:
+            request: CleanupOutdated message with record type and TTL.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        threshold = time.time() - request.ttl
+        try:
+            with self.db:
+                cursor = self.db.execute(
+                    "DELETE FROM records WHERE queue = ? AND timestamp <= ?",
+                    (queue_name, threshold),
+                )
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not cleanup records in a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Cleaned %s outdated records from a queue '%s'.",
+            self.name,
+            cursor.rowcount,
+            queue_name,
+        )
+        return True
+
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
+        """
+        Tries to collect keys from a specified queue.
+
+        Args:
+            request: CollectKeys message.
+        Returns: List of collected keys as tuples (key, timestamp).
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            rows = self._select(request, "id, timestamp")
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not collect keys from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        keys = [(self._to_key(row_id), timestamp) for row_id, timestamp in rows]
+        logger.debug(
+            "[%s] Collected %s keys from a queue '%s'.",
+            self.name,
+            len(keys),
+            queue_name,
+        )
+        return keys
+
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+
+        Args:
+            request: CollectRecords message.
+        Returns: List of tuples (key: bytes, value: Optional[bytes]).
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            rows = self._select(request, "id, value")
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        records: List[Tuple[bytes, Optional[bytes]]] = [
+            (self._to_key(row_id), bytes(value)) for row_id, value in rows
+        ]
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(records),
+            queue_name,
+        )
+        return records
+
+    def collect_values(self, request: CollectValues) -> List[bytes]:
+        """
+        Tries to collect values by keys from a specified queue.
+
+        Values are returned in the same order as their keys.
+
+        Args:
+            request: CollectValues message with specified keys.
+        Returns: List of collected values.
+        """
+        queue_name = self._get_queue_name(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] No keys were specified to collect values for a queue '%s'.",
+                self.name,
+                queue_name,
+            )
+            return []
+        ids = [int(key) for key in request.keys]
+        found = {}
+        try:
+            for chunk in self._chunks(ids):
+                placeholders = ", ".join("?" * len(chunk))
+                rows = self.db.execute(
+                    f"SELECT id, value FROM records "
+                    f"WHERE queue = ? AND id IN ({placeholders})",
+                    (queue_name, *chunk),
+                )
+                found.update(rows)
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not collect records from a queue '%s' due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return []
+        values = [bytes(found[row_id]) for row_id in ids if row_id in found]
+        logger.debug(
+            "[%s] Collected %s records from a queue '%s'.",
+            self.name,
+            len(values),
+            queue_name,
+        )
+        return values
+
+    def delete_records(self, request: DeleteRecords) -> bool:
+        """
+        Tries to delete records with specified keys in one transaction.
+
+        Args:
+            request: DeleteRecords message with specified keys.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        if not request.keys:
+            logger.debug(
+                "[%s] Nothing to delete from a queue '%s'.", self.name, queue_name
+            )
+            return True
+        ids = [int(key) for key in request.keys]
+        try:
+            with self.db:
+                self.db.execute("BEGIN")
+                for chunk in self._chunks(ids):
+                    placeholders = ", ".join("?" * len(chunk))
+                    self.db.execute(
+                        f"DELETE FROM records "
+                        f"WHERE queue = ? AND id IN ({placeholders})",
+                        (queue_name, *chunk),
+                    )
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not remove %s records from a queue '%s' due to: '%s'.",
+                self.name,
+                len(request.keys),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Deleted %s records from a queue '%s'.",
+            self.name,
+            len(request.keys),
+            queue_name,
+        )
+        return True
+
+    def get_queue_size(self, request: GetQueueSize) -> int:
+        """
+        Tried to get a size of a specified queue.
+
+        Args:
+            request: GetQueueSize message.
+        Returns: Size of a specified queue or -1 in case of error.
+        """
+        queue_name = self._get_queue_name(request)
+        try:
+            (queue_size,) = self.db.execute(
+                "SELECT COUNT(*) FROM records WHERE queue = ?", (queue_name,)
+            ).fetchone()
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not calculate %s queue size due to: '%s'.",
+                self.name,
+                queue_name,
+                error,
+            )
+            return -1
+        return queue_size
+
+    def store_records(self, request: StoreRecords) -> bool:
+        """
+        Tries to store received records to a queue.
+
+        All the records are inserted by a single `executemany` call in
+        one transaction.
+
+        If it can't cast one of the records to a dict via `asdict()` method,
+        it ignores this record and tries to store all other records.
+
+        Args:
+            request: StoreRecords with an iterable of suitable objects.
+        Returns: Boolean that says whether execution was successful.
+        """
+        queue_name = self._get_queue_name(request)
+        rows = []
+        for record in request.records:
+            try:
+                record_value = self.codec.encode(record.asdict())
+            except AttributeError:
+                continue
+            rows.append((queue_name, record.timestamp, record_value))
+        if not rows:
+            logger.debug(
+                "[%s] Nothing to store to a queue '%s'.", self.name, queue_name
+            )
+            return True
+        try:
+            with self.db:
+                self.db.execute("BEGIN")
+                self.db.executemany(
+                    "INSERT INTO records (queue, timestamp, value) VALUES (?, ?, ?)",
+                    rows,
+                )
+        except sqlite3.Error as error:
+            logger.warning(
+                "[%s] Could not store %s/%s records to queue '%s' due to: '%s'.",
+                self.name,
+                len(rows),
+                len(request.records),
+                queue_name,
+                error,
+            )
+            return False
+        logger.debug(
+            "[%s] Stored %s/%s records to a queue '%s'.",
+            self.name,
+            len(rows),
+            len(request.records),
+            queue_name,
+        )
+        return True
+
+    def _select(self, request: Any, columns: str) -> List[tuple]:
+        """
+        Selects the oldest records of a queue for CollectKeys and
+        CollectRecords messages.
+
+        Args:
+            request: CollectKeys or CollectRecords message.
+            columns: Columns to select.
+        Returns: List of selected rows.
+        """
+        query = f"SELECT {columns} FROM records WHERE queue = ?"
+        params: List[Any] = [self._get_queue_name(request)]
+        if request.since is not None:
+            query += " AND timestamp >= ?"
+            params.append(request.since)
+        if request.until is not None:
+            query += " AND timestamp < ?"
+            params.append(request.until)
+        query += " ORDER BY timestamp, id LIMIT ?"
+        params.append(request.amount if request.amount else -1)
+        return self.db.execute(query, params).fetchall()
+
+    @classmethod
+    def _chunks(cls, ids: Sequence[int]) -> Iterator[Sequence[int]]:
+        """
+        Splits a list of ids into chunks that fit into one statement.
+
+        Args:
+            ids: Sequence of row ids.
+        Returns: Iterator over chunks of ids.
+        """
+        for start in range(0, len(ids), cls.CHUNK_SIZE):
+            yield ids[start : start + cls.CHUNK_SIZE]
+
+    @staticmethod
+    def _to_key(row_id: int) -> bytes:
+        """
+        Casts a row id to a key. Keys are bytes for all the storage engines.
+
+        Args:
+            row_id: Row id as an integer.
+        Returns: Key as bytes.
+        """
+        return str(row_id).encode()
+
+    @staticmethod
+    def _get_queue_name(request: Any) -> str:
+        """
+        Generates a queue name depending on a request.
+
+        Args:
+            request: One of `chouette.storage.messages` objects.
+        Return: Queue name as a string.
+        """
+        queue_type = "wrapped" if request.wrapped else "raw"
+        return f"chouette:{request.data_type}:{queue_type}"
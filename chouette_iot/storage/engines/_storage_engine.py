@@ -2,11 +2,12 @@
 Interface definition for all the Storage Engine implementations.
 """
 from abc import ABC, abstractmethod
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 from ..messages import (
     CleanupOutdatedRecords,
     CollectKeys,
+    CollectRecords,
     CollectValues,
     DeleteRecords,
     GetQueueSize,
@@ -19,8 +20,13 @@ __all__ = ["StorageEngine"]
 class StorageEngine(ABC):
     """
     Interface for all Storage Engine implementations.
+
+    Engines that can be used by several StorageActor workers at the same
+    time set CONCURRENT to True.
     """
 
+    CONCURRENT = False
+
     @abstractmethod
     def stop(self):
         """
@@ -40,7 +46,7 @@ class StorageEngine(ABC):
         )  # pragma: no cover
 
     @abstractmethod
-    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, int]]:
+    def collect_keys(self, request: CollectKeys) -> List[Tuple[bytes, float]]:
         """
         Tries to collect keys from a specified queue.
         """
@@ -48,6 +54,17 @@ class StorageEngine(ABC):
             "Use a concrete StorageEngine class."
         )  # pragma: no cover
 
+    @abstractmethod
+    def collect_records(
+        self, request: CollectRecords
+    ) -> List[Tuple[bytes, Optional[bytes]]]:
+        """
+        Tries to collect keys with their values from a specified queue.
+        """
+        raise NotImplementedError(
+            "Use a concrete StorageEngine class."
+        )  # pragma: no cover
+
     @abstractmethod
     def collect_values(self, request: CollectValues) -> List[bytes]:
         """
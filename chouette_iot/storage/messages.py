@@ -10,11 +10,12 @@ is a crucial part of any data processing, it's heavily recommended to use
 `ask` pattern while communicating to Storages.
 """
 # pylint: disable=too-few-public-methods
-from typing import Iterable, List
+from typing import Iterable, List, Optional
 
 __all__ = [
     "CleanupOutdatedRecords",
     "CollectKeys",
+    "CollectRecords",
     "CollectValues",
     "GetQueueSize",
     "DeleteRecords",
@@ -61,21 +62,84 @@ class CollectKeys:
     This message initiates collection of record keys from a queue.
 
     Keys are being returned as a list of Tuples: (key: bytes, timestamp: int).
+
+    Optionally collection can be limited to a range of timestamps:
+    [since, until). It lets consumers walk a queue window by window
+    instead of loading all its keys at once.
     """
 
-    __slots__ = ["data_type", "wrapped", "amount", "reversed"]
+    __slots__ = ["data_type", "wrapped", "amount", "reversed", "since", "until"]
 
-    def __init__(self, data_type: str, wrapped: bool, amount: int = 0):
+    def __init__(
+        self,
+        data_type: str,
+        wrapped: bool,
+        amount: int = 0,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ):
         """
         Args:
             data_type: Type of data to collect. E.g.: 'metrics'.
             wrapped: Whether a Storage should collect from a queue of
                      processed data.
             amount: Maximum number of keys that we want to collect. 0 is all.
+            since: Minimal timestamp of keys to collect (inclusive).
+            until: Maximal timestamp of keys to collect (exclusive).
+        """
+        self.amount = amount
+        self.data_type = data_type
+        self.wrapped = wrapped
+        self.since = since
+        self.until = until
+
+    def __repr__(self):
+        return self.__str__()
+
+    def __str__(self):
+        return (
+            f"<{self.__class__.__name__}:{self.data_type}:"
+            f"wrapped={self.wrapped}:amount={self.amount}>"
+        )
+
+
+class CollectRecords:
+    """
+    This message initiates collection of record keys together with their
+    values from a queue in a single request.
+
+    Records are being returned as a list of Tuples:
+    (key: bytes, value: Optional[bytes]). Value is None if a key has no
+    corresponding value in a queue.
+
+    Like CollectKeys it returns the oldest records first and can be limited
+    to a range of timestamps: [since, until).
+    """
+
+    __slots__ = ["data_type", "wrapped", "amount", "since", "until"]
+
+    def __init__(
+        self,
+        data_type: str,
+        wrapped: bool,
+        amount: int = 0,
+        since: Optional[float] = None,
+        until: Optional[float] = None,
+    ):
+        """
+        Args:
+            data_type: Type of data to collect. E.g.: 'metrics'.
+            wrapped: Whether a Storage should collect from a queue of
+                     processed data.
+            amount: Maximum number of records that we want to collect. 0 is all.
+            since: Minimal timestamp of records to collect (inclusive).
+            until: Maximal timestamp of records to collect (exclusive).
         """
         self.amount = amount
         self.data_type = data_type
         self.wrapped = wrapped
+        self.since = since
+        self.until = until
 
     def __repr__(self):
         return self.__str__()
@@ -16,7 +16,8 @@ setuptools.setup(
     packages=setuptools.find_packages(),
     install_requires=[
         "redis",
-        "pykka",
+        "pykka>=2.0,<4; python_version < '3.8'",
+        "pykka>=4.0,<5; python_version >= '3.8'",
         "requests",
         "requests-unixsocket",
         "python-json-logger",
@@ -1,12 +1,12 @@
 import json
 import time
+import zlib
 from datetime import datetime, timezone
 from unittest.mock import patch
 
 import pytest
 from pykka import ActorRegistry
 from redis import RedisError
-from redis.client import Pipeline
 
 from chouette_iot.logs import LogsSender
 from chouette_iot.storage.messages import CollectKeys
@@ -145,7 +145,8 @@ def test_sender_returns_false_on_redis_problems(
     WHEN: LogsSender receives a message.
     THEN: It returns False, because logs were not deleted.
     """
-    with patch.object(Pipeline, "execute", side_effect=RedisError):
+    engine = sender_actor.proxy().storage.get().proxy().storage.get()
+    with patch.object(engine, "delete_script", side_effect=RedisError):
         result = sender_actor.ask("dispatch")
     assert result is False
     sender_proxy = sender_actor.proxy()
@@ -176,31 +177,44 @@ def test_sender_collect_logs_returns_list_of_logs(sender_proxy, expected_logs):
 
 def test_sender_dispatch_to_datadog(sender_proxy, expected_logs):
     """
-    LogsSender `dispatch_to_datadog` returns True on 202 Accepted.
+    LogsSender `dispatch_to_datadog` accepts all records on 202 Accepted.
 
     GIVEN: It's possible to connect to Datadog and api_key is correct.
     WHEN: `dispatch_to_datadog` method is called for valid logs.
-    THEN: True is returned when 202 Accepted response is received.
+    THEN: A number of all records is returned on 202 Accepted response.
     """
     result = sender_proxy.dispatch_to_datadog(expected_logs).get()
-    assert result is True
+    assert result == len(expected_logs)
+
+
+def test_sender_streams_compressed_logs(sender_proxy, expected_logs, requests_mock):
+    """
+    LogsSender sends logs compressed chunk by chunk.
+
+    GIVEN: There are prepared logs.
+    WHEN: `dispatch_to_datadog` method is called for them.
+    THEN: Request body decompresses to a JSON list of these logs.
+    """
+    sender_proxy.dispatch_to_datadog(expected_logs).get()
+    body = requests_mock.last_request.body
+    assert json.loads(zlib.decompress(b"".join(body))) == expected_logs
 
 
 @pytest.mark.parametrize("api_key", ["authfail", "exc"])
 def test_sender_dispatch_to_datadog_problem(monkeypatch, expected_logs, api_key):
     """
-    LogsSender `dispatch_to_datadog` returns False on 403 Auth error or
+    LogsSender `dispatch_to_datadog` accepts no records on 403 Auth error or
     Requests exception.
 
     GIVEN: It's possible to connect to Datadog and api_key is incorrect.
     WHEN: `dispatch_to_datadog` method is called for valid logs.
-    THEN: False is returned if 202 Accepted wasn't returned.
+    THEN: 0 is returned if 202 Accepted wasn't returned.
     """
     monkeypatch.setenv("API_KEY", api_key)
     ActorRegistry.stop_all()
     sender_proxy = LogsSender.get_instance().proxy()
     result = sender_proxy.dispatch_to_datadog(expected_logs).get()
-    assert result is False
+    assert result == 0
 
 
 @pytest.mark.parametrize("send_self_metrics", [False, True])
@@ -213,6 +227,7 @@ def test_sender_sends_self_metrics(monkeypatch, expected_logs, send_self_metrics
     GIVEN: Option `send_self_metrics` is set to True.
     WHEN: `dispatch_to_datadog` method is called and executed successfully.
     THEN: 2 `chouette.logs.dispatched` raw metrics are stored to the storage.
+    AND: 2 `chouette.compression.logs` metrics are stored to the storage.
 
     Scenario 2:
     GIVEN: Option `send_self_metrics` is set to False.
@@ -227,4 +242,51 @@ def test_sender_sends_self_metrics(monkeypatch, expected_logs, send_self_metrics
     # Sleep due to async ChouetteClient nature:
     time.sleep(0.1)
     keys = storage.ask(CollectKeys("metrics", wrapped=False))
-    assert (len(keys) == 2) is send_self_metrics
+    assert (len(keys) == 4) is send_self_metrics
+
+
+def test_sender_truncates_oversized_logs(monkeypatch, mocked_http):
+    """
+    LogsSender truncates messages of logs bigger than LOG_RECORD_SIZE.
+
+    GIVEN: LOG_RECORD_SIZE is 200.
+    WHEN: A log with a 1000 characters message is encoded.
+    THEN: Its message is truncated and marked.
+    AND: Encoded log fits into LOG_RECORD_SIZE.
+    AND: A log that doesn't fit even without a message is dropped.
+    """
+    monkeypatch.setenv("LOG_RECORD_SIZE", "200")
+    sender_proxy = LogsSender.get_instance().proxy()
+    b_log = sender_proxy.encode_log({"message": "ü" * 1000, "ddtags": ""}).get()
+    huge_log = sender_proxy.encode_log({"message": "a", "ddtags": "a" * 200}).get()
+    ActorRegistry.stop_all()
+    log = json.loads(b_log)
+    assert len(b_log) <= 200
+    assert log["message"].endswith(LogsSender.TRUNCATED_MARK)
+    assert log["message"].startswith("ü")
+    assert huge_log is None
+
+
+def test_sender_splits_logs_by_payload_size(monkeypatch, mocked_http, requests_mock):
+    """
+    LogsSender splits logs into several requests by LOGS_PAYLOAD_SIZE.
+
+    GIVEN: LOGS_PAYLOAD_SIZE is 250 bytes.
+    WHEN: 5 logs of around 100 bytes are dispatched.
+    THEN: They are sent in 3 requests.
+    AND: All of them are sent.
+    """
+    monkeypatch.setenv("LOGS_PAYLOAD_SIZE", "250")
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    logs = [{"message": f"{i}" * 80, "ddtags": ""} for i in range(5)]
+    sender_proxy = LogsSender.get_instance().proxy()
+    result = sender_proxy.dispatch_to_datadog(logs).get()
+    ActorRegistry.stop_all()
+    assert result == 5
+    assert requests_mock.call_count == 3
+    sent = []
+    for request in requests_mock.request_history:
+        body = b"".join(request.body)
+        assert len(zlib.decompress(body)) <= 250
+        sent += json.loads(zlib.decompress(body))
+    assert sent == logs
@@ -1,5 +1,7 @@
 import json
 import time
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from unittest.mock import patch
 from uuid import uuid4
 
@@ -157,3 +159,204 @@ def test_aggregator_cleanup_failed(aggregator_ref, redis_with_raw_metrics):
     with patch.object(RedisEngine, "delete_records", return_value=False):
         result = aggregator_ref.ask("aggregate")
     assert result is False
+
+
+@pytest.fixture
+def streaming_aggregator_ref(monkeypatch, redis_client):
+    ActorRegistry.stop_all()
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("METRICS_WRAPPER", "simple")
+    monkeypatch.setenv("AGGREGATE_STREAMING", "true")
+    actor_ref = MetricsAggregator.start()
+    yield actor_ref
+    ActorRegistry.stop_all()
+
+
+@pytest.fixture
+def redis_with_raw_metrics_in_windows(redis_cleanup, redis_client):
+    ts = time.time() // 10 * 10
+    timestamps = [ts - 30, ts - 25, ts - 10, ts]
+    queue_name = f"chouette:metrics:raw"
+    pipeline = redis_client.pipeline()
+    for timestamp in timestamps:
+        metric = {
+            "metric": "metric-test",
+            "type": "count",
+            "timestamp": timestamp,
+            "value": 1,
+        }
+        key = str(uuid4())
+        pipeline.zadd(f"{queue_name}.keys", {key: timestamp})
+        pipeline.hset(f"{queue_name}.values", key, json.dumps(metric))
+    pipeline.execute()
+    redis = StorageActor.get_instance()
+    return redis
+
+
+def test_streaming_aggregator_processes_windows(
+    streaming_aggregator_ref, redis_with_raw_metrics_in_windows
+):
+    """
+    Streaming aggregator processes raw metrics window by window.
+
+    GIVEN: There are 4 raw metrics in 3 different 10 seconds windows.
+    AND: Option AGGREGATE_STREAMING is set to true.
+    WHEN: MetricsAggregator receives a message.
+    THEN: It returns True.
+    AND: Records of every window are collected separately.
+    AND: 3 WrappedMetrics appear in a wrapped metrics queue.
+    AND: Raw metrics are cleaned up from the raw metrics queue.
+    """
+    redis = redis_with_raw_metrics_in_windows
+    with patch.object(
+        RedisEngine, "collect_keys", side_effect=RedisEngine.collect_keys, autospec=True
+    ) as collect_keys:
+        with patch.object(
+            RedisEngine,
+            "collect_records",
+            side_effect=RedisEngine.collect_records,
+            autospec=True,
+        ) as collect_records:
+            result = streaming_aggregator_ref.ask("aggregate")
+    assert result is True
+    # 3 windows + 1 final request:
+    assert collect_keys.call_count == 4
+    assert collect_records.call_count == 3
+    for call in collect_records.call_args_list:
+        request = call[0][1]
+        assert request.until - request.since == 10
+    stored_keys = redis.ask(CollectKeys("metrics", wrapped=True))
+    stored_metrics = redis.ask(
+        CollectValues("metrics", [key for key, _ in stored_keys], wrapped=True)
+    )
+    values = sorted(json.loads(metric)["points"][0][1] for metric in stored_metrics)
+    assert values == [1, 1, 2]
+    raw_keys = redis.ask(CollectKeys("metrics", wrapped=False))
+    assert not raw_keys
+
+
+@pytest.fixture
+def processes_env(monkeypatch):
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("METRICS_WRAPPER", "simple")
+    monkeypatch.setenv("AGGREGATE_PROCESSES", "2")
+
+
+@pytest.mark.parametrize("streaming", ["false", "true"])
+def test_aggregator_wraps_windows_in_processes(
+    monkeypatch,
+    streaming,
+    processes_env,
+    redis_with_raw_metrics_in_windows,
+    post_test_actors_stop,
+):
+    """
+    Aggregator with worker processes produces the same metrics.
+
+    GIVEN: There are 4 raw metrics in 3 different 10 seconds windows.
+    AND: Option AGGREGATE_PROCESSES is 2.
+    WHEN: MetricsAggregator receives a message.
+    THEN: It returns True.
+    AND: 3 WrappedMetrics appear in a wrapped metrics queue.
+    AND: Raw metrics are cleaned up from the raw metrics queue.
+    """
+    monkeypatch.setenv("AGGREGATE_STREAMING", streaming)
+    aggregator_ref = MetricsAggregator.start()
+    redis = redis_with_raw_metrics_in_windows
+    result = aggregator_ref.ask("aggregate")
+    assert aggregator_ref.proxy().pool.get() is not None
+    assert result is True
+    stored_keys = redis.ask(CollectKeys("metrics", wrapped=True))
+    stored_metrics = redis.ask(
+        CollectValues("metrics", [key for key, _ in stored_keys], wrapped=True)
+    )
+    values = sorted(json.loads(metric)["points"][0][1] for metric in stored_metrics)
+    assert values == [1, 1, 2]
+    assert not redis.ask(CollectKeys("metrics", wrapped=False))
+
+
+class BrokenPool(ThreadPoolExecutor):
+    """
+    Pool of workers that die on every task, like a broken ProcessPoolExecutor.
+    """
+
+    def __init__(self, max_workers, mp_context=None):
+        super().__init__(max_workers=max_workers)
+
+    def submit(self, fn, *args, **kwargs):
+        return super().submit(self.die)
+
+    @staticmethod
+    def die():
+        raise BrokenProcessPool("A worker process died.")
+
+
+def test_aggregator_falls_back_when_workers_fail(
+    monkeypatch,
+    processes_env,
+    redis_with_raw_metrics_in_windows,
+    post_test_actors_stop,
+):
+    """
+    Aggregator processes groups itself after a worker process failure.
+
+    GIVEN: There are 4 raw metrics in 3 different 10 seconds windows.
+    AND: Option AGGREGATE_PROCESSES is 2, so 2 groups are in flight.
+    AND: Worker processes fail.
+    WHEN: MetricsAggregator receives a message.
+    THEN: It returns True and it's still running.
+    AND: Nothing is submitted to a pool after it was dropped.
+    AND: 3 WrappedMetrics appear in a wrapped metrics queue.
+    AND: Raw metrics are cleaned up from the raw metrics queue.
+    """
+    monkeypatch.setenv("AGGREGATE_STREAMING", "true")
+    aggregator_ref = MetricsAggregator.start()
+    redis = redis_with_raw_metrics_in_windows
+    with patch("chouette_iot.metrics._aggregator.ProcessPoolExecutor", BrokenPool):
+        with patch.object(
+            BrokenPool, "submit", side_effect=BrokenPool.submit, autospec=True
+        ) as submit:
+            result = aggregator_ref.ask("aggregate")
+    assert result is True
+    assert aggregator_ref.is_alive()
+    assert submit.call_count == 2
+    assert aggregator_ref.proxy().pool.get() is None
+    stored_keys = redis.ask(CollectKeys("metrics", wrapped=True))
+    stored_metrics = redis.ask(
+        CollectValues("metrics", [key for key, _ in stored_keys], wrapped=True)
+    )
+    values = sorted(json.loads(metric)["points"][0][1] for metric in stored_metrics)
+    assert values == [1, 1, 2]
+    assert not redis.ask(CollectKeys("metrics", wrapped=False))
+
+
+def test_aggregator_falls_back_when_pool_is_not_created(
+    monkeypatch,
+    processes_env,
+    redis_with_raw_metrics_in_windows,
+    post_test_actors_stop,
+):
+    """
+    Aggregator processes groups itself if worker processes can't be created.
+
+    GIVEN: There are 4 raw metrics in 3 different 10 seconds windows.
+    AND: Option AGGREGATE_PROCESSES is 2.
+    AND: A pool of worker processes can't be created.
+    WHEN: MetricsAggregator receives a message.
+    THEN: It returns True and there is no pool.
+    AND: 3 WrappedMetrics appear in a wrapped metrics queue.
+    """
+    aggregator_ref = MetricsAggregator.start()
+    redis = redis_with_raw_metrics_in_windows
+    with patch(
+        "chouette_iot.metrics._aggregator.ProcessPoolExecutor",
+        side_effect=OSError("Too many open files"),
+    ):
+        result = aggregator_ref.ask("aggregate")
+    assert result is True
+    assert aggregator_ref.proxy().pool.get() is None
+    stored_keys = redis.ask(CollectKeys("metrics", wrapped=True))
+    assert len(stored_keys) == 3
+    assert not redis.ask(CollectKeys("metrics", wrapped=False))
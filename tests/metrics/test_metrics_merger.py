@@ -73,3 +73,39 @@ def test_merge_metrics(metrics_values):
     values, expected_values = metrics_values
     result = MetricsMerger.merge_metrics(values, 10)
     assert result == expected_values
+
+
+def test_merge_metrics_not_adjacent():
+    """
+    MetricsMerger merges metrics with the same id even if they are not
+    adjacent in a list of records.
+
+    GIVEN: There are interleaved raw metrics of two different metrics.
+    WHEN: `merge_metrics` method is called.
+    THEN: Exactly one MergedMetric per metric id is returned.
+    AND: Their values and timestamps keep the original order.
+    """
+    values = [
+        b'{"metric": "metric-1", "type": "count", "timestamp": 10, "value": 1}',
+        b'{"metric": "metric-2", "type": "count", "timestamp": 11, "value": 2}',
+        b'{"metric": "metric-1", "type": "count", "timestamp": 12, "value": 3}',
+        b'{"metric": "metric-2", "type": "count", "timestamp": 13, "value": 4}',
+    ]
+    expected_metrics = [
+        MergedMetric(
+            metric="metric-1",
+            type="count",
+            values=[1, 3],
+            timestamps=[10, 12],
+            interval=10,
+        ),
+        MergedMetric(
+            metric="metric-2",
+            type="count",
+            values=[2, 4],
+            timestamps=[11, 13],
+            interval=10,
+        ),
+    ]
+    result = MetricsMerger.merge_metrics(values, 10)
+    assert result == expected_metrics
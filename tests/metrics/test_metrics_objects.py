@@ -46,6 +46,46 @@ def test_merged_metric_unsuccessful_merge():
         metric1 + metric2
 
 
+def test_merged_metric_successful_inplace_merge():
+    """
+    MergedMetrics of the same type can be merged in place.
+
+    GIVEN: There are 2 MergedMetric objects with the same name, type and tags.
+    WHEN: One metric is added to another in place.
+    THEN: The first MergedMetric has merged values and timestamps.
+    """
+    metric1 = MergedMetric(
+        metric="name", type="type", values=[1], timestamps=[2], tags={"tag": "1"}
+    )
+    metric2 = MergedMetric(
+        metric="name", type="type", values=[3], timestamps=[4], tags={"tag": "1"}
+    )
+    result = metric1
+    result += metric2
+    assert result is metric1
+    assert result.timestamps == [2, 4]
+    assert result.values == [1, 3]
+    assert metric2.values == [3]
+
+
+def test_merged_metric_unsuccessful_inplace_merge():
+    """
+    MergedMetrics of different types can't be merged in place.
+
+    GIVEN: There are 2 MergedMetric objects with different types.
+    WHEN: One metric is added to another in place.
+    THEN: ValueError exception is raised.
+    """
+    metric1 = MergedMetric(
+        metric="name", type="type1", values=[1], timestamps=[2], tags={"tag": "1"}
+    )
+    metric2 = MergedMetric(
+        metric="name", type="type2", values=[3], timestamps=[4], tags={"tag": "1"}
+    )
+    with pytest.raises(ValueError):
+        metric1 += metric2
+
+
 def test_merged_metric_str_and_repr():
     """
     MergedMetric:
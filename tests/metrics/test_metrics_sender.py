@@ -1,16 +1,25 @@
+import json
 import time
+import zlib
 from unittest.mock import patch
 
 import pytest
 from pykka import ActorRegistry
 from redis import RedisError
-from redis.client import Pipeline
 
 from chouette_iot.metrics import MetricsSender
 from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage.codecs import MsgPackCodec
 from chouette_iot.storage.messages import StoreRecords, CollectKeys
 
 
+def encode(metrics):
+    """
+    Encodes prepared metrics to JSON objects as bytes.
+    """
+    return [json.dumps(metric).encode() for metric in metrics]
+
+
 @pytest.fixture
 def sender_actor(monkeypatch, mocked_http):
     """
@@ -130,7 +139,7 @@ def test_sender_returns_false_on_dispatch_problems(
     sender_proxy = sender_actor.proxy()
     keys = sender_proxy.collect_keys("metrics").get()
     values = sender_proxy.collect_records(keys, "metrics").get()
-    assert values == expected_metrics
+    assert list(map(json.loads, values)) == expected_metrics
 
 
 def test_sender_returns_false_on_redis_problems(
@@ -145,13 +154,14 @@ def test_sender_returns_false_on_redis_problems(
     WHEN: MetricsSender receives a message.
     THEN: It returns False, because metrics were not deleted.
     """
-    with patch.object(Pipeline, "execute", side_effect=RedisError):
+    engine = sender_actor.proxy().storage.get().proxy().storage.get()
+    with patch.object(engine, "delete_script", side_effect=RedisError):
         result = sender_actor.ask("dispatch")
     assert result is False
     sender_proxy = sender_actor.proxy()
     keys = sender_proxy.collect_keys("metrics").get()
     values = sender_proxy.collect_records(keys, "metrics").get()
-    assert values == expected_metrics
+    assert list(map(json.loads, values)) == expected_metrics
 
 
 def test_sender_collect_keys_returns_list_of_keys(sender_proxy, stored_wrapped_keys):
@@ -172,50 +182,51 @@ def test_sender_collect_records_returns_list_of_processed_metrics(
 ):
     """
     MetricsSender's `collect_records` methods returns a list of JSON
-    strings containing stored metrics whose tags are updated with global tags.
+    objects as bytes containing stored metrics whose tags are updated with
+    global tags.
 
     GIVEN: There are records in the wrapped metrics queue.
     AND: One of the records is not a valid metric.
     WHEN: Method `collect_records` is called with their keys.
-    THEN: It returns a list of dicts.
-    AND: These dicts represent previously stored metrics.
+    THEN: It returns a list of JSON objects.
+    AND: These objects represent previously stored metrics.
     AND: Every metric has global tags added to its `tags` property.
     AND: Invalid record is ignored.
     """
     keys = sender_proxy.collect_keys("metrics").get()
     assert len(keys) == 3
-    dicts = sender_proxy.collect_records(keys, "metrics").get()
+    dicts = list(map(json.loads, sender_proxy.collect_records(keys, "metrics").get()))
     assert dicts == expected_metrics
     assert len(dicts) == 2
 
 
 def test_sender_dispatch_to_datadog(sender_proxy, expected_metrics):
     """
-    MetricsSender `dispatch_to_datadog` returns True on 202 Accepted.
+    MetricsSender `dispatch_to_datadog` accepts all records on 202 Accepted.
 
     GIVEN: It's possible to connect to Datadog and api_key is correct.
     WHEN: `dispatch_to_datadog` method is called for valid metrics.
-    THEN: True is returned when 202 Accepted response is received.
+    THEN: A number of all records is returned on 202 Accepted response.
     """
-    result = sender_proxy.dispatch_to_datadog(expected_metrics).get()
-    assert result is True
+    result = sender_proxy.dispatch_to_datadog(encode(expected_metrics)).get()
+    assert result == len(expected_metrics)
 
 
 @pytest.mark.parametrize("api_key", ["authfail", "exc"])
 def test_sender_dispatch_to_datadog_problem(monkeypatch, expected_metrics, api_key):
     """
-    MetricsSender `dispatch_to_datadog` returns False on 403 Auth error or
+    MetricsSender `dispatch_to_datadog` accepts no records on 403 Auth error or
     Requests exception.
 
     GIVEN: It's possible to connect to Datadog and api_key is incorrect.
     WHEN: `dispatch_to_datadog` method is called for valid metrics.
-    THEN: False is returned if 202 Accepted wasn't returned.
+    THEN: 0 is returned if 202 Accepted wasn't returned.
     """
     monkeypatch.setenv("API_KEY", api_key)
     ActorRegistry.stop_all()
     sender_proxy = MetricsSender.get_instance().proxy()
-    result = sender_proxy.dispatch_to_datadog(expected_metrics).get()
-    assert result is False
+    result = sender_proxy.dispatch_to_datadog(encode(expected_metrics)).get()
+    assert result == 0
 
 
 @pytest.mark.parametrize("send_self_metrics", [False, True])
@@ -233,6 +244,7 @@ def test_sender_sends_self_metrics(monkeypatch, expected_metrics, send_self_metr
     THEN: 2 `chouette.metrics.dispatched` raw metrics are stored to the
           storage.
     AND: `choette.queue.metrics` metric is stored to the storage.
+    AND: 2 `chouette.compression.metrics` metrics are stored to the storage.
 
     Scenario 2:
     GIVEN: Option `send_self_metrics` is set to False.
@@ -242,9 +254,220 @@ def test_sender_sends_self_metrics(monkeypatch, expected_metrics, send_self_metr
     monkeypatch.setenv("SEND_SELF_METRICS", str(send_self_metrics))
     ActorRegistry.stop_all()
     sender_proxy = MetricsSender.get_instance().proxy()
-    sender_proxy.dispatch_to_datadog(expected_metrics).get()
+    sender_proxy.dispatch_to_datadog(encode(expected_metrics)).get()
     redis = sender_proxy.storage.get()
     # Sleep due to async ChouetteClient nature:
     time.sleep(0.1)
     keys = redis.ask(CollectKeys("metrics", wrapped=False))
-    assert (len(keys) == 3) is send_self_metrics
+    assert (len(keys) == 5) is send_self_metrics
+
+
+@pytest.mark.parametrize(
+    "record",
+    [
+        {"metric": "a", "points": [[1, 2]], "type": "gauge", "tags": []},
+        {"metric": "a", "points": [[1, 2]], "type": "gauge", "tags": ["t:1"]},
+        {"metric": "a", "tags": ["t:1"], "points": [[1, 2]], "type": "gauge"},
+        {"metric": "a", "points": [[1, 2]], "type": "gauge", "tags": ['a": b']},
+        {"metric": '"tags": [', "points": [[1, 2]], "type": "gauge", "tags": []},
+    ],
+)
+def test_sender_splices_global_tags(sender_proxy, record):
+    """
+    MetricsSender adds global tags and host to records of any layout.
+
+    GIVEN: There is a stored JSON record with tags as the last key or not.
+    WHEN: Method `add_global_tags` is called for it.
+    THEN: Returned JSON object has global tags and host added.
+    """
+    global_tags = sender_proxy.tags.get()
+    expected = dict(record, tags=record["tags"] + global_tags, host="test_host")
+    records = sender_proxy.add_global_tags([json.dumps(record).encode()]).get()
+    assert list(map(json.loads, records)) == [expected]
+
+
+def test_sender_splices_global_tags_without_decoding(sender_proxy):
+    """
+    WrappedMetrics records are not decoded to add global tags.
+
+    GIVEN: There is a stored WrappedMetric JSON record.
+    WHEN: Method `add_global_tags` is called for it.
+    THEN: Records are not decoded.
+    """
+    metric = WrappedMetric(metric="a", type="gauge", value=1, tags={"t": "1"})
+    record = json.dumps(metric.asdict()).encode()
+    with patch("chouette_iot.metrics._sender.CodecsFactory.decode") as decode:
+        records = list(sender_proxy.add_global_tags([record]).get())
+    decode.assert_not_called()
+    assert json.loads(records[0])["tags"] == ["t:1"] + sender_proxy.tags.get()
+
+
+def test_sender_adds_global_tags_to_msgpack_records(sender_proxy):
+    """
+    Records in other formats are decoded and dispatched as JSON.
+
+    GIVEN: There is a MessagePack encoded record.
+    WHEN: Method `add_global_tags` is called for it.
+    THEN: It returns a JSON object with global tags and host.
+    """
+    metric = WrappedMetric(metric="a", type="gauge", value=1)
+    record = MsgPackCodec().encode(metric.asdict())
+    records = list(sender_proxy.add_global_tags([record]).get())
+    expected = dict(metric.asdict(), tags=sender_proxy.tags.get(), host="test_host")
+    assert list(map(json.loads, records)) == [expected]
+
+
+def test_sender_streams_compressed_series(
+    sender_proxy, expected_metrics, requests_mock
+):
+    """
+    MetricsSender sends a "series" request compressed chunk by chunk.
+
+    GIVEN: There are prepared metrics.
+    WHEN: `dispatch_to_datadog` method is called for them.
+    THEN: Request body is an iterable of compressed chunks.
+    AND: It decompresses to a "series" JSON object with these metrics.
+    """
+    sender_proxy.dispatch_to_datadog(encode(expected_metrics)).get()
+    body = requests_mock.last_request.body
+    series = json.loads(zlib.decompress(b"".join(body)))
+    assert series == {"series": expected_metrics}
+
+
+@pytest.mark.parametrize("drain_mode, requests_count", [("true", 3), ("false", 1)])
+def test_sender_drains_backlog(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup, drain_mode, requests_count
+):
+    """
+    MetricsSender in a drain mode dispatches bulks until a queue is drained.
+
+    GIVEN: METRICS_BULK_SIZE is 3 and there are 7 metrics in a queue.
+    WHEN: MetricsSender receives a message.
+    THEN: In a drain mode it dispatches all of them in 3 requests.
+    AND: Otherwise it dispatches only one bulk.
+    """
+    monkeypatch.setenv("DRAIN_MODE", drain_mode)
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    actor_ref = MetricsSender.get_instance()
+    storage = actor_ref.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(7)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    result = actor_ref.ask("dispatch")
+    left = storage.ask(CollectKeys("metrics", wrapped=True))
+    ActorRegistry.stop_all()
+    assert result is True
+    assert requests_mock.call_count == requests_count
+    assert len(left) == 7 - min(requests_count * 3, 7)
+
+
+def test_sender_stops_draining_on_dispatch_problems(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup
+):
+    """
+    MetricsSender stops draining a queue if Datadog doesn't accept a bulk.
+
+    GIVEN: There are 7 metrics in a queue and a drain mode is enabled.
+    AND: Datadog rejects requests.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns False after a single request.
+    """
+    monkeypatch.setenv("DRAIN_MODE", "true")
+    monkeypatch.setenv("API_KEY", "authfail")
+    actor_ref = MetricsSender.get_instance()
+    storage = actor_ref.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(7)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    result = actor_ref.ask("dispatch")
+    ActorRegistry.stop_all()
+    assert result is False
+    assert requests_mock.call_count == 1
+
+
+def test_sender_drains_backlog_concurrently(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup
+):
+    """
+    MetricsSender with DISPATCH_CONCURRENCY dispatches every metric once.
+
+    GIVEN: There are 7 metrics in a queue, METRICS_BULK_SIZE is 3.
+    AND: A drain mode is enabled with DISPATCH_CONCURRENCY 2.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns True.
+    AND: Every metric was dispatched exactly once and the queue is empty.
+    """
+    monkeypatch.setenv("DRAIN_MODE", "true")
+    monkeypatch.setenv("DISPATCH_CONCURRENCY", "2")
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    actor_ref = MetricsSender.get_instance()
+    storage = actor_ref.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(7)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    result = actor_ref.ask("dispatch")
+    left = storage.ask(CollectKeys("metrics", wrapped=True))
+    ActorRegistry.stop_all()
+    assert result is True
+    assert not left
+    names = []
+    for request in requests_mock.request_history:
+        series = json.loads(zlib.decompress(b"".join(request.body)))["series"]
+        names += [metric["metric"] for metric in series]
+    assert sorted(names) == [metric.metric for metric in metrics]
+
+
+def test_sender_keeps_records_on_concurrent_dispatch_problems(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup
+):
+    """
+    Bulks that weren't accepted by Datadog stay in a queue.
+
+    GIVEN: There are 7 metrics in a queue, METRICS_BULK_SIZE is 3.
+    AND: A drain mode is enabled with DISPATCH_CONCURRENCY 2.
+    AND: Datadog rejects requests.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns False after at most 2 requests.
+    AND: All the metrics are still in the queue.
+    """
+    monkeypatch.setenv("DRAIN_MODE", "true")
+    monkeypatch.setenv("DISPATCH_CONCURRENCY", "2")
+    monkeypatch.setenv("API_KEY", "authfail")
+    actor_ref = MetricsSender.get_instance()
+    storage = actor_ref.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(7)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    result = actor_ref.ask("dispatch")
+    left = storage.ask(CollectKeys("metrics", wrapped=True))
+    ActorRegistry.stop_all()
+    assert result is False
+    assert requests_mock.call_count <= 2
+    assert len(left) == 7
+
+
+def test_sender_splits_metrics_by_payload_size(monkeypatch, mocked_http, requests_mock):
+    """
+    MetricsSender splits metrics into requests by METRICS_PAYLOAD_SIZE
+    and drops metrics that can't fit into a request.
+
+    GIVEN: METRICS_PAYLOAD_SIZE is 200 bytes.
+    WHEN: 4 small metrics and a metric bigger than 200 bytes are dispatched.
+    THEN: Small metrics are sent in 2 requests.
+    AND: The big metric is dropped.
+    """
+    monkeypatch.setenv("METRICS_PAYLOAD_SIZE", "200")
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    metrics = [
+        WrappedMetric(metric=f"m-{i}", type="gauge", value=i).asdict()
+        for i in range(4)
+    ]
+    big_metric = WrappedMetric(metric="m" * 200, type="gauge", value=1).asdict()
+    sender_proxy = MetricsSender.get_instance().proxy()
+    records = encode(metrics[:2] + [big_metric] + metrics[2:])
+    result = sender_proxy.dispatch_to_datadog(records).get()
+    ActorRegistry.stop_all()
+    assert result == len(records)
+    assert requests_mock.call_count == 2
+    sent = []
+    for request in requests_mock.request_history:
+        body = zlib.decompress(b"".join(request.body))
+        assert len(body) <= 200
+        sent += json.loads(body)["series"]
+    assert sent == metrics
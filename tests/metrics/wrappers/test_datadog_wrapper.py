@@ -1,3 +1,5 @@
+import pytest
+
 from chouette_iot.metrics._metrics import MergedMetric, WrappedMetric
 from chouette_iot.metrics.wrappers import DatadogWrapper
 
@@ -17,7 +19,7 @@ def test_datadog_unsupported_metric_type():
         values=[1, 2],
         tags={"type": "set"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert not result
 
 
@@ -29,7 +31,7 @@ def test_datadog_count_wrapper():
         values=[1, 2, 3],
         tags={"type": "count"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 1
     metric = result.pop()
     assert isinstance(metric, WrappedMetric)
@@ -49,7 +51,7 @@ def test_datadog_rate_wrapper():
         values=[1, 2, 3],
         tags={"type": "rate"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 1
     metric = result.pop()
     assert metric.metric == "rate.test"
@@ -67,7 +69,7 @@ def test_datadog_gauge_wrapper():
         values=[1, 2, 3, 9],
         tags={"type": "gauge"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 1
     metric = result.pop()
     assert metric.metric == "gauge.test"
@@ -97,7 +99,7 @@ def test_datadog_set_wrapper():
         values=[["Alice", "Bob"], ["Bob", "Carol"]],
         tags={"type": "set"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 1
     metric = result.pop()
     assert metric.metric == "set.test"
@@ -123,7 +125,7 @@ def test_datadog_set_wrapper_wrong_type():
         values=[1, 2],
         tags={"type": "set"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert not result
 
 
@@ -149,7 +151,7 @@ def test_datadog_histogram_wrapper():
         values=[1, 1, 1, 2, 2, 2, 3, 3],
         tags={"type": "histogram"},
     )
-    result = DatadogWrapper.wrap_metrics([merged_metric])
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 5
     max = next(metric for metric in result if ".max" in metric.metric)
     assert max.value == 3
@@ -166,3 +168,62 @@ def test_datadog_histogram_wrapper():
     percentile = next(metric for metric in result if ".95percentile" in metric.metric)
     assert percentile.value == 3
     assert percentile.type == "gauge"
+
+
+def test_datadog_histogram_all_aggregates(monkeypatch):
+    """
+    Histogram wrapper calculates all the configured aggregates.
+
+    GIVEN: All the aggregates and 3 percentiles are configured.
+    WHEN: A histogram metric with values from 1 to 100 is being wrapped.
+    THEN: It returns 9 metrics with expected values.
+    """
+    monkeypatch.setattr(
+        DatadogWrapper,
+        "histogram_aggregates",
+        ["max", "min", "median", "avg", "count", "sum"],
+    )
+    monkeypatch.setattr(DatadogWrapper, "histogram_percentiles", [0.5, 0.9, 0.99])
+    values = list(range(100, 0, -1))
+    merged_metric = MergedMetric(
+        metric="histogram.test",
+        type="histogram",
+        timestamps=list(range(100)),
+        values=values,
+    )
+    result = DatadogWrapper.wrap_metrics([merged_metric])
+    metrics = {metric.metric: metric.value for metric in result}
+    assert metrics == pytest.approx(
+        {
+            "histogram.test.avg": 50.5,
+            "histogram.test.count": 10.0,
+            "histogram.test.sum": 5050,
+            "histogram.test.min": 1,
+            "histogram.test.max": 100,
+            "histogram.test.median": 50.5,
+            "histogram.test.50percentile": 50.5,
+            "histogram.test.90percentile": 90.1,
+            "histogram.test.99percentile": 99.01,
+        }
+    )
+
+
+def test_datadog_histogram_vectorized_summary(monkeypatch):
+    """
+    Vectorized histogram summary gives the same values as a pure Python one.
+
+    GIVEN: Numpy is installed.
+    WHEN: The same values are summarized with and without numpy.
+    THEN: Summaries are equal.
+    """
+    pytest.importorskip("numpy")
+    values = [(idx * 7919) % 1000 / 10 for idx in range(5000)]
+    percentiles = [0.5, 0.95, 0.99]
+    monkeypatch.setattr(DatadogWrapper, "histogram_vectorize_threshold", 10 ** 9)
+    expected_summary = DatadogWrapper._summarize(values, percentiles)
+    monkeypatch.setattr(DatadogWrapper, "histogram_vectorize_threshold", 1)
+    summary = DatadogWrapper._summarize(values, percentiles)
+    assert summary.keys() == expected_summary.keys()
+    for aggregate, value in summary.items():
+        assert type(value) in (int, float)
+        assert value == pytest.approx(expected_summary[aggregate])
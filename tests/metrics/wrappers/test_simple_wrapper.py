@@ -32,7 +32,7 @@ def test_wrap_count():
         timestamps=[18, 10, 12],
         tags={"hello": "world"},
     )
-    result = SimpleWrapper.wrap_metrics([merged_metric])
+    result = list(SimpleWrapper.wrap_metrics([merged_metric]))
     assert len(result) == 1
     wrapped_metric = result.pop()
     assert wrapped_metric == expected_metric
@@ -79,5 +79,5 @@ def test_wrap_average(metric_type):
         tags={"hello": "world"},
         interval=15,
     )
-    result = SimpleWrapper.wrap_metrics([merged_metric])
+    result = list(SimpleWrapper.wrap_metrics([merged_metric]))
     assert result == expected_metrics
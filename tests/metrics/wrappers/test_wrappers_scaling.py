@@ -0,0 +1,73 @@
+from unittest.mock import patch
+
+import pytest
+
+from chouette_iot.metrics._metrics import MergedMetric
+from chouette_iot.metrics.wrappers import DatadogWrapper, SimpleWrapper
+
+
+def _merged_metrics(number):
+    """
+    Generates a list of histogram MergedMetrics with unique names.
+    """
+    return [
+        MergedMetric(
+            metric=f"metric-{idx}",
+            type="histogram",
+            values=[1, 2, 3],
+            timestamps=[10, 11, 12],
+            tags={"idx": str(idx)},
+        )
+        for idx in range(number)
+    ]
+
+
+@pytest.mark.parametrize("wrapper", [DatadogWrapper, SimpleWrapper])
+def test_wrap_metrics_is_lazy(wrapper):
+    """
+    Wrapped metrics are generated one MergedMetric at a time.
+
+    GIVEN: There is a generator of 8000 MergedMetrics.
+    WHEN: The first WrappedMetric is taken from a wrapper.
+    THEN: Only the first MergedMetric is consumed and wrapped.
+    WHEN: All the WrappedMetrics are taken.
+    THEN: Every MergedMetric is wrapped exactly once.
+    """
+    consumed = []
+
+    def merged_metrics():
+        for merged_metric in _merged_metrics(8000):
+            consumed.append(merged_metric)
+            yield merged_metric
+
+    with patch.object(
+        wrapper, "_wrap_metric", side_effect=wrapper._wrap_metric
+    ) as wrap_metric:
+        wrapped_metrics = wrapper.wrap_metrics(merged_metrics())
+        first = next(wrapped_metrics)
+        assert len(consumed) == 1
+        assert wrap_metric.call_count == 1
+        rest = list(wrapped_metrics)
+    assert first.metric.startswith("metric-0")
+    assert len(consumed) == 8000
+    assert wrap_metric.call_count == 8000
+    assert len(rest) + 1 == len(list(wrapper.wrap_metrics(_merged_metrics(8000))))
+
+
+def test_datadog_set_wrapper_many_values():
+    """
+    Set metric wrapper handles a large number of lists.
+
+    GIVEN: There is a set type metric with 50000 lists of values.
+    WHEN: This merged metric is wrapped.
+    THEN: Its value is a number of unique elements in these lists.
+    """
+    merged_metric = MergedMetric(
+        metric="set.test",
+        type="set",
+        timestamps=list(range(50000)),
+        values=[[idx % 100, "user"] for idx in range(50000)],
+    )
+    result = list(DatadogWrapper.wrap_metrics([merged_metric]))
+    assert len(result) == 1
+    assert result[0].value == 101
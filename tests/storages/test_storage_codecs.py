@@ -0,0 +1,119 @@
+from unittest.mock import patch
+
+import pytest
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._merger import MetricsMerger
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.codecs import CodecsFactory, JsonCodec, MsgPackCodec
+
+
+@pytest.fixture
+def record():
+    """
+    Raw metric record fixture.
+    """
+    return {"metric": "metric", "type": "count", "timestamp": 10, "value": 1}
+
+
+@pytest.mark.parametrize("codec_name", ["json", "msgpack"])
+def test_codecs_encode_and_decode_records(codec_name, record):
+    """
+    Records encoded by any codec are decoded by CodecsFactory.
+
+    GIVEN: There is a codec.
+    WHEN: A record is encoded by this codec.
+    THEN: It starts with this codec's tag.
+    AND: CodecsFactory decodes it back.
+    """
+    codec = CodecsFactory.get_codec(codec_name)
+    encoded = codec.encode(record)
+    assert encoded.startswith(codec.tag)
+    assert CodecsFactory.decode(encoded) == record
+
+
+def test_msgpack_records_are_smaller(record):
+    """
+    MessagePack records are smaller than JSON ones.
+
+    GIVEN: There is a record.
+    WHEN: It's encoded by JSON and MessagePack codecs.
+    THEN: MessagePack record is smaller.
+    """
+    json_record = JsonCodec().encode(record)
+    msgpack_record = MsgPackCodec().encode(record)
+    assert len(msgpack_record) < len(json_record)
+
+
+@pytest.mark.parametrize("value", [b"\x01\xc1", b"{not json", b""])
+def test_codecs_raise_value_error_on_invalid_records(value):
+    """
+    Invalid records raise ValueError regardless of their format.
+
+    GIVEN: There is an invalid record.
+    WHEN: CodecsFactory tries to decode it.
+    THEN: ValueError is raised.
+    """
+    with pytest.raises(ValueError):
+        CodecsFactory.decode(value)
+
+
+def test_codecs_factory_falls_back_to_json():
+    """
+    JSON codec is used if a codec is unknown or can't be created.
+
+    GIVEN: msgpack package is not installed.
+    WHEN: Unknown or msgpack codec is requested.
+    THEN: JsonCodec is returned.
+    """
+    assert isinstance(CodecsFactory.get_codec("unknown"), JsonCodec)
+    with patch("chouette_iot.storage.codecs._msgpack_codec.msgpack", None):
+        assert isinstance(CodecsFactory.get_codec("msgpack"), JsonCodec)
+
+
+def test_codecs_factory_uses_record_codec_env(monkeypatch):
+    """
+    CodecsFactory takes a default codec name from RECORD_CODEC.
+
+    GIVEN: RECORD_CODEC is 'msgpack'.
+    WHEN: A codec is requested without a name.
+    THEN: MsgPackCodec is returned.
+    """
+    monkeypatch.setenv("RECORD_CODEC", "msgpack")
+    assert isinstance(CodecsFactory.get_codec(), MsgPackCodec)
+
+
+def test_mixed_format_queue_is_merged(record):
+    """
+    A raw queue can contain records in different formats during migration.
+
+    GIVEN: There are JSON and MessagePack encoded raw metrics.
+    WHEN: They are merged by MetricsMerger.
+    THEN: They are merged into one metric.
+    """
+    records = [JsonCodec().encode(record), MsgPackCodec().encode(record)]
+    merged = MetricsMerger.merge_metrics(records, 10)
+    assert len(merged) == 1
+    assert merged[0].values == [1, 1]
+
+
+def test_storage_uses_record_codec(
+    monkeypatch, redis_cleanup, post_test_actors_stop, redis_client
+):
+    """
+    Storage engines encode records by a codec set by RECORD_CODEC.
+
+    GIVEN: RECORD_CODEC is 'msgpack'.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: Records are stored as tagged MessagePack.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", "[]")
+    monkeypatch.setenv("RECORD_CODEC", "msgpack")
+    actor_ref = StorageActor.get_instance()
+    metric = WrappedMetric(metric="a", type="gauge", value=1)
+    actor_ref.ask(msgs.StoreRecords("metrics", [metric], wrapped=True))
+    records = actor_ref.ask(msgs.CollectRecords("metrics", wrapped=True))
+    assert records[0][1].startswith(MsgPackCodec.tag)
+    assert CodecsFactory.decode(records[0][1]) == metric.asdict()
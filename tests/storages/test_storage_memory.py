@@ -0,0 +1,160 @@
+import json
+import time
+
+import pytest
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.engines import MemoryEngine
+
+
+@pytest.fixture
+def memory_env(monkeypatch):
+    """
+    Memory storage environment fixture.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "memory")
+    return monkeypatch
+
+
+@pytest.fixture
+def storage_actor_memory(memory_env):
+    """
+    Memory actor fixture.
+    """
+    actor_ref = StorageActor.get_instance()
+    yield actor_ref
+    actor_ref.stop()
+
+
+@pytest.fixture
+def metrics():
+    """
+    Wrapped metrics fixture with shuffled timestamps.
+    """
+    now = int(time.time())
+    return [
+        WrappedMetric(metric=f"metric-{i}", type="gauge", value=i, timestamp=now + i)
+        for i in (2, 0, 4, 1, 3)
+    ]
+
+
+def test_memory_stores_and_collects_records(storage_actor_memory, metrics):
+    """
+    Memory storage keeps records ordered by their timestamps.
+
+    GIVEN: There are records with timestamps in a random order.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Keys, values and records are collected from the oldest one.
+    """
+    storage = storage_actor_memory.proxy().storage.get()
+    assert isinstance(storage, MemoryEngine)
+    message = msgs.StoreRecords("metrics", metrics, wrapped=True)
+    assert storage_actor_memory.ask(message) is True
+    size = storage_actor_memory.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 5
+    ordered = sorted(metrics, key=lambda metric: metric.timestamp)
+    keys = storage_actor_memory.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert [ts for _, ts in keys] == [metric.timestamp for metric in ordered]
+    values = storage_actor_memory.ask(
+        msgs.CollectValues("metrics", [key for key, _ in keys], wrapped=True)
+    )
+    assert list(map(json.loads, values)) == [metric.asdict() for metric in ordered]
+    message = msgs.CollectRecords("metrics", wrapped=True, amount=2)
+    records = storage_actor_memory.ask(message)
+    assert [key for key, _ in records] == [key for key, _ in keys[:2]]
+
+
+def test_memory_collects_keys_by_timestamps_range(storage_actor_memory, metrics):
+    """
+    CollectKeys with since and until returns keys from [since, until).
+
+    GIVEN: There are records in a queue.
+    WHEN: CollectKeys message with a range is sent to StorageActor.
+    THEN: Only keys of records in this range are returned.
+    """
+    storage_actor_memory.ask(msgs.StoreRecords("metrics", metrics, wrapped=False))
+    since = min(metric.timestamp for metric in metrics) + 1
+    message = msgs.CollectKeys("metrics", wrapped=False, since=since, until=since + 2)
+    keys = storage_actor_memory.ask(message)
+    assert [ts for _, ts in keys] == [since, since + 1]
+
+
+def test_memory_deletes_and_cleans_records(storage_actor_memory, metrics):
+    """
+    Deleted and outdated records disappear from a queue.
+
+    GIVEN: There are actual and outdated records in a queue.
+    WHEN: DeleteRecords and CleanupOutdatedRecords messages are sent.
+    THEN: Both return True.
+    AND: Only records that were neither deleted nor outdated remain.
+    """
+    outdated = WrappedMetric(metric="a", type="b", value=1, timestamp=1)
+    records = [outdated, *metrics]
+    storage_actor_memory.ask(msgs.StoreRecords("metrics", records, wrapped=True))
+    keys = storage_actor_memory.ask(msgs.CollectKeys("metrics", wrapped=True))
+    message = msgs.DeleteRecords("metrics", [keys[1][0], keys[2][0]], wrapped=True)
+    assert storage_actor_memory.ask(message) is True
+    message = msgs.CleanupOutdatedRecords("metrics", ttl=3600, wrapped=True)
+    assert storage_actor_memory.ask(message) is True
+    remaining = storage_actor_memory.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert remaining == keys[3:]
+
+
+def test_memory_drops_oldest_records_over_cap(memory_env, metrics):
+    """
+    Queues are capped by MEMORY_QUEUE_SIZE.
+
+    GIVEN: MEMORY_QUEUE_SIZE is 3.
+    WHEN: 5 records are stored.
+    THEN: Only 3 newest records remain.
+    """
+    memory_env.setenv("MEMORY_QUEUE_SIZE", "3")
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = actor_ref.ask(msgs.CollectKeys("metrics", wrapped=True))
+    actor_ref.stop()
+    newest = sorted(metric.timestamp for metric in metrics)[-3:]
+    assert [ts for _, ts in keys] == newest
+
+
+def test_memory_snapshots_survive_restart(memory_env, tmp_path, metrics):
+    """
+    Queues are saved to a snapshot on stop and loaded from it on start.
+
+    GIVEN: MEMORY_SNAPSHOT_PATH is set.
+    AND: Records were stored and StorageActor was stopped.
+    WHEN: StorageActor is started again.
+    THEN: Stored records are collected.
+    """
+    memory_env.setenv("MEMORY_SNAPSHOT_PATH", str(tmp_path / "snapshot.json"))
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    expected = actor_ref.ask(msgs.CollectRecords("metrics", wrapped=True))
+    actor_ref.stop()
+    actor_ref = StorageActor.get_instance()
+    records = actor_ref.ask(msgs.CollectRecords("metrics", wrapped=True))
+    actor_ref.stop()
+    assert [value for _, value in records] == [value for _, value in expected]
+
+
+def test_memory_snapshots_periodically(memory_env, tmp_path, metrics):
+    """
+    Queues are saved to a snapshot when its interval has passed.
+
+    GIVEN: MEMORY_SNAPSHOT_INTERVAL is 0.
+    WHEN: Records are stored.
+    THEN: Snapshot file contains them without stopping the storage.
+    """
+    snapshot_path = tmp_path / "snapshot.json"
+    memory_env.setenv("MEMORY_SNAPSHOT_PATH", str(snapshot_path))
+    memory_env.setenv("MEMORY_SNAPSHOT_INTERVAL", "0")
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    snapshot = json.loads(snapshot_path.read_text())
+    actor_ref.stop()
+    assert len(snapshot["chouette:metrics:wrapped"]) == 5
@@ -2,6 +2,7 @@ from chouette_iot.storage.messages import (
     CleanupOutdatedRecords,
     CollectValues,
     CollectKeys,
+    CollectRecords,
     DeleteRecords,
     StoreRecords,
 )
@@ -27,6 +28,16 @@ def test_collect_keys_str_and_repr():
     assert repr(msg) == str(msg)
 
 
+def test_collect_records_str_and_repr():
+    """
+    CollectRecords:
+    __str__ and __repr__  methods return the same string.
+    """
+    msg = CollectRecords("chocolates", amount=42, wrapped=True)
+    assert str(msg) == f"<CollectRecords:chocolates:wrapped=True:amount=42>"
+    assert repr(msg) == str(msg)
+
+
 def test_collect_values_str_and_repr():
     """
     CollectValues:
@@ -222,6 +222,7 @@ def test_redis_cleans_outdated_metrics_correctly(storage_actor_redis, redis_clea
     "message",
     [
         msgs.CollectKeys("metrics", wrapped=False),
+        msgs.CollectRecords("metrics", wrapped=False),
         msgs.CollectValues("metrics", [b"key"], wrapped=True),
     ],
 )
@@ -309,3 +310,100 @@ def test_redis_returns_none_on_unexpected_message(storage_actor_redis):
     """
     execution_result = storage_actor_redis.ask("Are you bored of being so in-memory?")
     assert execution_result is None
+
+
+@pytest.mark.parametrize(
+    "since, until, amount, expected_indexes",
+    [
+        (10, 23, 0, [0, 1]),
+        (12, None, 0, [1, 2, 3, 4]),
+        (None, 31, 0, [0, 1, 2]),
+        (11, 40, 2, [1, 2]),
+    ],
+)
+def test_redis_gets_keys_by_timestamps_range(
+    storage_actor_redis, stored_raw_keys, since, until, amount, expected_indexes
+):
+    """
+    Redis returns only keys from a specified range of timestamps.
+    GIVEN: There are some keys in a corresponding set in Redis.
+    WHEN: CollectKeys message with `since` and `until` is sent to StorageActor.
+    THEN: It returns keys whose timestamps are in a range [since, until).
+    AND: Their number is limited by `amount` if it's specified.
+    """
+    message = msgs.CollectKeys(
+        "metrics", wrapped=False, amount=amount, since=since, until=until
+    )
+    collected_keys = storage_actor_redis.ask(message)
+    assert collected_keys == [stored_raw_keys[idx] for idx in expected_indexes]
+
+
+@pytest.mark.parametrize(
+    "since, until, amount, expected_indexes",
+    [
+        (None, None, 0, [0, 1, 2, 3, 4]),
+        (None, None, 2, [0, 1]),
+        (12, 34, 0, [1, 2, 3]),
+    ],
+)
+def test_redis_collects_records_correctly(
+    storage_actor_redis,
+    stored_raw_keys,
+    stored_raw_values,
+    since,
+    until,
+    amount,
+    expected_indexes,
+):
+    """
+    Redis returns a list of keys with their values on CollectRecords.
+    GIVEN: There are raw records stored in a queue.
+    WHEN: CollectRecords message is sent to StorageActor.
+    THEN: It returns a list of tuples (key, value) of the oldest records.
+    AND: They are limited by `amount`, `since` and `until` if specified.
+    """
+    message = msgs.CollectRecords(
+        "metrics", wrapped=False, amount=amount, since=since, until=until
+    )
+    collected_records = storage_actor_redis.ask(message)
+    assert collected_records == [stored_raw_values[idx] for idx in expected_indexes]
+
+
+def test_redis_collects_records_without_values(storage_actor_redis, stored_raw_keys):
+    """
+    Redis returns None as a value of records that have no values.
+    GIVEN: There are keys in a queue, but there are no values for them.
+    WHEN: CollectRecords message is sent to StorageActor.
+    THEN: It returns a list of tuples (key, None).
+    """
+    message = msgs.CollectRecords("metrics", wrapped=False)
+    collected_records = storage_actor_redis.ask(message)
+    assert collected_records == [(key, None) for key, _ in stored_raw_keys]
+
+
+def test_redis_handles_large_number_of_records(storage_actor_redis, redis_cleanup):
+    """
+    Redis Lua scripts handle more keys than they process in a single chunk.
+    GIVEN: There are 2500 outdated and 2500 actual records in a queue.
+    WHEN: CleanupOutdatedRecords message is sent to StorageActor.
+    THEN: Only actual records can be collected.
+    WHEN: All the collected records are deleted.
+    THEN: The queue is empty.
+    """
+    now = time.time()
+    metrics = [
+        WrappedMetric(metric="a", type="b", value=idx, timestamp=now - idx * 10)
+        for idx in range(5000)
+    ]
+    storage_actor_redis.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    message = msgs.CleanupOutdatedRecords("metrics", ttl=25000, wrapped=True)
+    assert storage_actor_redis.ask(message) is True
+    records = storage_actor_redis.ask(msgs.CollectRecords("metrics", wrapped=True))
+    assert len(records) == 2500
+    values = [json.loads(value)["points"][0][1] for _, value in records]
+    assert sorted(values) == list(range(2500))
+    keys = [key for key, _ in records]
+    message = msgs.DeleteRecords("metrics", keys, wrapped=True)
+    assert storage_actor_redis.ask(message) is True
+    assert storage_actor_redis.ask(msgs.GetQueueSize("metrics", wrapped=True)) == 0
+    assert not storage_actor_redis.ask(msgs.CollectKeys("metrics", wrapped=True))
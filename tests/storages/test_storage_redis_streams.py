@@ -0,0 +1,241 @@
+import json
+import time
+from unittest.mock import patch
+
+import pytest
+from redis import Redis, RedisError
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.engines import RedisStreamsEngine
+
+
+def get_redis_version(redis_client):
+    """
+    Returns a version of a Redis server as a tuple (major, minor).
+    """
+    version = redis_client.info().get("redis_version")
+    return tuple(int(part) for part in version.split(".")[:2])
+
+
+@pytest.fixture
+def storage_actor_streams(monkeypatch, redis_client, redis_cleanup):
+    """
+    Redis Streams actor fixture.
+
+    Redis Streams exist since Redis 5.0, so tests are skipped for older servers.
+    """
+    if get_redis_version(redis_client) < (5, 0):
+        pytest.skip("Redis Streams require Redis 5.0 or newer.")
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("METRICS_WRAPPER", "simple")
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "redis-streams")
+    actor_ref = StorageActor.get_instance()
+    yield actor_ref
+    actor_ref.stop()
+
+
+@pytest.fixture
+def wrapped_metrics():
+    """
+    Wrapped metrics fixture with increasing timestamps.
+    """
+    now = int(time.time())
+    return [
+        WrappedMetric(metric=f"metric-{i}", type="gauge", value=i, timestamp=now + i)
+        for i in range(5)
+    ]
+
+
+def test_streams_engine_requires_redis_5(monkeypatch):
+    """
+    RedisStreamsEngine fails fast if Redis doesn't support streams.
+
+    GIVEN: Redis version is 4.0.13.
+    WHEN: RedisStreamsEngine is created.
+    THEN: RuntimeError is raised.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    with patch.object(Redis, "info", return_value={"redis_version": "4.0.13"}):
+        with pytest.raises(RuntimeError, match="requires Redis 5.0"):
+            RedisStreamsEngine()
+
+
+def test_streams_engine_is_used(storage_actor_streams):
+    """
+    EnginesFactory returns RedisStreamsEngine for 'redis-streams' storage type.
+
+    GIVEN: CHOUETTE_STORAGE_TYPE is 'redis-streams'.
+    WHEN: StorageActor is started.
+    THEN: Its storage is a RedisStreamsEngine.
+    """
+    storage = storage_actor_streams.proxy().storage.get()
+    assert isinstance(storage, RedisStreamsEngine)
+
+
+def test_streams_store_wrapped_metrics_to_stream(
+    storage_actor_streams, wrapped_metrics, redis_client
+):
+    """
+    Wrapped metrics are stored as stream entries.
+
+    GIVEN: There are wrapped metrics to store.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Metrics are stored to a stream, not to a sorted set and a hash.
+    AND: They can be collected back in the same order.
+    """
+    message = msgs.StoreRecords("metrics", wrapped_metrics, wrapped=True)
+    assert storage_actor_streams.ask(message) is True
+    assert redis_client.xlen("chouette:metrics:wrapped.stream") == 5
+    assert not redis_client.exists("chouette:metrics:wrapped.keys")
+    assert not redis_client.exists("chouette:metrics:wrapped.values")
+    size = storage_actor_streams.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 5
+    keys = storage_actor_streams.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert [ts for _, ts in keys] == [metric.timestamp for metric in wrapped_metrics]
+    values = storage_actor_streams.ask(
+        msgs.CollectValues("metrics", [key for key, _ in keys], wrapped=True)
+    )
+    assert list(map(json.loads, values)) == [m.asdict() for m in wrapped_metrics]
+
+
+def test_streams_collect_records(storage_actor_streams, wrapped_metrics):
+    """
+    CollectRecords returns the oldest stream entries with their values.
+
+    GIVEN: There are wrapped metrics in a stream.
+    WHEN: CollectRecords message with amount 2 is sent to StorageActor.
+    THEN: Two oldest records are returned.
+    """
+    storage_actor_streams.ask(
+        msgs.StoreRecords("metrics", wrapped_metrics, wrapped=True)
+    )
+    message = msgs.CollectRecords("metrics", wrapped=True, amount=2)
+    records = storage_actor_streams.ask(message)
+    assert len(records) == 2
+    values = [json.loads(value) for _, value in records]
+    assert values == [metric.asdict() for metric in wrapped_metrics[:2]]
+
+
+def test_streams_collect_keys_by_timestamps_range(
+    storage_actor_streams, redis_client
+):
+    """
+    CollectKeys with since and until collects entries stored within a range.
+
+    GIVEN: There are entries stored every second in a stream.
+    WHEN: CollectKeys message with a range is sent to StorageActor.
+    THEN: Only keys of entries stored in [since, until) are returned.
+    WHEN: CollectKeys message with a range and an amount is sent.
+    THEN: Only the requested amount of the oldest keys is returned.
+    """
+    now = int(time.time())
+    for i in range(5):
+        redis_client.xadd(
+            "chouette:metrics:wrapped.stream",
+            {"timestamp": now + i, "value": "{}"},
+            id=f"{(now + i) * 1000}-0",
+        )
+    message = msgs.CollectKeys("metrics", wrapped=True, since=now + 1, until=now + 3)
+    keys = storage_actor_streams.ask(message)
+    assert keys == [
+        (f"{(now + 1) * 1000}-0".encode(), now + 1),
+        (f"{(now + 2) * 1000}-0".encode(), now + 2),
+    ]
+    message = msgs.CollectKeys(
+        "metrics", wrapped=True, amount=1, since=now + 1, until=now + 3
+    )
+    assert storage_actor_streams.ask(message) == keys[:1]
+
+
+def test_streams_delete_records(storage_actor_streams, wrapped_metrics):
+    """
+    DeleteRecords removes stream entries by their IDs.
+
+    GIVEN: There are wrapped metrics in a stream.
+    WHEN: DeleteRecords message with some of their keys is sent.
+    THEN: It returns True.
+    AND: Only the rest of the records remains in a stream.
+    """
+    storage_actor_streams.ask(
+        msgs.StoreRecords("metrics", wrapped_metrics, wrapped=True)
+    )
+    keys = storage_actor_streams.ask(msgs.CollectKeys("metrics", wrapped=True))
+    message = msgs.DeleteRecords("metrics", [key for key, _ in keys[:4]], wrapped=True)
+    assert storage_actor_streams.ask(message) is True
+    remaining = storage_actor_streams.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert remaining == keys[4:]
+
+
+@pytest.mark.parametrize("redis_version", ["5.0.5", "6.0.9", "6.2.0", "7.0.0"])
+def test_streams_cleanup_outdated(
+    redis_version, storage_actor_streams, wrapped_metrics, redis_client
+):
+    """
+    CleanupOutdatedRecords trims entries added before a TTL threshold.
+
+    GIVEN: There are old and new entries in a stream.
+    WHEN: CleanupOutdatedRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Only entries added within the TTL remain.
+    """
+    old_id = f"{int((time.time() - 7200) * 1000)}-0"
+    redis_client.xadd(
+        "chouette:metrics:wrapped.stream", {"timestamp": 1, "value": "{}"}, id=old_id
+    )
+    storage_actor_streams.ask(
+        msgs.StoreRecords("metrics", wrapped_metrics, wrapped=True)
+    )
+    storage = storage_actor_streams.proxy().storage.get()
+    storage.redis_version = tuple(int(part) for part in redis_version.split(".")[:2])
+    message = msgs.CleanupOutdatedRecords("metrics", ttl=3600, wrapped=True)
+    assert storage_actor_streams.ask(message) is True
+    assert redis_client.xlen("chouette:metrics:wrapped.stream") == 5
+
+
+def test_streams_keep_client_queues_layout(
+    storage_actor_streams, stored_raw_keys, stored_raw_values
+):
+    """
+    Queues written by Chouette-IoT-Client keep a sorted set and hash layout.
+
+    GIVEN: There are raw metrics stored by a client.
+    WHEN: CollectRecords message for raw metrics is sent to StorageActor.
+    THEN: Raw metrics are collected from a sorted set and a hash.
+    """
+    message = msgs.CollectRecords("metrics", wrapped=False)
+    records = storage_actor_streams.ask(message)
+    assert records == stored_raw_values
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        (msgs.CollectKeys("metrics", wrapped=True), []),
+        (msgs.CollectRecords("metrics", wrapped=True), []),
+        (msgs.CollectValues("metrics", [b"1-0"], wrapped=True), []),
+        (msgs.GetQueueSize("metrics", wrapped=True), -1),
+        (msgs.DeleteRecords("metrics", [b"1-0"], wrapped=True), False),
+        (msgs.CleanupOutdatedRecords("metrics", ttl=10, wrapped=True), False),
+        (
+            msgs.StoreRecords(
+                "metrics", [WrappedMetric(metric="a", type="b", value=1)], wrapped=True
+            ),
+            False,
+        ),
+    ],
+)
+def test_streams_handle_redis_errors(storage_actor_streams, message, expected):
+    """
+    RedisStreamsEngine handles Redis errors like RedisEngine does.
+
+    GIVEN: Redis raises an exception on every command.
+    WHEN: A message for a stream queue is sent to StorageActor.
+    THEN: An empty result or False is returned.
+    """
+    with patch.object(Redis, "execute_command", side_effect=RedisError):
+        with patch("redis.client.Pipeline.execute", side_effect=RedisError):
+            assert storage_actor_streams.ask(message) == expected
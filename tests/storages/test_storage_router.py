@@ -0,0 +1,102 @@
+from unittest.mock import patch
+
+import pytest
+from pykka import ActorRef, ThreadingFuture
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor, StorageRouter
+
+
+@pytest.fixture
+def storage_env(monkeypatch):
+    """
+    Environment of a storage with 3 workers.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", "[]")
+    monkeypatch.setenv("STORAGE_WORKERS", "3")
+    yield
+    StorageActor.router = None
+
+
+def test_storage_workers_share_redis_pool(
+    storage_env, redis_cleanup, post_test_actors_stop
+):
+    """
+    StorageActor workers share a Redis connection pool and keep ordered
+    requests of every queue on a single worker.
+
+    GIVEN: STORAGE_WORKERS is 3.
+    WHEN: StorageActor instance is requested.
+    THEN: StorageRouter with 3 workers is returned.
+    AND: Their engines share one ConnectionPool.
+    AND: Requests of the same queue are routed to the same worker.
+    AND: Different queues get different workers in turns.
+    AND: Records are stored and collected via a router.
+    """
+    router = StorageActor.get_storage()
+    assert isinstance(router, StorageRouter)
+    assert StorageActor.get_storage() is router
+    engines = [worker.proxy().storage.get() for worker in router.workers]
+    assert len({id(engine.redis.connection_pool) for engine in engines}) == 1
+    collect = msgs.CollectKeys("metrics", wrapped=True)
+    delete = msgs.DeleteRecords("metrics", [], wrapped=True)
+    cleanup = msgs.CleanupOutdatedRecords("metrics", ttl=60, wrapped=True)
+    worker = router.route(collect)
+    assert router.route(delete) is worker
+    assert router.route(cleanup) is worker
+    raw_worker = router.route(msgs.CollectKeys("metrics", wrapped=False))
+    logs_worker = router.route(msgs.CollectKeys("logs", wrapped=True))
+    assert [worker, raw_worker, logs_worker] == router.workers
+    assert router.route(msgs.CollectKeys("logs", wrapped=False)) is worker
+    metric = WrappedMetric(metric="a", type="gauge", value=1)
+    store = msgs.StoreRecords("metrics", [metric], wrapped=True)
+    assert router.ask(store) is True
+    assert len(router.ask(collect)) == 1
+
+
+def test_storage_router_stores_records_by_free_workers(
+    storage_env, redis_cleanup, post_test_actors_stop
+):
+    """
+    StoreRecords messages are routed to the least busy workers.
+
+    GIVEN: STORAGE_WORKERS is 3.
+    AND: The first worker has StoreRecords messages in flight.
+    WHEN: StoreRecords messages are routed.
+    THEN: They are routed to the other workers in turns.
+    WHEN: The first worker replies.
+    THEN: It gets StoreRecords messages again.
+    """
+    router = StorageActor.get_storage()
+    metric = WrappedMetric(metric="a", type="gauge", value=1)
+    store = msgs.StoreRecords("metrics", [metric], wrapped=True)
+    busy, *free = router.workers
+    pending = [ThreadingFuture(), ThreadingFuture()]
+    router.in_flight[busy.actor_urn].extend(pending)
+    workers = [router.route(store) for _ in range(4)]
+    assert busy not in workers
+    assert set(workers) == set(free)
+    for future in pending:
+        future.set(True)
+    assert busy in {router.route(store) for _ in range(3)}
+    assert router.ask(store) is True
+
+
+def test_storage_workers_require_concurrent_engine(
+    storage_env, monkeypatch, tmp_path, post_test_actors_stop
+):
+    """
+    Storage engines that can't be used concurrently get a single worker.
+
+    GIVEN: STORAGE_WORKERS is 3 and a storage type is sqlite.
+    WHEN: StorageActor instance is requested.
+    THEN: A single StorageActor is started.
+    """
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "chouette.sqlite3"))
+    with patch("chouette_iot.storage._storage.logger") as logger:
+        actor_ref = StorageActor.get_storage()
+    assert isinstance(actor_ref, ActorRef)
+    assert logger.warning.called
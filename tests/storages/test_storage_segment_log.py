@@ -0,0 +1,274 @@
+import json
+import os
+import time
+
+import pytest
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.engines import SegmentLogEngine
+from chouette_iot.storage.engines._segment_log_engine import Segment
+
+
+@pytest.fixture
+def segments_env(monkeypatch, tmp_path):
+    """
+    Segment Log environment fixture with small segments.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "segment-log")
+    monkeypatch.setenv("SEGMENTS_PATH", str(tmp_path))
+    monkeypatch.setenv("SEGMENT_SIZE", "1024")
+    return tmp_path
+
+
+@pytest.fixture
+def storage_actor_segments(segments_env):
+    """
+    Segment Log actor fixture.
+    """
+    actor_ref = StorageActor.get_instance()
+    yield actor_ref
+    actor_ref.stop()
+
+
+@pytest.fixture
+def metrics():
+    """
+    Wrapped metrics fixture. 30 metrics take a few 1 KiB segments.
+    """
+    now = int(time.time())
+    return [
+        WrappedMetric(metric=f"metric-{i}", type="gauge", value=i, timestamp=now + i)
+        for i in range(30)
+    ]
+
+
+def segment_files(path):
+    """
+    Returns names of segment files of the wrapped metrics queue.
+    """
+    files = os.listdir(path / "chouette.metrics.wrapped")
+    return sorted(name for name in files if name.endswith(".seg"))
+
+
+def test_segments_store_and_collect_records(
+    storage_actor_segments, segments_env, metrics
+):
+    """
+    Records are stored to a few segments and collected in the stored order.
+
+    GIVEN: There are more records than one segment can hold.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Several segment files are created.
+    AND: Keys, values and records are collected in the stored order.
+    """
+    storage = storage_actor_segments.proxy().storage.get()
+    assert isinstance(storage, SegmentLogEngine)
+    message = msgs.StoreRecords("metrics", metrics, wrapped=True)
+    assert storage_actor_segments.ask(message) is True
+    assert len(segment_files(segments_env)) > 1
+    size = storage_actor_segments.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 30
+    keys = storage_actor_segments.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert [ts for _, ts in keys] == [metric.timestamp for metric in metrics]
+    values = storage_actor_segments.ask(
+        msgs.CollectValues("metrics", [key for key, _ in keys], wrapped=True)
+    )
+    assert list(map(json.loads, values)) == [metric.asdict() for metric in metrics]
+    message = msgs.CollectRecords("metrics", wrapped=True, amount=3)
+    records = storage_actor_segments.ask(message)
+    assert [key for key, _ in records] == [key for key, _ in keys[:3]]
+    values = [json.loads(value) for _, value in records]
+    assert values == [metric.asdict() for metric in metrics[:3]]
+
+
+def test_segments_collect_keys_by_timestamps_range(storage_actor_segments, metrics):
+    """
+    CollectKeys with since and until returns keys from [since, until).
+
+    GIVEN: There are records in a queue.
+    WHEN: CollectKeys message with a range and an amount is sent.
+    THEN: Only keys of records in this range are returned.
+    """
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    since = metrics[10].timestamp
+    message = msgs.CollectKeys(
+        "metrics", wrapped=True, amount=3, since=since, until=since + 20
+    )
+    keys = storage_actor_segments.ask(message)
+    assert [ts for _, ts in keys] == [since, since + 1, since + 2]
+
+
+def test_segments_delete_records(storage_actor_segments, segments_env, metrics):
+    """
+    Deleted records are not collected and empty segments are removed.
+
+    GIVEN: There are records in several segments.
+    WHEN: DeleteRecords message with all the keys but the last one is sent.
+    THEN: It returns True.
+    AND: Only the last record can be collected.
+    AND: Only the last segment file remains.
+    """
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = storage_actor_segments.ask(msgs.CollectKeys("metrics", wrapped=True))
+    message = msgs.DeleteRecords("metrics", [key for key, _ in keys[:-1]], wrapped=True)
+    assert storage_actor_segments.ask(message) is True
+    remaining = storage_actor_segments.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert remaining == keys[-1:]
+    assert len(segment_files(segments_env)) == 1
+
+
+def test_segments_cleanup_outdated(storage_actor_segments, segments_env, metrics):
+    """
+    Segments with only outdated records are removed on cleanup.
+
+    GIVEN: There are segments with outdated records and actual records.
+    WHEN: CleanupOutdatedRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Outdated records are removed with their segments.
+    """
+    outdated = [
+        WrappedMetric(metric=f"old-{i}", type="gauge", value=i, timestamp=i + 1)
+        for i in range(30)
+    ]
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", outdated, wrapped=True))
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    segments_before = len(segment_files(segments_env))
+    message = msgs.CleanupOutdatedRecords("metrics", ttl=3600, wrapped=True)
+    assert storage_actor_segments.ask(message) is True
+    size = storage_actor_segments.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 30
+    assert len(segment_files(segments_env)) < segments_before
+
+
+def test_segments_survive_restart(segments_env, metrics):
+    """
+    Records and deletions survive a storage restart.
+
+    GIVEN: Records were stored, some of them were deleted.
+    WHEN: StorageActor is restarted.
+    THEN: Only the rest of the records is collected.
+    AND: New records are appended after them.
+    """
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = actor_ref.ask(msgs.CollectKeys("metrics", wrapped=True))
+    actor_ref.ask(msgs.DeleteRecords("metrics", [keys[0][0]], wrapped=True))
+    actor_ref.stop()
+    actor_ref = StorageActor.get_instance()
+    assert actor_ref.ask(msgs.CollectKeys("metrics", wrapped=True)) == keys[1:]
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics[:1], wrapped=True))
+    records = actor_ref.ask(msgs.CollectRecords("metrics", wrapped=True))
+    actor_ref.stop()
+    assert len(records) == 30
+    assert json.loads(records[-1][1]) == metrics[0].asdict()
+
+
+def test_segments_skip_empty_and_partial_records(segments_env, metrics):
+    """
+    Segment files that were not written completely don't break a storage.
+
+    GIVEN: There is an empty segment file.
+    AND: The last record of a segment has a header, but not a whole value.
+    WHEN: StorageActor is restarted.
+    THEN: The empty segment file is removed.
+    AND: Records before the partial one are collected.
+    AND: New records can be stored.
+    """
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics[:3], wrapped=True))
+    keys = actor_ref.ask(msgs.CollectKeys("metrics", wrapped=True))
+    actor_ref.stop()
+    directory = segments_env / "chouette.metrics.wrapped"
+    segment_path = directory / segment_files(segments_env)[0]
+    data = bytearray(segment_path.read_bytes())
+    last = int(keys[-1][0].split(b":")[1])
+    _, timestamp, _ = Segment.HEADER.unpack_from(data, last)
+    Segment.HEADER.pack_into(data, last, Segment.LIVE, timestamp, len(data))
+    segment_path.write_bytes(bytes(data))
+    (directory / f"{1:020d}.seg").write_bytes(b"")
+    actor_ref = StorageActor.get_instance()
+    records = actor_ref.ask(msgs.CollectRecords("metrics", wrapped=True))
+    assert [json.loads(value) for _, value in records] == [
+        metric.asdict() for metric in metrics[:2]
+    ]
+    assert f"{1:020d}.seg" not in segment_files(segments_env)
+    assert actor_ref.ask(msgs.StoreRecords("metrics", metrics[3:4], wrapped=True))
+    actor_ref.stop()
+
+
+def test_segments_never_reuse_ids(storage_actor_segments, segments_env, metrics):
+    """
+    Segment ids are not reused after all the segments were removed.
+
+    GIVEN: Records were stored and their keys were collected.
+    AND: All the segments were removed by a cleanup.
+    WHEN: New records are stored, also after a restart.
+    THEN: Their keys are different from the collected ones.
+    """
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = storage_actor_segments.ask(msgs.CollectKeys("metrics", wrapped=True))
+    cleanup = msgs.CleanupOutdatedRecords("metrics", ttl=-3600, wrapped=True)
+    assert storage_actor_segments.ask(cleanup) is True
+    assert not segment_files(segments_env)
+    storage_actor_segments.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    storage_actor_segments.stop()
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.CleanupOutdatedRecords("metrics", ttl=-3600, wrapped=True))
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    new_keys = actor_ref.ask(msgs.CollectKeys("metrics", wrapped=True))
+    actor_ref.stop()
+    assert len(new_keys) == len(keys)
+    assert not {key for key, _ in keys} & {key for key, _ in new_keys}
+
+
+def test_segments_store_big_records(storage_actor_segments):
+    """
+    Records bigger than a segment get a segment of their own size.
+
+    GIVEN: There is a record bigger than a segment size.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: It returns True and the record can be collected.
+    """
+    metric = WrappedMetric(metric="a" * 2048, type="gauge", value=1)
+    message = msgs.StoreRecords("metrics", [metric], wrapped=True)
+    assert storage_actor_segments.ask(message) is True
+    records = storage_actor_segments.ask(msgs.CollectRecords("metrics", wrapped=True))
+    assert json.loads(records[0][1]) == metric.asdict()
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        (msgs.CollectKeys("metrics", wrapped=True), []),
+        (msgs.CollectRecords("metrics", wrapped=True), []),
+        (msgs.CollectValues("metrics", [b"0:0"], wrapped=True), []),
+        (msgs.GetQueueSize("metrics", wrapped=True), -1),
+        (msgs.DeleteRecords("metrics", [b"0:0"], wrapped=True), False),
+        (msgs.CleanupOutdatedRecords("metrics", ttl=10, wrapped=True), False),
+        (
+            msgs.StoreRecords(
+                "metrics", [WrappedMetric(metric="a", type="b", value=1)], wrapped=True
+            ),
+            False,
+        ),
+    ],
+)
+def test_segments_handle_errors(
+    storage_actor_segments, segments_env, message, expected
+):
+    """
+    SegmentLogEngine handles file system errors.
+
+    GIVEN: Segments directory can't be created.
+    WHEN: A message is sent to StorageActor.
+    THEN: An empty result, -1 or False is returned.
+    """
+    storage = storage_actor_segments.proxy().storage.get()
+    storage.path = str(segments_env / "file")
+    (segments_env / "file").write_text("not a directory")
+    assert storage_actor_segments.ask(message) == expected
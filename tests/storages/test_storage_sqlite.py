@@ -0,0 +1,271 @@
+import json
+import sqlite3
+import time
+
+import pytest
+
+import chouette_iot.storage.messages as msgs
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.engines import SQLiteEngine
+
+
+@pytest.fixture
+def storage_actor_sqlite(monkeypatch, tmp_path):
+    """
+    SQLite actor fixture. Every test gets its own database file.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", '["chouette-iot:est:chouette-iot"]')
+    monkeypatch.setenv("METRICS_WRAPPER", "simple")
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "chouette.sqlite3"))
+    actor_ref = StorageActor.get_instance()
+    yield actor_ref
+    actor_ref.stop()
+
+
+@pytest.fixture
+def metrics():
+    """
+    Wrapped metrics fixture with timestamps in a reverse order.
+    """
+    now = int(time.time())
+    return [
+        WrappedMetric(metric=f"metric-{i}", type="gauge", value=i, timestamp=now - i)
+        for i in range(5)
+    ]
+
+
+def test_sqlite_engine_uses_wal(storage_actor_sqlite):
+    """
+    SQLiteEngine is used for 'sqlite' storage type and works in WAL mode.
+
+    GIVEN: CHOUETTE_STORAGE_TYPE is 'sqlite'.
+    WHEN: StorageActor is started.
+    THEN: Its storage is an SQLiteEngine with a WAL journal.
+    """
+    storage = storage_actor_sqlite.proxy().storage.get()
+    assert isinstance(storage, SQLiteEngine)
+    (journal_mode,) = storage.db.execute("PRAGMA journal_mode").fetchone()
+    assert journal_mode == "wal"
+
+
+def test_sqlite_stores_and_collects_records(storage_actor_sqlite, metrics):
+    """
+    SQLite stores records and collects them ordered by timestamps.
+
+    GIVEN: There are records to store.
+    WHEN: StoreRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Keys, values and records are collected from the oldest one.
+    """
+    message = msgs.StoreRecords("metrics", metrics, wrapped=True)
+    assert storage_actor_sqlite.ask(message) is True
+    size = storage_actor_sqlite.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 5
+    expected = [metric.asdict() for metric in reversed(metrics)]
+    keys = storage_actor_sqlite.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert [ts for _, ts in keys] == [m.timestamp for m in reversed(metrics)]
+    values = storage_actor_sqlite.ask(
+        msgs.CollectValues("metrics", [key for key, _ in keys], wrapped=True)
+    )
+    assert list(map(json.loads, values)) == expected
+    message = msgs.CollectRecords("metrics", wrapped=True, amount=2)
+    records = storage_actor_sqlite.ask(message)
+    assert [key for key, _ in records] == [key for key, _ in keys[:2]]
+    assert [json.loads(value) for _, value in records] == expected[:2]
+
+
+def test_sqlite_drops_wrong_records_on_storing(storage_actor_sqlite, metrics):
+    """
+    SQLite ignores records that it can't cast to dicts during storing.
+
+    GIVEN: I have a set of correct and incorrect records for storing.
+    WHEN: We send a StoreRecords message with these records.
+    THEN: It returns True.
+    AND: Only valid records are stored.
+    """
+    message = msgs.StoreRecords("metrics", ["wrong", *metrics[:2]], wrapped=True)
+    assert storage_actor_sqlite.ask(message) is True
+    size = storage_actor_sqlite.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 2
+
+
+def test_sqlite_collects_keys_by_timestamps_range(storage_actor_sqlite, metrics):
+    """
+    CollectKeys with since and until returns keys from [since, until).
+
+    GIVEN: There are records in a queue.
+    WHEN: CollectKeys message with a range is sent to StorageActor.
+    THEN: Only keys of records in this range are returned.
+    """
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", metrics, wrapped=False))
+    since = metrics[3].timestamp
+    until = metrics[1].timestamp
+    message = msgs.CollectKeys("metrics", wrapped=False, since=since, until=until)
+    keys = storage_actor_sqlite.ask(message)
+    assert [ts for _, ts in keys] == [since, since + 1]
+
+
+def test_sqlite_deletes_records(storage_actor_sqlite, metrics):
+    """
+    DeleteRecords removes records only from a specified queue.
+
+    GIVEN: There are records in raw and wrapped queues.
+    WHEN: DeleteRecords message with wrapped queue keys is sent.
+    THEN: It returns True.
+    AND: These records are deleted, other records remain.
+    """
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", metrics, wrapped=False))
+    keys = storage_actor_sqlite.ask(msgs.CollectKeys("metrics", wrapped=True))
+    message = msgs.DeleteRecords("metrics", [key for key, _ in keys[:4]], wrapped=True)
+    assert storage_actor_sqlite.ask(message) is True
+    remaining = storage_actor_sqlite.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert remaining == keys[4:]
+    size = storage_actor_sqlite.ask(msgs.GetQueueSize("metrics", wrapped=False))
+    assert size == 5
+
+
+def test_sqlite_does_not_reuse_keys(storage_actor_sqlite, metrics):
+    """
+    Keys of deleted records are never given to new records.
+
+    GIVEN: All the records of a queue were collected and deleted.
+    WHEN: New records are stored.
+    THEN: Their keys differ from keys of deleted records.
+    """
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = storage_actor_sqlite.ask(msgs.CollectKeys("metrics", wrapped=True))
+    deleted = [key for key, _ in keys]
+    storage_actor_sqlite.ask(msgs.DeleteRecords("metrics", deleted, wrapped=True))
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    keys = storage_actor_sqlite.ask(msgs.CollectKeys("metrics", wrapped=True))
+    assert len(keys) == 5
+    assert not set(deleted) & {key for key, _ in keys}
+
+
+def test_sqlite_migrates_old_table(monkeypatch, tmp_path):
+    """
+    A table without AUTOINCREMENT ids is migrated with its records.
+
+    GIVEN: There is a database with an old `records` table with a record.
+    WHEN: SQLiteEngine is created.
+    THEN: The table has AUTOINCREMENT ids.
+    AND: The record is kept with its key.
+    """
+    path = tmp_path / "chouette.sqlite3"
+    db = sqlite3.connect(str(path))
+    db.execute(
+        "CREATE TABLE records (id INTEGER PRIMARY KEY, queue TEXT NOT NULL, "
+        "timestamp REAL NOT NULL, value BLOB NOT NULL)"
+    )
+    db.execute("INSERT INTO records VALUES (7, 'queue', 1.0, x'7b7d')")
+    db.commit()
+    db.close()
+    monkeypatch.setenv("SQLITE_PATH", str(path))
+    storage = SQLiteEngine()
+    (sql,) = storage.db.execute(
+        "SELECT sql FROM sqlite_master WHERE name = 'records'"
+    ).fetchone()
+    rows = storage.db.execute("SELECT id, queue, value FROM records").fetchall()
+    storage.stop()
+    assert "AUTOINCREMENT" in sql
+    assert rows == [(7, "queue", b"{}")]
+
+
+def test_sqlite_cleans_outdated_records(storage_actor_sqlite, metrics):
+    """
+    CleanupOutdatedRecords deletes records older than TTL.
+
+    GIVEN: There are actual and outdated records in a queue.
+    WHEN: CleanupOutdatedRecords message is sent to StorageActor.
+    THEN: It returns True.
+    AND: Only actual records remain.
+    """
+    outdated = WrappedMetric(metric="a", type="b", value=1, timestamp=1)
+    records = [outdated, *metrics]
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", records, wrapped=True))
+    message = msgs.CleanupOutdatedRecords("metrics", ttl=3600, wrapped=True)
+    assert storage_actor_sqlite.ask(message) is True
+    size = storage_actor_sqlite.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 5
+
+
+def test_sqlite_handles_large_number_of_records(storage_actor_sqlite):
+    """
+    Keys are processed in chunks, so large requests don't hit SQLite limits.
+
+    GIVEN: There are 5000 records in a queue.
+    WHEN: Their values are collected and then they are deleted.
+    THEN: All the values are collected and all the records are deleted.
+    """
+    records = [
+        WrappedMetric(metric="a", type="b", value=i, timestamp=time.time())
+        for i in range(5000)
+    ]
+    storage_actor_sqlite.ask(msgs.StoreRecords("metrics", records, wrapped=True))
+    keys = [
+        key
+        for key, _ in storage_actor_sqlite.ask(
+            msgs.CollectKeys("metrics", wrapped=True)
+        )
+    ]
+    values = storage_actor_sqlite.ask(msgs.CollectValues("metrics", keys, wrapped=True))
+    assert len(values) == 5000
+    message = msgs.DeleteRecords("metrics", keys, wrapped=True)
+    assert storage_actor_sqlite.ask(message) is True
+    size = storage_actor_sqlite.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    assert size == 0
+
+
+@pytest.mark.parametrize(
+    "message, expected",
+    [
+        (msgs.CollectKeys("metrics", wrapped=True), []),
+        (msgs.CollectRecords("metrics", wrapped=True), []),
+        (msgs.CollectValues("metrics", [b"1"], wrapped=True), []),
+        (msgs.GetQueueSize("metrics", wrapped=True), -1),
+        (msgs.DeleteRecords("metrics", [b"1"], wrapped=True), False),
+        (msgs.CleanupOutdatedRecords("metrics", ttl=10, wrapped=True), False),
+        (
+            msgs.StoreRecords(
+                "metrics", [WrappedMetric(metric="a", type="b", value=1)], wrapped=True
+            ),
+            False,
+        ),
+    ],
+)
+def test_sqlite_handles_errors(storage_actor_sqlite, message, expected):
+    """
+    SQLiteEngine handles database errors.
+
+    GIVEN: Database raises an exception on every statement.
+    WHEN: A message is sent to StorageActor.
+    THEN: An empty result, -1 or False is returned.
+    """
+    storage = storage_actor_sqlite.proxy().storage.get()
+    storage.db.close()
+    assert storage_actor_sqlite.ask(message) == expected
+
+
+def test_sqlite_keeps_records_after_restart(monkeypatch, tmp_path, metrics):
+    """
+    Records survive a storage restart.
+
+    GIVEN: Records were stored and StorageActor was stopped.
+    WHEN: StorageActor is started again with the same database file.
+    THEN: Stored records are still there.
+    """
+    monkeypatch.setenv("API_KEY", "whatever")
+    monkeypatch.setenv("GLOBAL_TAGS", "[]")
+    monkeypatch.setenv("CHOUETTE_STORAGE_TYPE", "sqlite")
+    monkeypatch.setenv("SQLITE_PATH", str(tmp_path / "chouette.sqlite3"))
+    actor_ref = StorageActor.get_instance()
+    actor_ref.ask(msgs.StoreRecords("metrics", metrics, wrapped=True))
+    actor_ref.stop()
+    actor_ref = StorageActor.get_instance()
+    size = actor_ref.ask(msgs.GetQueueSize("metrics", wrapped=True))
+    actor_ref.stop()
+    assert size == 5
@@ -0,0 +1,95 @@
+import gzip
+import zlib
+from unittest.mock import patch
+
+import pytest
+
+from chouette_iot._compressors import (
+    CompressionTuner,
+    CompressorsFactory,
+    DeflateCompressor,
+    GzipCompressor,
+)
+from chouette_iot._sender import CompressedPayload
+
+
+@pytest.mark.parametrize(
+    "name, decompress",
+    [("deflate", zlib.decompress), ("gzip", gzip.decompress)],
+)
+@pytest.mark.parametrize("level", [None, 1, 9])
+def test_compressors_produce_valid_streams(name, decompress, level):
+    """
+    Payloads compressed by any compressor on any level are decompressed
+    by a standard library.
+
+    GIVEN: There is a compressor.
+    WHEN: CompressedPayload with this compressor is iterated over.
+    THEN: Its data is decompressed back to the original payload.
+    AND: Its sizes and ratio are known.
+    """
+    chunks = [b'{"series": [', b'{"metric": "a"}, ' * 100, b"]}"]
+    payload = CompressedPayload(chunks, CompressorsFactory.get_compressor(name), level)
+    compressed = b"".join(payload)
+    assert decompress(compressed) == b"".join(chunks)
+    assert payload.raw_size == len(b"".join(chunks))
+    assert payload.size == len(compressed)
+    assert payload.ratio > 1
+
+
+def test_compressors_factory_falls_back_to_deflate():
+    """
+    Deflate compressor is used if a compressor is unknown or can't be created.
+
+    GIVEN: zstandard package is not installed.
+    WHEN: Unknown or zstd compressor is requested.
+    THEN: DeflateCompressor is returned.
+    """
+    assert isinstance(CompressorsFactory.get_compressor("GZIP"), GzipCompressor)
+    assert isinstance(CompressorsFactory.get_compressor("lzma"), DeflateCompressor)
+    with patch("chouette_iot._compressors.zstandard", None):
+        assert isinstance(CompressorsFactory.get_compressor("zstd"), DeflateCompressor)
+
+
+def test_compression_tuner_picks_levels():
+    """
+    CompressionTuner picks the fastest level for a backlog and the best
+    level only while it's worth it.
+
+    GIVEN: There is a CompressionTuner.
+    WHEN: A backlog is bigger than a bulk.
+    THEN: The fastest level is picked.
+    WHEN: A backlog fits into a bulk.
+    THEN: The best level is picked.
+    WHEN: The best level is not 10% better than the fastest one.
+    THEN: The fastest level is picked.
+    """
+    tuner = CompressionTuner(DeflateCompressor())
+    assert tuner.pick(1000, 100) == 1
+    assert tuner.pick(10, 100) == 9
+    tuner.observe(1, 5.0)
+    tuner.observe(9, 5.2)
+    assert tuner.pick(10, 100) == 1
+    tuner.observe(9, 10.0)
+    assert tuner.ratios[9] == pytest.approx(6.16)
+    assert tuner.pick(10, 100) == 9
+
+
+def test_compression_tuner_probes_unused_levels():
+    """
+    CompressionTuner measures a level that isn't used from time to time.
+
+    GIVEN: The best level was not 10% better than the fastest one.
+    WHEN: Levels are picked PROBE_INTERVAL times without a backlog.
+    THEN: The best level is picked once to measure it again.
+    WHEN: It turns out to be much better now.
+    THEN: The best level is picked.
+    """
+    tuner = CompressionTuner(DeflateCompressor())
+    tuner.observe(1, 5.0)
+    tuner.observe(9, 5.2)
+    levels = [tuner.pick(10, 100) for _ in range(CompressionTuner.PROBE_INTERVAL)]
+    assert levels == [1] * (CompressionTuner.PROBE_INTERVAL - 1) + [9]
+    for _ in range(5):
+        tuner.observe(9, 10.0)
+    assert tuner.pick(10, 100) == 9
@@ -0,0 +1,107 @@
+import os
+import time
+from unittest.mock import patch
+
+from chouette_iot._outbox import Outbox
+
+
+def test_outbox_returns_payloads_in_fifo_order(tmp_path):
+    """
+    Outbox keeps payloads as files in the order they were written.
+
+    GIVEN: There is an outbox.
+    WHEN: Payloads are written to it.
+    THEN: They are returned from the oldest to the newest.
+    AND: Removed payloads are not returned.
+    """
+    outbox = Outbox(str(tmp_path / "metrics"), 1024)
+    for number in range(3):
+        assert outbox.put([b"payload-", str(number).encode()])
+    payloads = outbox.payloads()
+    contents = [open(file_path, "rb").read() for file_path in payloads]
+    assert contents == [b"payload-0", b"payload-1", b"payload-2"]
+    outbox.remove(payloads[0])
+    assert outbox.payloads() == payloads[1:]
+
+
+def test_outbox_evicts_oldest_payloads_over_size(tmp_path):
+    """
+    Outbox drops the oldest payloads when it exceeds its size.
+
+    GIVEN: There is an outbox with a maximum size of 25 bytes.
+    WHEN: 3 payloads of 10 bytes are written to it.
+    THEN: Only 2 newest payloads remain.
+    """
+    outbox = Outbox(str(tmp_path), 25)
+    for number in range(3):
+        outbox.put([b"payload-%02d" % number])
+    contents = [open(file_path, "rb").read() for file_path in outbox.payloads()]
+    assert contents == [b"payload-01", b"payload-02"]
+
+
+def test_outbox_evicts_outdated_payloads(tmp_path):
+    """
+    Outbox drops payloads that are older than a TTL.
+
+    GIVEN: There is a payload written an hour ago and a new payload.
+    WHEN: Outdated payloads are evicted with a TTL of 10 minutes.
+    THEN: Only the new payload remains.
+    """
+    outbox = Outbox(str(tmp_path), 1024)
+    with patch("time.time", return_value=time.time() - 3600):
+        outbox.put([b"old"])
+    outbox.put([b"new"])
+    assert outbox.evict_outdated(600) == 1
+    assert [open(path, "rb").read() for path in outbox.payloads()] == [b"new"]
+
+
+def test_outbox_evicts_payloads_by_oldest_records(tmp_path):
+    """
+    Outbox drops payloads which oldest records are older than a TTL.
+
+    GIVEN: There are new payloads with records of an hour ago and of now.
+    AND: There is a payload written an hour ago without a records timestamp.
+    WHEN: Outdated payloads are evicted with a TTL of 10 minutes.
+    THEN: Only the payload with new records remains.
+    """
+    outbox = Outbox(str(tmp_path), 1024)
+    outbox.put([b"old records"], oldest=time.time() - 3600)
+    outbox.put([b"new records"], oldest=time.time())
+    written = int((time.time() - 3600) * 10 ** 9)
+    (tmp_path / f"{written:020d}-000000.deflate.payload").write_bytes(b"legacy")
+    assert outbox.evict_outdated(600) == 2
+    assert [open(path, "rb").read() for path in outbox.payloads()] == [b"new records"]
+
+
+def test_outbox_ignores_unfinished_payloads(tmp_path):
+    """
+    Payloads that weren't written completely are not returned.
+
+    GIVEN: Writing of a payload fails in the middle.
+    WHEN: Outbox payloads are requested.
+    THEN: Nothing is returned and no temporary files remain.
+    """
+
+    def failing_payload():
+        yield b"chunk"
+        raise OSError("No space left on device")
+
+    outbox = Outbox(str(tmp_path), 1024)
+    assert outbox.put(failing_payload()) is False
+    assert outbox.payloads() == []
+    assert os.listdir(tmp_path) == []
+
+
+def test_outbox_keeps_payload_encoding(tmp_path):
+    """
+    Outbox remembers Content-Encoding of its payloads.
+
+    GIVEN: There is an outbox.
+    WHEN: Payloads with different encodings are written to it.
+    THEN: Their encodings are read back from their files.
+    """
+    outbox = Outbox(str(tmp_path), 1024)
+    outbox.put([b"deflated"])
+    outbox.put([b"gzipped"], "gzip")
+    encodings = [outbox.get_encoding(path) for path in outbox.payloads()]
+    assert encodings == ["deflate", "gzip"]
@@ -0,0 +1,127 @@
+from threading import current_thread
+from unittest.mock import patch
+
+import pytest
+from pykka import ActorDeadError, ActorRegistry
+
+from chouette_iot._runtime import AsyncioRuntime
+from chouette_iot._singleton_actor import SingletonActor
+from chouette_iot.metrics import MetricsSender
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage import StorageActor
+from chouette_iot.storage.messages import CollectKeys, StoreRecords
+
+
+@pytest.fixture
+def asyncio_runtime():
+    """
+    Sets an AsyncioRuntime for all the actors started by a test.
+    """
+    runtime = AsyncioRuntime(workers=2)
+    SingletonActor.runtime = runtime
+    yield runtime
+    ActorRegistry.stop_all()
+    SingletonActor.runtime = None
+
+
+def test_runtime_runs_actors_on_shared_workers(asyncio_runtime, test_actor_class):
+    """
+    Actors of an asyncio runtime are executed by shared workers.
+
+    GIVEN: There is an asyncio runtime.
+    WHEN: An actor is started, told and asked.
+    THEN: It processes messages in order.
+    AND: It's executed by a shared worker thread, not by its own thread.
+    AND: The event loop thread exits when the actor is stopped.
+    """
+
+    class ThreadActor(test_actor_class):
+        """
+        Actor that reports a thread it's executed by.
+        """
+
+        def on_receive(self, message):
+            if message == "thread":
+                return current_thread().name
+            return super().on_receive(message)
+
+    actor_ref = ThreadActor.start()
+    actor_ref.tell("first")
+    actor_ref.tell("second")
+    messages = actor_ref.ask("messages")
+    thread_name = actor_ref.ask("thread")
+    loop_thread = asyncio_runtime.thread
+    actor_ref.stop()
+    loop_thread.join(1)
+    assert messages == ["first", "second"]
+    assert thread_name.startswith("chouette-worker")
+    assert not loop_thread.is_alive()
+    with pytest.raises(ActorDeadError):
+        actor_ref.tell("third")
+
+
+def test_runtime_stops_failed_actor(asyncio_runtime):
+    """
+    Actor of an asyncio runtime stops on an exception like a pykka actor.
+
+    GIVEN: There is an actor that fails on a message.
+    WHEN: It's asked with this message.
+    THEN: Exception is returned to a caller and the actor keeps working.
+    WHEN: It's told this message.
+    THEN: It's stopped.
+    """
+
+    class FailingActor(SingletonActor):
+        """
+        Actor that fails on any message except "ping".
+        """
+
+        def on_receive(self, message):
+            if message == "ping":
+                return "pong"
+            raise ValueError(message)
+
+    actor_ref = FailingActor.start()
+    with pytest.raises(ValueError):
+        actor_ref.ask("fail")
+    assert actor_ref.ask("ping") == "pong"
+    actor_ref.tell("fail")
+    asyncio_runtime.thread.join(1)
+    assert not actor_ref.is_alive()
+
+
+def test_runtime_dispatches_metrics(
+    asyncio_runtime, mocked_http, redis_cleanup, monkeypatch
+):
+    """
+    Senders and storage work in an asyncio runtime like in a threading one.
+
+    GIVEN: There is an asyncio runtime and metrics in a storage.
+    WHEN: MetricsSender is asked to dispatch them.
+    THEN: It asks StorageActor and dispatches metrics successfully.
+    AND: Metrics are removed from a storage.
+    """
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    storage = StorageActor.get_instance()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    result = MetricsSender.get_instance().ask("dispatch")
+    keys = storage.ask(CollectKeys("metrics", wrapped=True))
+    assert result is True
+    assert keys == []
+
+
+@pytest.mark.parametrize(
+    "version, supported",
+    [("3.1.1", False), ("4.0.0", True), ("4.5", True), ("5.0", False)],
+)
+def test_runtime_supports_tested_pykka_versions(version, supported):
+    """
+    Asyncio runtime is used only with pykka versions it was tested with.
+
+    GIVEN: There is an installed pykka version.
+    WHEN: Asyncio runtime support is checked.
+    THEN: Only pykka 4 is supported.
+    """
+    with patch("chouette_iot._runtime.metadata.version", return_value=version):
+        assert AsyncioRuntime.is_supported() is supported
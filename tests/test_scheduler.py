@@ -1,4 +1,4 @@
-from threading import Timer
+from threading import Timer, current_thread
 from time import sleep
 
 import pytest
@@ -226,3 +226,26 @@ def test_stop_all_cancellables():
     assert timer2.is_cancelled()
     assert timer1 not in Scheduler.timers
     assert timer2 not in Scheduler.timers
+
+
+def test_scheduler_uses_a_single_thread(periodic_job_method):
+    """
+    All the scheduled jobs are executed by one dispatcher thread.
+
+    GIVEN: There are several periodic jobs and a job scheduled once.
+    WHEN: They are executed a few times.
+    THEN: All of them are executed by the same thread.
+    """
+    threads = []
+
+    def record_thread():
+        threads.append(current_thread())
+
+    cancellables = [periodic_job_method(0.05, 0.05, record_thread) for _ in range(3)]
+    cancellables.append(Scheduler.schedule_once(0.05, record_thread))
+    sleep(0.17)
+    for cancellable in cancellables:
+        cancellable.cancel()
+    assert len(threads) >= 7
+    assert {thread.name for thread in threads} == {"chouette-scheduler"}
+
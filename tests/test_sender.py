@@ -0,0 +1,516 @@
+import gzip
+import json
+from http.client import RemoteDisconnected
+import os
+import time
+import zlib
+from unittest.mock import patch
+
+import pytest
+from pykka import ActorRegistry
+from requests.exceptions import ConnectionError
+from urllib3.exceptions import ProtocolError
+
+from chouette_iot._compressors import DeflateCompressor, ZstdCompressor
+from chouette_iot._sender import BulkSizer, CircuitBreaker, CompressedPayload, Sender
+from chouette_iot.metrics import MetricsSender
+from chouette_iot.metrics._metrics import WrappedMetric
+from chouette_iot.storage.messages import CollectKeys, StoreRecords
+
+
+def test_compressed_payload_compresses_chunks():
+    """
+    CompressedPayload yields a zlib stream of all its chunks.
+
+    GIVEN: There is a generator of payload chunks.
+    WHEN: CompressedPayload is iterated over.
+    THEN: Joined compressed chunks decompress to the joined payload.
+    AND: Its size is the size of the compressed message.
+    """
+    chunks = [b"chunk-%d " % number * 100 for number in range(1000)]
+    payload = CompressedPayload(chunk for chunk in chunks)
+    compressed = b"".join(payload)
+    assert zlib.decompress(compressed) == b"".join(chunks)
+    assert payload.size == len(compressed)
+
+
+def test_compressed_payload_of_no_chunks():
+    """
+    CompressedPayload of an empty payload is a valid zlib stream.
+
+    GIVEN: There are no chunks.
+    WHEN: CompressedPayload is iterated over.
+    THEN: It decompresses to an empty payload.
+    """
+    assert zlib.decompress(b"".join(CompressedPayload([]))) == b""
+
+
+def test_sender_sessions_are_shared_by_host():
+    """
+    Senders reuse one HTTP session per Datadog host.
+
+    GIVEN: There are URLs of the same and of different hosts.
+    WHEN: Sessions for them are requested.
+    THEN: URLs of the same host get the same session.
+    AND: URLs of different hosts get different sessions.
+    """
+    series_session = Sender.get_session("https://dd.mock/api/v1/series")
+    input_session = Sender.get_session("https://dd.mock/v1/input")
+    other_session = Sender.get_session("https://logs.dd.mock/v1/input")
+    assert series_session is input_session
+    assert series_session is not other_session
+    adapter = series_session.get_adapter("https://dd.mock/api/v1/series")
+    assert adapter._pool_maxsize == Sender.POOL_MAXSIZE
+    assert adapter.max_retries.read == 0
+
+
+def test_sender_resets_session_on_connection_error(
+    mocked_http, requests_mock, post_test_actors_stop
+):
+    """
+    A session with stale connections is replaced after a connection error.
+
+    GIVEN: Datadog host drops connections.
+    WHEN: MetricsSender tries to dispatch a message.
+    THEN: No records are accepted.
+    AND: The next dispatch uses a new session.
+    """
+    requests_mock.register_uri("POST", "/v1/series", exc=ConnectionError)
+    sender = MetricsSender.get_instance()
+    session = Sender.get_session(mocked_http)
+    result = sender.proxy().dispatch_to_datadog([b"{}"]).get()
+    assert result == 0
+    assert Sender.get_session(mocked_http) is not session
+
+
+def test_sender_retries_once_on_dropped_connection(
+    mocked_http, requests_mock, post_test_actors_stop
+):
+    """
+    A message is sent once again if a reused connection was closed.
+
+    GIVEN: Datadog host closes a keep-alive connection once.
+    WHEN: MetricsSender dispatches a message.
+    THEN: The message is sent once again via a new session and accepted.
+    """
+    dropped = ConnectionError(
+        ProtocolError("Connection aborted.", RemoteDisconnected("closed"))
+    )
+    requests_mock.register_uri(
+        "POST", "/v1/series", [{"exc": dropped}, {"status_code": 202}]
+    )
+    sender = MetricsSender.get_instance()
+    session = Sender.get_session(mocked_http)
+    result = sender.proxy().dispatch_to_datadog([b"{}"]).get()
+    assert result == 1
+    assert requests_mock.call_count == 2
+    assert Sender.get_session(mocked_http) is not session
+    body = b"".join(requests_mock.last_request.body)
+    assert json.loads(zlib.decompress(body)) == {"series": [{}]}
+
+
+def test_sender_does_not_close_used_session_on_reset():
+    """
+    A session that is being used is closed by its last user.
+
+    GIVEN: A session is acquired by a request.
+    WHEN: The session is reset.
+    THEN: It's not closed until the request releases it.
+    """
+    url = "https://reset.example.com/api"
+    session = Sender.acquire_session(url)
+    with patch.object(session, "close") as close:
+        Sender.reset_session(url)
+        assert not close.called
+        assert Sender.get_session(url) is not session
+        Sender.release_session(session)
+        assert close.call_count == 1
+
+
+def test_bulk_sizer_halves_on_failures_and_slow_dispatches():
+    """
+    BulkSizer decreases a bulk size multiplicatively.
+
+    GIVEN: There is a BulkSizer with sizes from 100 to 1000.
+    WHEN: A dispatch fails or takes longer than a target latency.
+    THEN: A bulk size is halved, but not below its minimum.
+    """
+    sizer = BulkSizer(100, 1000, target_latency=10)
+    assert sizer.update(False, 1, 1000) == 500
+    assert sizer.update(True, 20, 500) == 250
+    assert sizer.update(False, 1, 250) == 125
+    assert sizer.update(False, 1, 125) == 100
+
+
+def test_bulk_sizer_grows_additively_within_throughput():
+    """
+    BulkSizer increases a bulk size additively after fast full bulks.
+
+    GIVEN: There is a BulkSizer with a bulk size of 100.
+    WHEN: Full bulks are dispatched fast, not full bulks are dispatched.
+    THEN: A bulk size grows by 1/20 of a range on full bulks only.
+    AND: It doesn't exceed what can be dispatched in a target latency.
+    AND: It doesn't exceed its maximum.
+    """
+    sizer = BulkSizer(100, 1000, target_latency=10)
+    sizer.size = 100
+    assert sizer.update(True, 1, 100) == 145
+    assert sizer.update(True, 1, 50) == 145
+    assert sizer.update(True, 9.5, 145) == 152
+    sizer.size = 990
+    assert sizer.update(True, 0, 990) == 1000
+
+
+def test_sender_adapts_bulk_size(
+    monkeypatch, mocked_http, redis_cleanup, post_test_actors_stop
+):
+    """
+    Sender with ADAPTIVE_BULK_SIZE halves its bulk size on dispatch problems.
+
+    GIVEN: ADAPTIVE_BULK_SIZE is enabled and METRICS_BULK_SIZE is 3.
+    AND: Datadog rejects requests.
+    WHEN: MetricsSender processes a bulk.
+    THEN: Its bulk size becomes 1.
+    AND: It's sent as a self metric.
+    """
+    monkeypatch.setenv("ADAPTIVE_BULK_SIZE", "true")
+    monkeypatch.setenv("MIN_BULK_SIZE", "1")
+    monkeypatch.setenv("API_KEY", "authfail")
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    with patch("chouette_iot._sender.ChouetteClient.gauge") as gauge:
+        assert sender.ask("dispatch") is False
+    assert sender.proxy().bulk_size.get() == 1
+    gauge.assert_any_call("chouette.bulk_size.metrics", 1)
+
+
+def test_circuit_breaker_backs_off_exponentially():
+    """
+    CircuitBreaker opens after consecutive failures and doubles its backoff.
+
+    GIVEN: There is a CircuitBreaker with a backoff of 60 seconds.
+    WHEN: Dispatches fail one by one.
+    THEN: It opens after 2 failures for 60 seconds.
+    AND: Every next failure doubles a backoff up to its maximum.
+    AND: A success closes it.
+    """
+    breaker = CircuitBreaker(60, 200)
+    breaker.record(False)
+    assert not breaker.is_open()
+    breaker.record(False)
+    assert breaker.is_open()
+    assert breaker.opened_till == pytest.approx(time.time() + 60, abs=1)
+    breaker.record(False)
+    assert breaker.opened_till == pytest.approx(time.time() + 120, abs=1)
+    breaker.record(False)
+    assert breaker.opened_till == pytest.approx(time.time() + 200, abs=1)
+    breaker.record(True)
+    assert not breaker.is_open()
+
+
+def test_sender_skips_collecting_while_circuit_is_open(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup, post_test_actors_stop
+):
+    """
+    Sender doesn't collect and dispatch data while its circuit is open.
+
+    GIVEN: CIRCUIT_BREAKER is enabled and Datadog rejects requests.
+    WHEN: MetricsSender fails twice and receives a message again.
+    THEN: It returns False without sending anything.
+    AND: After a backoff it sends an empty probe first.
+    """
+    monkeypatch.setenv("CIRCUIT_BREAKER", "true")
+    monkeypatch.setenv("API_KEY", "authfail")
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is False
+    assert sender.ask("dispatch") is False
+    assert requests_mock.call_count == 2
+    with patch.object(Sender, "collect_keys_and_records") as collect:
+        assert sender.ask("dispatch") is False
+        assert requests_mock.call_count == 2
+        sender.proxy().circuit_breaker.get().opened_till = 0
+        assert sender.ask("dispatch") is False
+    assert not collect.called
+    assert requests_mock.call_count == 3
+    probe = zlib.decompress(b"".join(requests_mock.last_request.body))
+    assert probe == b'{"series": []}'
+
+
+def test_sender_moves_failed_bulks_to_outbox(
+    monkeypatch,
+    tmp_path,
+    mocked_http,
+    requests_mock,
+    redis_cleanup,
+    post_test_actors_stop,
+):
+    """
+    Bulks that weren't accepted are moved to an outbox and dispatched
+    from it before any new data.
+
+    GIVEN: OUTBOX_PATH is set and Datadog rejects requests.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns False.
+    AND: Metrics are moved from a storage to an outbox.
+    WHEN: Datadog accepts requests again.
+    THEN: The same compressed payload is dispatched from an outbox.
+    AND: The outbox is empty.
+    """
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path))
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    requests_mock.register_uri("POST", "/v1/series", status_code=500)
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is False
+    assert not storage.ask(CollectKeys("metrics", wrapped=True))
+    payloads = os.listdir(tmp_path / "metrics")
+    assert len(payloads) == 1
+    stored_payload = (tmp_path / "metrics" / payloads[0]).read_bytes()
+    posted = []
+
+    def accept(request, context):
+        posted.append(request.body.read())
+        context.status_code = 202
+        return ""
+
+    requests_mock.register_uri("POST", "/v1/series", text=accept)
+    result = sender.ask("dispatch")
+    ActorRegistry.stop_all()
+    assert result is True
+    assert posted == [stored_payload]
+    series = json.loads(zlib.decompress(stored_payload))["series"]
+    assert [metric["metric"] for metric in series] == ["m-0", "m-1", "m-2"]
+    assert not os.listdir(tmp_path / "metrics")
+
+
+def test_sender_does_not_recompress_failed_payloads(
+    monkeypatch,
+    tmp_path,
+    mocked_http,
+    requests_mock,
+    redis_cleanup,
+    post_test_actors_stop,
+):
+    """
+    A payload that wasn't accepted is moved to an outbox as it was sent.
+
+    GIVEN: OUTBOX_PATH is set and Datadog rejects requests.
+    WHEN: MetricsSender receives a message.
+    THEN: Metrics are compressed only once.
+    AND: The outbox payload is the same as the posted one.
+    """
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path))
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    posted = []
+
+    def reject(request, context):
+        posted.append(b"".join(request.body))
+        context.status_code = 500
+        return ""
+
+    requests_mock.register_uri("POST", "/v1/series", text=reject)
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    with patch.object(
+        MetricsSender, "compress", autospec=True, side_effect=MetricsSender.compress
+    ) as compress:
+        result = sender.ask("dispatch")
+    ActorRegistry.stop_all()
+    assert result is False
+    assert compress.call_count == 1
+    payloads = os.listdir(tmp_path / "metrics")
+    assert len(payloads) == 1
+    assert posted == [(tmp_path / "metrics" / payloads[0]).read_bytes()]
+
+
+@pytest.mark.parametrize("status_code", [400, 413])
+def test_sender_drops_permanently_rejected_payloads(
+    monkeypatch,
+    status_code,
+    tmp_path,
+    mocked_http,
+    requests_mock,
+    redis_cleanup,
+    post_test_actors_stop,
+):
+    """
+    Payloads that Datadog rejects permanently don't block new dispatches.
+
+    GIVEN: OUTBOX_PATH is set and there is a payload in an outbox.
+    AND: Datadog rejects it with a 4xx status, but accepts new payloads.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns True.
+    AND: The rejected payload is dropped and new metrics are dispatched.
+    WHEN: Datadog rejects new metrics with a 4xx status too.
+    THEN: They are dropped instead of being moved to an outbox.
+    """
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path))
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    requests_mock.register_uri(
+        "POST", "/v1/series", [{"status_code": status_code}, {"status_code": 202}]
+    )
+    sender = MetricsSender.get_instance()
+    outbox_path = tmp_path / "metrics"
+    outbox_path.mkdir()
+    written = int(time.time() * 10 ** 9)
+    (outbox_path / f"{written:020d}-000000.deflate.payload").write_bytes(
+        zlib.compress(b'{"series": []}')
+    )
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is True
+    assert requests_mock.call_count == 2
+    assert not os.listdir(outbox_path)
+    assert not storage.ask(CollectKeys("metrics", wrapped=True))
+    requests_mock.register_uri("POST", "/v1/series", status_code=status_code)
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is True
+    assert not os.listdir(outbox_path)
+    assert not storage.ask(CollectKeys("metrics", wrapped=True))
+
+
+def test_sender_marks_spilled_payloads_by_oldest_records(
+    monkeypatch,
+    tmp_path,
+    mocked_http,
+    requests_mock,
+    redis_cleanup,
+    post_test_actors_stop,
+):
+    """
+    Payloads in an outbox are evicted by a timestamp of their records.
+
+    GIVEN: OUTBOX_PATH is set and Datadog is overloaded.
+    AND: There are metrics of 50 minutes ago in a storage.
+    WHEN: MetricsSender receives a message.
+    THEN: Metrics are moved to an outbox marked by their timestamp.
+    AND: They are evicted by a TTL of 30 minutes.
+    """
+    monkeypatch.setenv("OUTBOX_PATH", str(tmp_path))
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    requests_mock.register_uri("POST", "/v1/series", status_code=429)
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    timestamp = int(time.time()) - 3000
+    metrics = [
+        WrappedMetric(metric=f"m-{i}", type="gauge", value=i, timestamp=timestamp)
+        for i in range(3)
+    ]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is False
+    outbox = sender.proxy().outbox.get()
+    payloads = outbox.payloads()
+    assert len(payloads) == 1
+    assert outbox.get_oldest_timestamp(payloads[0]) == timestamp
+    assert outbox.evict_outdated(1800) == 1
+
+
+@pytest.mark.parametrize("concurrency", ["1", "2"])
+def test_sender_keeps_only_rejected_parts_of_a_bulk(
+    monkeypatch,
+    concurrency,
+    mocked_http,
+    requests_mock,
+    redis_cleanup,
+    post_test_actors_stop,
+):
+    """
+    Records of a bulk part that was accepted are not dispatched again.
+
+    GIVEN: METRICS_PAYLOAD_SIZE splits a bulk of 4 metrics into 2 requests.
+    AND: Datadog accepts the first request and rejects the second one.
+    WHEN: MetricsSender receives a message.
+    THEN: It returns False.
+    AND: Only metrics of the rejected request are left in a storage.
+    WHEN: Datadog accepts requests again.
+    THEN: Only these metrics are dispatched.
+    """
+    monkeypatch.setenv("METRICS_BULK_SIZE", "4")
+    monkeypatch.setenv("METRICS_PAYLOAD_SIZE", "200")
+    monkeypatch.setenv("DRAIN_MODE", "true")
+    monkeypatch.setenv("DISPATCH_CONCURRENCY", concurrency)
+    monkeypatch.setenv("SEND_SELF_METRICS", "false")
+    requests_mock.register_uri(
+        "POST", "/v1/series", [{"status_code": 202}, {"status_code": 500}]
+    )
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    now = int(time.time())
+    metrics = [
+        WrappedMetric(metric=f"m-{i}", type="gauge", value=i, timestamp=now + i)
+        for i in range(4)
+    ]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    assert sender.ask("dispatch") is False
+    assert requests_mock.call_count == 2
+    assert len(storage.ask(CollectKeys("metrics", wrapped=True))) == 2
+    requests_mock.register_uri("POST", "/v1/series", status_code=202)
+    result = sender.ask("dispatch")
+    ActorRegistry.stop_all()
+    assert result is True
+    series = json.loads(zlib.decompress(b"".join(requests_mock.last_request.body)))
+    assert [metric["metric"] for metric in series["series"]] == ["m-2", "m-3"]
+
+
+def test_sender_uses_configured_compression(
+    monkeypatch, mocked_http, requests_mock, redis_cleanup, post_test_actors_stop
+):
+    """
+    Payloads are compressed by a configured codec on an automatic level.
+
+    GIVEN: COMPRESSION is gzip and COMPRESSION_LEVEL is auto.
+    WHEN: MetricsSender dispatches a backlog that fits into a bulk.
+    THEN: A payload is sent with a gzip Content-Encoding.
+    AND: It's compressed on the best level.
+    AND: Compression ratio and time are sent as self metrics.
+    """
+    monkeypatch.setenv("COMPRESSION", "gzip")
+    monkeypatch.setenv("COMPRESSION_LEVEL", "auto")
+    sender = MetricsSender.get_instance()
+    storage = sender.proxy().storage.get()
+    metrics = [WrappedMetric(metric=f"m-{i}", type="gauge", value=i) for i in range(3)]
+    storage.ask(StoreRecords("metrics", metrics, wrapped=True))
+    with patch("chouette_iot._sender.ChouetteClient.gauge") as gauge:
+        result = sender.ask("dispatch")
+    level = sender.proxy().compression_level.get()
+    ratios = sender.proxy().compression_tuner.get().ratios
+    ActorRegistry.stop_all()
+    assert result is True
+    request = requests_mock.last_request
+    assert request.headers["Content-Encoding"] == "gzip"
+    series = json.loads(gzip.decompress(b"".join(request.body)))["series"]
+    assert len(series) == 3
+    assert level == 9
+    assert list(ratios) == [9]
+    metric_names = [call[0][0] for call in gauge.call_args_list]
+    assert "chouette.compression.metrics.ratio" in metric_names
+    assert "chouette.compression.metrics.seconds" in metric_names
+
+
+def test_sender_uses_deflate_for_unsupported_encodings(
+    monkeypatch, mocked_http, post_test_actors_stop
+):
+    """
+    Senders don't use codecs that their endpoints don't accept.
+
+    GIVEN: COMPRESSION is zstd and its package is installed.
+    WHEN: MetricsSender is started.
+    THEN: It compresses payloads with deflate.
+    """
+    monkeypatch.setenv("COMPRESSION", "zstd")
+    with patch.object(ZstdCompressor, "__init__", return_value=None):
+        sender = MetricsSender.get_instance()
+        compressor = sender.proxy().compressor.get()
+    ActorRegistry.stop_all()
+    assert isinstance(compressor, DeflateCompressor)
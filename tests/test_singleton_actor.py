@@ -0,0 +1,99 @@
+from threading import Event, current_thread
+from unittest.mock import patch
+
+import pytest
+
+from chouette_iot._singleton_actor import SingletonActor
+
+
+@pytest.fixture
+def busy_actor_class():
+    """
+    Actor class that is busy with "work" until its `release` event is set.
+    """
+
+    class BusyActor(SingletonActor):
+        """
+        Actor that is busy with "work" until it's released.
+        """
+
+        release = Event()
+
+        def __init__(self):
+            super().__init__()
+            self.processed = 0
+
+        def on_receive(self, message):
+            if message == "count":
+                return self.processed
+            self.release.wait(1)
+            self.processed += 1
+            return None
+
+    return BusyActor
+
+
+def test_ticks_are_coalesced_while_actor_is_busy(busy_actor_class):
+    """
+    A periodic message is not sent while an identical one is in progress.
+
+    GIVEN: An actor is busy with a periodic message.
+    WHEN: The same message is ticked again.
+    THEN: It's not sent and skipped ticks are counted and sent as self metrics
+          by a thread that is not the ticking one.
+    WHEN: The actor finished its job.
+    THEN: The next tick is sent again.
+    """
+    threads = []
+
+    def record_thread(*_args, **_kwargs):
+        threads.append(current_thread())
+
+    actor_ref = busy_actor_class.start()
+    ticks = SingletonActor.tick_states[actor_ref.actor_urn]
+    try:
+        assert SingletonActor.tick(actor_ref, "work") is True
+        with patch(
+            "chouette_iot._singleton_actor.ChouetteClient.count",
+            side_effect=record_thread,
+        ) as count:
+            assert SingletonActor.tick(actor_ref, "work", True) is False
+            assert SingletonActor.tick(actor_ref, "work") is False
+            SingletonActor.self_metrics.submit(lambda: None).result()
+        busy_actor_class.release.set()
+        first_count = actor_ref.ask("count")
+        assert SingletonActor.tick(actor_ref, "work") is True
+        second_count = actor_ref.ask("count")
+    finally:
+        actor_ref.stop()
+    assert first_count == 1
+    assert second_count == 2
+    assert ticks.skipped == 2
+    count.assert_called_once_with(
+        "chouette.skipped_ticks", 1, tags={"actor": "BusyActor"}
+    )
+    assert threads and threads[0] is not current_thread()
+
+
+def test_ticks_are_coalesced_per_actor(busy_actor_class):
+    """
+    Every actor has its own coalescing state.
+
+    GIVEN: One actor is busy with a periodic message.
+    WHEN: The same message is ticked to another actor.
+    THEN: It's sent.
+    WHEN: Actors are stopped.
+    THEN: Their coalescing states are forgotten.
+    """
+    first_ref = busy_actor_class.start()
+    second_ref = busy_actor_class.start()
+    try:
+        assert SingletonActor.tick(first_ref, "work") is True
+        assert SingletonActor.tick(first_ref, "work") is False
+        assert SingletonActor.tick(second_ref, "work") is True
+    finally:
+        busy_actor_class.release.set()
+        first_ref.stop()
+        second_ref.stop()
+    assert first_ref.actor_urn not in SingletonActor.tick_states
+    assert second_ref.actor_urn not in SingletonActor.tick_states